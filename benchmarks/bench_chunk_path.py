@@ -0,0 +1,130 @@
+"""
+Benchmark of ``simfleet.utils.routing.chunk_path``.
+
+Compares the vectorized implementation with the previous one (a Python loop that computes a geodesic
+distance per generated point) on real OSRM geometries. The routes are read from a route cache file
+(``route_cache_file``) when one is given, or requested to the OSRM server between random points
+around a city.
+
+Usage::
+
+    $ python benchmarks/bench_chunk_path.py --routes 50 --speed 50
+    $ python benchmarks/bench_chunk_path.py --cache routes.sqlite
+"""
+
+import asyncio
+import json
+import random
+import sqlite3
+import time
+
+import click
+
+from simfleet.utils.helpers import distance_in_meters, kmh_to_ms
+from simfleet.utils.routing import DEFAULT_ROUTE_HOST, RouteClient, chunk_path
+
+
+def legacy_chunk_path(path, speed_in_kmh):
+    meters_per_second = kmh_to_ms(speed_in_kmh)
+    length = len(path)
+    chunked_lat_lngs = []
+
+    for i in range(1, length):
+        _cur = path[i - 1]
+        _next = path[i]
+        if _cur == _next:
+            continue
+        distance = distance_in_meters(_cur, _next)
+        factor = meters_per_second / distance if distance else 0
+        diff_lat = factor * (_next[0] - _cur[0])
+        diff_lng = factor * (_next[1] - _cur[1])
+
+        if distance > meters_per_second:
+            while distance > meters_per_second:
+                _cur = [_cur[0] + diff_lat, _cur[1] + diff_lng]
+                distance = distance_in_meters(_cur, _next)
+                chunked_lat_lngs.append(_cur)
+        else:
+            chunked_lat_lngs.append(_cur)
+
+    chunked_lat_lngs.append(path[length - 1])
+
+    return chunked_lat_lngs
+
+
+def load_cached_routes(filename):
+    with sqlite3.connect(filename) as connection:
+        rows = connection.execute("SELECT path FROM routes").fetchall()
+    return [json.loads(row[0]) for row in rows if row[0]]
+
+
+async def request_routes(route_host, center, count, seed):
+    rng = random.Random(seed)
+    client = RouteClient(route_host)
+
+    def random_point():
+        return [center[0] + rng.uniform(-0.05, 0.05), center[1] + rng.uniform(-0.05, 0.05)]
+
+    try:
+        routes = await asyncio.gather(
+            *[client.request_route(random_point(), random_point()) for _ in range(count)]
+        )
+    finally:
+        await client.close()
+    return [path for path, _, _ in routes if path is not None]
+
+
+def timeit(function, paths, speed, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for path in paths:
+            function(path, speed)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+@click.command()
+@click.option("--cache", help="Route cache file with the routes to chunk.")
+@click.option("--route-host", default=DEFAULT_ROUTE_HOST, help="OSRM server used when no cache is given.")
+@click.option("--routes", default=50, help="Number of routes requested to the OSRM server.")
+@click.option("--center", default="39.4697,-0.3763", help="Center (lat,lon) of the random routes.")
+@click.option("--speed", default=50.0, help="Speed in km/h.")
+@click.option("--repeat", default=3, help="Number of timed repetitions.")
+@click.option("--seed", default=0, help="Seed of the random routes.")
+def main(cache, route_host, routes, center, speed, repeat, seed):
+    if cache:
+        paths = load_cached_routes(cache)
+    else:
+        center = [float(c) for c in center.split(",")]
+        paths = asyncio.run(request_routes(route_host, center, routes, seed))
+    if not paths:
+        raise click.ClickException("No routes to benchmark")
+
+    points = sum(len(path) for path in paths)
+    click.echo("{} routes, {} points, {} km/h".format(len(paths), points, speed))
+
+    max_error = 0.0
+    count_mismatches = 0
+    for path in paths:
+        old, new = legacy_chunk_path(path, speed), chunk_path(path, speed).tolist()
+        if len(old) != len(new):
+            count_mismatches += 1
+            continue
+        error = max(distance_in_meters(a, b) for a, b in zip(old, new))
+        max_error = max(max_error, error)
+    click.echo(
+        "Routes with a different number of chunks: {}, max distance between chunks: {:.2f} m".format(
+            count_mismatches, max_error
+        )
+    )
+
+    legacy = timeit(legacy_chunk_path, paths, speed, repeat)
+    vectorized = timeit(chunk_path, paths, speed, repeat)
+    click.echo("legacy:     {:.4f} s".format(legacy))
+    click.echo("vectorized: {:.4f} s ({:.1f}x)".format(vectorized, legacy / vectorized))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark of the memory used by the paths of the moving agents.
+
+Measures (with ``tracemalloc``) the memory held by the ``path`` and ``chunked_path`` of a fleet of
+moving taxis when they are stored as lists of points and as ``CompactPath`` arrays, and the time
+spent consuming the chunked paths one step at a time.
+
+Usage::
+
+    $ python benchmarks/bench_path_memory.py --taxis 1000 --points 300 --speed 50
+"""
+
+import gc
+import random
+import time
+import tracemalloc
+
+import click
+
+from simfleet.utils.compactpath import CompactPath
+from simfleet.utils.routing import chunk_path
+
+
+def random_path(rng, points):
+    path = [[39.47 + rng.uniform(-0.03, 0.03), -0.37 + rng.uniform(-0.03, 0.03)]]
+    for _ in range(points - 1):
+        path.append(
+            [path[-1][0] + rng.uniform(-0.0005, 0.0005), path[-1][1] + rng.uniform(-0.0005, 0.0005)]
+        )
+    return path
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    paths = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return paths, size
+
+
+def consume(fleet):
+    start = time.perf_counter()
+    for _, chunked_path in fleet:
+        while chunked_path:
+            chunked_path.pop(0)
+    return time.perf_counter() - start
+
+
+@click.command()
+@click.option("--taxis", default=1000, help="Number of moving taxis.")
+@click.option("--points", default=300, help="Number of points of each route.")
+@click.option("--speed", default=50.0, help="Speed in km/h.")
+@click.option("--seed", default=0, help="Seed of the random routes.")
+def main(taxis, points, speed, seed):
+    rng = random.Random(seed)
+    routes = [random_path(rng, points) for _ in range(taxis)]
+    chunks = [chunk_path(route, speed).tolist() for route in routes]
+    click.echo(
+        "{} taxis, {} points per route, {:.0f} chunks per route".format(
+            taxis, points, sum(len(c) for c in chunks) / taxis
+        )
+    )
+
+    results = {}
+    for name, build in (
+        ("lists", lambda: [([list(p) for p in r], [list(p) for p in c]) for r, c in zip(routes, chunks)]),
+        ("float64", lambda: [(CompactPath(r, "float64"), CompactPath(c, "float64")) for r, c in zip(routes, chunks)]),
+        ("float32", lambda: [(CompactPath(r, "float32"), CompactPath(c, "float32")) for r, c in zip(routes, chunks)]),
+    ):
+        fleet, size = measure(build)
+        results[name] = size
+        elapsed = consume(fleet)
+        click.echo(
+            "{:8} {:8.2f} MB ({:6.1f} KB per taxi), consumed in {:.3f} s".format(
+                name, size / 2 ** 20, size / taxis / 1024, elapsed
+            )
+        )
+    click.echo(
+        "float64 uses {:.1f}x less memory than lists, float32 {:.1f}x".format(
+            results["lists"] / results["float64"], results["lists"] / results["float32"]
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
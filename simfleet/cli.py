@@ -13,6 +13,7 @@ from loguru import logger
 
 from simfleet.config import settings
 from simfleet.simulator import SimulatorAgent
+from simfleet.utils import des
 
 
 @click.command()
@@ -23,6 +24,19 @@ from simfleet.simulator import SimulatorAgent
 @click.option(
     "-mt", "--max-time", help="Maximum simulation time (in seconds).", type=int
 )
+@click.option(
+    "-tf",
+    "--time-factor",
+    help="Speed-up of the simulation time over real time (e.g. 60 simulates one hour per minute).",
+    type=float,
+)
+@click.option(
+    "-e",
+    "--engine",
+    help="Simulation engine: real time with the web interface, or a headless discrete-event "
+    "scheduler that skips the idle time (always autorun).",
+    type=click.Choice(des.ENGINES),
+)
 @click.option(
     "-r",
     "--autorun",
@@ -36,7 +50,7 @@ from simfleet.simulator import SimulatorAgent
     count=True,
     help="Show verbose debug level: -v level 1, -vv level 2, -vvv level 3, -vvvv level 4",
 )
-def main(name, output, max_time, autorun, config, verbose):
+def main(name, output, max_time, time_factor, engine, autorun, config, verbose):
     """
     Console script for SimFleet.
     """
@@ -59,7 +73,13 @@ def main(name, output, max_time, autorun, config, verbose):
     else:
         logging.getLogger("slixmpp").setLevel(logging.WARNING)
 
-    simfleet_config = settings.SimfleetConfig(config, name, max_time, verbose)
+    simfleet_config = settings.SimfleetConfig(
+        config, name, max_time, verbose, time_factor, engine
+    )
+    if simfleet_config.engine == des.DES_ENGINE:
+        # the agents take the event loop of the container when they are created
+        des.setup_event_loop()
+        autorun = True
 
     simulator_name = "simulator_{}@{}".format(
         simfleet_config.simulation_name, simfleet_config.host
@@ -92,7 +112,11 @@ def main(name, output, max_time, autorun, config, verbose):
             logger.error(f"An error occurred: {e}")
             sys.exit(0)
 
-    spade.run(run_simulation())
+    if simfleet_config.engine == des.DES_ENGINE:
+        with des.in_process_agents():
+            spade.run(run_simulation())
+    else:
+        spade.run(run_simulation())
 
 
 if __name__ == "__main__":
@@ -78,7 +78,7 @@ class CustomerAgent(GeoLocatedAgent):
         """
         if coords:
             self.customer_dest = coords
-        else:
+        elif not self.defer_random_position(self.set_target_position):
             self.customer_dest = new_random_position(self.boundingbox, self.route_host)
         logger.debug(
             "Agent[{}]: The agent target position is ({})".format(self.agent_id, self.customer_dest)
@@ -1,4 +1,5 @@
 import json
+import math
 from asyncio import CancelledError
 
 from loguru import logger
@@ -13,11 +14,18 @@ from simfleet.communications.protocol import (
     ACCEPT_PERFORMATIVE,
     CANCEL_PERFORMATIVE,
     REQUEST_PERFORMATIVE,
+    NOT_MODIFIED_PERFORMATIVE,
     QUERY_PROTOCOL,
 )
 
+from simfleet.common.spatialindex import SpatialIndex
 from simfleet.utils.abstractstrategies import StrategyBehaviour
 
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
 class DirectoryAgent(Agent):
     """
         DirectoryAgent is responsible for managing the registration of services and handling queries about available services in the system.
@@ -26,6 +34,8 @@ class DirectoryAgent(Agent):
             strategy (StrategyBehaviour): The strategy that dictates how the agent behaves.
             agent_id (str): Identifier of the agent.
             service_agents (dict): A dictionary to store the available services and agents that provide them.
+            spatial_indexes (dict): A spatial index of the positions of the providers of each service.
+            service_versions (dict): The version of the providers of each service, increased on every change.
             stopped (bool): A flag indicating if the agent has been stopped.
     """
     def __init__(self, agentjid, password):
@@ -37,6 +47,9 @@ class DirectoryAgent(Agent):
         self.agent_id = None
 
         self.set("service_agents", {})
+        self.spatial_indexes = {}
+        self.service_versions = {}
+        self._payloads = {}
         self.stopped = False
 
     def set_id(self, agent_id):
@@ -48,6 +61,80 @@ class DirectoryAgent(Agent):
         """
         self.agent_id = agent_id
 
+    def index_service(self, content):
+        """
+        Adds the position of a service provider to the spatial index of the service.
+
+        Args:
+            content (dict): Information about the service, with the provider's position (if any).
+        """
+        if content.get("position"):
+            self.spatial_indexes.setdefault(content["type"], SpatialIndex()).insert(
+                content["jid"], content["position"]
+            )
+
+    def unindex_service(self, service_type, agent):
+        """
+        Removes a service provider from the spatial index of the service.
+
+        Args:
+            service_type (str): The type of service.
+            agent (str): The JID of the provider.
+        """
+        if service_type in self.spatial_indexes:
+            self.spatial_indexes[service_type].remove(agent)
+
+    def invalidate_service(self, service_type):
+        """
+        Increases the version of a service after a registration or deregistration and drops its
+        serialized list of providers.
+
+        Args:
+            service_type (str): The type of service.
+        """
+        self.service_versions[service_type] = self.service_versions.get(service_type, 0) + 1
+        self._payloads.pop(service_type, None)
+
+    def service_payload(self, service_type):
+        """
+        Returns the serialized list of providers of a service, which is cached until the service changes.
+
+        Args:
+            service_type (str): The type of service.
+
+        Returns:
+            str: The JSON list of providers.
+        """
+        payload = self._payloads.get(service_type)
+        if payload is None:
+            payload = json.dumps(self.get("service_agents")[service_type])
+            self._payloads[service_type] = payload
+        return payload
+
+    def query_services(self, service_type, near, k=None, radius=None):
+        """
+        Finds the providers of a service closest to a position using the spatial index of the service.
+
+        Args:
+            service_type (str): The type of service.
+            near (list): The position (latitude, longitude) of the query.
+            k (int, optional): The maximum number of providers (1 if no radius is given).
+            radius (float, optional): The maximum distance in meters to the providers.
+
+        Returns:
+            dict: The providers found, sorted by distance, with the same content as ``service_agents``
+            (all the providers if they have no position).
+        """
+        services = self.get("service_agents")[service_type]
+        index = self.spatial_indexes.get(service_type)
+        if index is None:
+            return services
+        if radius is not None:
+            matches = index.within(near, radius)[:k]
+        else:
+            matches = index.nearest(near, k or 1)
+        return {jid: services[jid] for jid, _ in matches}
+
     def run_strategy(self):
         """
         Runs the strategy assigned to the directory agent for managing the services.
@@ -111,6 +198,8 @@ class RegistrationBehaviour(CyclicBehaviour):
             service[content["type"]][content["jid"]] = content
         else:
             service[content["type"]] = {content["jid"]: content}
+        self.agent.index_service(content)
+        self.agent.invalidate_service(content["type"])
 
     def remove_service(self, service_type, agent):
         """
@@ -121,6 +210,8 @@ class RegistrationBehaviour(CyclicBehaviour):
             agent (str): The JID of the agent whose service should be removed.
         """
         del self.get("service_agents")[service_type][agent]
+        self.agent.unindex_service(service_type, agent)
+        self.agent.invalidate_service(service_type)
         logger.debug(
             "Agent[{}]: Deregistration of the [{}] for service ({})".format(
                 self.agent.name, agent, service_type
@@ -186,21 +277,84 @@ class DirectoryStrategyBehaviour(CyclicBehaviour):
     async def on_start(self):
         logger.debug("Agent[{}]: Strategy ({}) started in directory".format(self.agent.name, type(self).__name__))
 
-    async def send_services(self, agent_id, type_service):
+    async def send_services(self, agent_id, type_service, query=None):
         """
-        Sends a message to the requesting agent (customer/transport) with the list of available services.
+        Sends a message to the requesting agent (customer/transport) with the list of available services
+        and its version. If the request is a spatial query only the providers that match it are sent.
 
         Args:
             agent_id (str): The JID of the requesting agent.
             type_service (str): The type of service the agent is requesting.
+            query (dict, optional): The spatial query, with the ``near`` position and ``k`` and/or ``radius``.
         """
+        if query is None:
+            body = self.agent.service_payload(type_service)
+        else:
+            body = json.dumps(
+                self.agent.query_services(
+                    type_service, query["near"], k=query.get("k"), radius=query.get("radius")
+                )
+            )
         reply = Message()
         reply.to = str(agent_id)
         reply.set_metadata("protocol", QUERY_PROTOCOL)
         reply.set_metadata("performative", INFORM_PERFORMATIVE)
-        reply.body = json.dumps(self.get("service_agents")[type_service])
+        reply.set_metadata("version", str(self.agent.service_versions.get(type_service, 0)))
+        reply.body = body
+        await self.send(reply)
+
+    async def send_not_modified(self, agent_id, type_service):
+        """
+        Tells the requesting agent that the list of services it already has is still up to date.
+
+        Args:
+            agent_id (str): The JID of the requesting agent.
+            type_service (str): The type of service the agent is requesting.
+        """
+        reply = Message()
+        reply.to = str(agent_id)
+        reply.set_metadata("protocol", QUERY_PROTOCOL)
+        reply.set_metadata("performative", NOT_MODIFIED_PERFORMATIVE)
+        reply.set_metadata("version", str(self.agent.service_versions.get(type_service, 0)))
+        reply.body = json.dumps({})
         await self.send(reply)
 
+    @staticmethod
+    def parse_request(body):
+        """
+        Parses the body of a service request, which is either the type of service or a JSON spatial
+        query such as ``{"type": "stops", "near": [lat, lon], "k": 3}`` or
+        ``{"type": "stations", "near": [lat, lon], "radius": 1000}``.
+
+        Args:
+            body (str): The body of the request message.
+
+        Returns:
+            tuple: The type of service and the spatial query (or None).
+
+        Raises:
+            ValueError: If the body is not valid JSON or the query has no ``type``, no ``near`` position
+                or a ``k`` or ``radius`` that is not a positive number.
+        """
+        if not (body and body.startswith("{")):
+            return body, None
+        query = json.loads(body)
+        if not isinstance(query, dict) or not isinstance(query.get("type"), str):
+            raise ValueError("The query has no type of service")
+        near = query.get("near")
+        if not (
+            isinstance(near, list)
+            and len(near) == 2
+            and all(_is_number(coord) for coord in near)
+        ):
+            raise ValueError("The query has no valid near position: {}".format(near))
+        k, radius = query.get("k"), query.get("radius")
+        if k is not None and not (isinstance(k, int) and not isinstance(k, bool) and k > 0):
+            raise ValueError("The k of the query must be a positive integer: {}".format(k))
+        if radius is not None and not (_is_number(radius) and radius > 0):
+            raise ValueError("The radius of the query must be a positive number: {}".format(radius))
+        return query.pop("type"), query
+
     async def send_negative(self, agent_id):
         """
         Sends a cancellation message to the requesting agent (customer/transport) if no services are available.
@@ -236,7 +390,21 @@ class DirectoryStrategyBehaviour(CyclicBehaviour):
                     )
                 )
 
-                if request in self.get("service_agents"):
-                    await self.send_services(agent_id, msg.body)
+                try:
+                    service_type, query = self.parse_request(request)
+                except (ValueError, KeyError) as e:
+                    logger.warning(
+                        "Agent[{}]: Directory received an invalid request from [{}]: {}".format(
+                            self.agent.name, agent_id, e
+                        )
+                    )
+                    await self.send_negative(agent_id)
+                    return
+                version = str(self.agent.service_versions.get(service_type, 0))
+                if service_type in self.get("service_agents"):
+                    if msg.get_metadata("if_modified_since") == version:
+                        await self.send_not_modified(agent_id, service_type)
+                    else:
+                        await self.send_services(agent_id, service_type, query)
                 else:
                     await self.send_negative(agent_id)
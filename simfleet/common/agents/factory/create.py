@@ -30,6 +30,7 @@ class Factory(ABC):
                      fleetmanager,
                      fleet_type,
                      route_host,
+                     route_client,
                      autonomy,
                      current_autonomy,
                      position,
@@ -67,6 +68,7 @@ class DirectoryFactory(Factory):
                      fleetmanager=None,
                      fleet_type=None,
                      route_host=None,
+                     route_client=None,
                      autonomy=None,
                      current_autonomy=None,
                      position=None,
@@ -117,6 +119,7 @@ class FleetManagerFactory(Factory):
                      fleetmanager=None,
                      fleet_type=None,
                      route_host=None,
+                     route_client=None,
                      autonomy=None,
                      current_autonomy=None,
                      position=None,
@@ -179,6 +182,7 @@ class TransportFactory(Factory):
                      fleetmanager=None,
                      fleet_type=None,
                      route_host=None,
+                     route_client=None,
                      autonomy=None,
                      current_autonomy=None,
                      position=None,
@@ -203,6 +207,7 @@ class TransportFactory(Factory):
             fleetmanager (str): Fleet manager JID address.
             fleet_type (str): Type of fleet used by the agent.
             route_host (str): Route host address.
+            route_client (RouteClient, optional): Shared client for route requests.
             autonomy (str): Autonomy level of the agent.
             current_autonomy (str): Current autonomy level.
             position (list): Initial coordinates of the agent.
@@ -241,6 +246,7 @@ class TransportFactory(Factory):
         # Set fleet type, route host, and additional attributes
         agent.set_fleet_type(fleet_type)
         agent.set_route_host(route_host)
+        agent.set_route_client(route_client)
         agent.set_boundingbox(bbox)
 
         if autonomy:
@@ -289,6 +295,7 @@ class CustomerFactory(Factory):
                      fleetmanager=None,
                      fleet_type=None,
                      route_host=None,
+                     route_client=None,
                      autonomy=None,
                      current_autonomy=None,
                      position=None,
@@ -312,6 +319,7 @@ class CustomerFactory(Factory):
             jid_directory (JID): Directory JID address.
             fleet_type (str): Type of fleet used by the agent.
             route_host (str): Route host address.
+            route_client (RouteClient, optional): Shared client for route requests.
             position (list): Initial coordinates of the agent.
             target (list, optional): Destination coordinates of the agent.
 
@@ -344,6 +352,7 @@ class CustomerFactory(Factory):
         # Set fleet type, route host, and additional attributes
         agent.set_fleet_type(fleet_type)
         agent.set_route_host(route_host)
+        agent.set_route_client(route_client)
         agent.set_boundingbox(bbox)
 
         agent.set_initial_position(position)
@@ -376,6 +385,7 @@ class StationFactory(Factory):
                     fleetmanager=None,
                     fleet_type=None,
                     route_host=None,
+                    route_client=None,
                     autonomy=None,
                     current_autonomy=None,
                     position=None,
@@ -421,6 +431,7 @@ class StationFactory(Factory):
 
         # Set route host, and additional attributes
         agent.set_route_host(route_host)
+        agent.set_route_client(route_client)
         agent.set_boundingbox(bbox)
         agent.set_position(position)
 
@@ -462,6 +473,7 @@ class TransportStopFactory(Factory):
                     fleetmanager=None,
                     fleet_type=None,
                     route_host=None,
+                    route_client=None,
                     autonomy=None,
                     current_autonomy=None,
                     position=None,
@@ -512,6 +524,7 @@ class TransportStopFactory(Factory):
 
         # Set route host, and additional attributes
         agent.set_route_host(route_host)
+        agent.set_route_client(route_client)
         agent.set_boundingbox(bbox)
         agent.set_position(position)
 
@@ -543,6 +556,7 @@ class VehicleFactory(Factory):
                     fleetmanager=None,
                     fleet_type=None,
                     route_host=None,
+                    route_client=None,
                     autonomy=None,
                     current_autonomy=None,
                     position=None,
@@ -565,6 +579,7 @@ class VehicleFactory(Factory):
             jid_directory (JID): Directory JID address.
             fleet_type (str): Type of fleet used by the vehicle.
             route_host (str): Route host address.
+            route_client (RouteClient, optional): Shared client for route requests.
             position (list): Initial coordinates of the vehicle.
             speed (str): Speed of the vehicle.
             target (list, optional): Target coordinates for the vehicle.
@@ -587,6 +602,7 @@ class VehicleFactory(Factory):
         # Set route host, and additional attributes
         agent.set_fleet_type(fleet_type)
         agent.set_route_host(route_host)
+        agent.set_route_client(route_client)
         agent.set_boundingbox(bbox)
         agent.set_target_position(target)
 
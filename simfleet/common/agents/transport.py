@@ -150,6 +150,7 @@ class TransportAgent(VehicleAgent):
         self.get("current_customer")[str(customer_id)] = {"origin": origin, "dest": dest}
 
         self.num_assignments += 1
+        self.refresh_movement()
 
     def remove_customer_in_transport(self, customer_id):
         """
@@ -164,6 +165,17 @@ class TransportAgent(VehicleAgent):
         del self.get("current_customer")[customer_id]
 
         self.num_assignments -= 1
+        self.refresh_movement()
+
+    def watches_movement(self):
+        """
+            A transport with customers on board informs them of its location at every step. The movement is
+            refreshed whenever a customer gets on or off.
+
+            Returns:
+                bool: whether the transport carries any customer
+        """
+        return len(self.get("current_customer")) > 0
 
     async def set_position(self, coords=None):
         """
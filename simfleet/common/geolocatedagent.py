@@ -1,5 +1,5 @@
 import json
-import geopy.distance
+
 from loguru import logger
 
 from spade.message import Message
@@ -7,9 +7,12 @@ from spade.template import Template
 from spade.behaviour import OneShotBehaviour
 
 from simfleet.common.simfleetagent import SimfleetAgent
+from simfleet.common.spatialindex import SpatialIndex
 
 from simfleet.utils.helpers import new_random_position, distance_in_meters
-from simfleet.communications.protocol import INFORM_PERFORMATIVE, QUERY_PROTOCOL, REQUEST_PERFORMATIVE, CANCEL_PERFORMATIVE
+from simfleet.utils.routing import request_matrix
+from simfleet.communications.protocol import INFORM_PERFORMATIVE, QUERY_PROTOCOL, REQUEST_PERFORMATIVE, CANCEL_PERFORMATIVE, \
+    NOT_MODIFIED_PERFORMATIVE
 
 class GeoLocatedAgent(SimfleetAgent):
     """
@@ -18,14 +21,23 @@ class GeoLocatedAgent(SimfleetAgent):
 
         Attributes:
             route_host (str): The host of the route service used for requesting paths.
+            route_client (RouteClient): The shared client used to send the route requests.
             boundingbox (tuple): The bounding box coordinates that define the area where the agent can be placed.
+            deferred_positions (list): Setters of the random positions still to be drawn while the scenario is loaded.
+            spatial_index (SpatialIndex): The index of the last list of agents searched with nearst_agent.
+            directory_cache (dict): The last answer of the directory to each request, with its version.
             icon (str): The visual representation or icon of the agent.
     """
     def __init__(self, agentjid, password):
         super().__init__(agentjid, password)
         self.route_host = None
+        self.route_client = None
         self.set("current_pos", None)
         self.boundingbox = None
+        self.deferred_positions = []
+        self.spatial_index = SpatialIndex()
+        self._indexed_agents = None
+        self.directory_cache = {}
 
         self.icon = None
 
@@ -49,6 +61,15 @@ class GeoLocatedAgent(SimfleetAgent):
         """
         self.route_host = route_host
 
+    def set_route_client(self, route_client):
+        """
+        Sets the shared route client used for requesting paths.
+
+        Args:
+            route_client (RouteClient): The route client owned by the simulator.
+        """
+        self.route_client = route_client
+
 
     def set_position(self, coords=None):
         """
@@ -60,7 +81,7 @@ class GeoLocatedAgent(SimfleetAgent):
 
         if coords:
             self.set("current_pos", coords)
-        else:
+        elif not self.defer_random_position(self.set_current_position):
             self.set("current_pos", new_random_position(self.boundingbox, self.route_host))
         logger.debug(
             "Agent[{}]: The agent position is ({})".format(self.agent_id, self.get("current_pos"))
@@ -75,9 +96,48 @@ class GeoLocatedAgent(SimfleetAgent):
         """
         if coords:
             self.set("current_pos", coords)
-        else:
+        elif not self.defer_random_position(self.set_current_position):
             self.set("current_pos", new_random_position(self.boundingbox, self.route_host))
 
+    def set_current_position(self, coords):
+        """
+            Stores the current position of the agent.
+
+            Args:
+                coords (list): A list of coordinates [longitude, latitude].
+        """
+        self.set("current_pos", coords)
+
+    def defer_random_position(self, setter):
+        """
+            Defers drawing a random position while the scenario is loaded (i.e. before the agent is started), so
+            that the simulator snaps the random positions of all the agents to the road network in a single
+            asynchronous batch instead of one blocking request per agent.
+
+            Args:
+                setter (function): The function that receives the random position once it is drawn.
+
+            Returns:
+                bool: whether the random position has been deferred
+        """
+        if self.route_client is None or self.boundingbox is None or self.is_alive():
+            return False
+        self.deferred_positions.append(setter)
+        return True
+
+    async def random_position(self):
+        """
+            Returns a random position inside the bounding box of the agent snapped to the road network, without
+            blocking the event loop when the agent has a route client.
+
+            Returns:
+                list: The coordinates of the position.
+        """
+        if self.route_client is not None:
+            positions = await self.route_client.random_positions(self.boundingbox, 1)
+            return positions[0]
+        return new_random_position(self.boundingbox, self.route_host)
+
     def get_position(self):
         """
         Retrieves the current position of the agent.
@@ -106,14 +166,13 @@ class GeoLocatedAgent(SimfleetAgent):
             Returns:
                 bool: True if the agents are near each other, False otherwise.
         """
-        if geopy.distance.geodesic(coords_1, coords_2).km > 0.1:
-            return False
-        return True
+        return distance_in_meters(coords_1, coords_2) <= 100
 
 
     def nearst_agent(self, agent_list, position):
         """
-            Finds the closest agent from a list of agents to the specified position.
+            Finds the closest agent from a list of agents to the specified position. The agents are
+            kept in a spatial index that is only updated when a different list is given.
 
             Args:
                 agent_list (dict): A dictionary of agents with their positions.
@@ -123,17 +182,11 @@ class GeoLocatedAgent(SimfleetAgent):
                 tuple: The closest agent's JID and position.
         """
 
-        agent_positions = []
-        for key in agent_list.keys():
-            dic = agent_list.get(key)
-            agent_positions.append((dic["jid"], dic["position"]))
-
-        closest_agent = min(
-            agent_positions,
-            key=lambda x: distance_in_meters(x[1], position),
-        )
-        logger.debug("Closest agent {}".format(closest_agent))
-        agent = closest_agent[0]
+        if agent_list is not self._indexed_agents or len(agent_list) != len(self.spatial_index):
+            self.spatial_index.sync(agent_list)
+            self._indexed_agents = agent_list
+        agent, distance = self.spatial_index.nearest(position)[0]
+        logger.debug("Closest agent {} ({:.0f} m)".format(agent, distance))
         result = (
             agent,
             agent_list[agent]["position"],
@@ -143,6 +196,22 @@ class GeoLocatedAgent(SimfleetAgent):
         )
         return result
 
+    async def request_matrix(self, origins, destinations):
+        """
+        Requests the road distances and durations from every origin to every destination with a
+        single batch of requests to the route server. Useful to rank several candidates (e.g.
+        stations or transports) at once instead of requesting one path per candidate.
+
+        Args:
+            origins (list): A list of origin coordinates.
+            destinations (list): A list of target coordinates.
+
+        Returns:
+            numpy.ndarray, numpy.ndarray: The distances (meters) and durations (seconds) matrices,
+            with one row per origin and one column per destination.
+        """
+        return await request_matrix(origins, destinations, self.route_host, self.route_client)
+
     def set_boundingbox(self, bbox):
         """
             Sets the bounding box within which the agent operates.
@@ -152,13 +221,19 @@ class GeoLocatedAgent(SimfleetAgent):
         """
         self.boundingbox = bbox
 
-    async def get_list_agent_position(self, agent_type, agent_list):
+    async def get_list_agent_position(self, agent_type, agent_list, near=None, k=None, radius=None):
         """
             Requests the list of agents of a given type from the directory agent and waits for the response.
+            The last answer is kept with its version, so the directory only sends the list again if it changed.
+            If a ``near`` position is given, the directory only answers with the ``k`` agents closest to it
+            and/or the agents within ``radius`` meters.
 
             Args:
                 agent_type (str): The type of agent being requested (e.g., 'bus stop', 'station').
                 agent_list (dict): The current list of agents.
+                near (list, optional): The position (latitude, longitude) of a spatial query.
+                k (int, optional): The number of closest agents requested (1 if no radius is given).
+                radius (float, optional): The maximum distance in meters of the agents requested.
 
             Returns:
                 dict: A list of agent positions, updated after the request.
@@ -173,8 +248,15 @@ class GeoLocatedAgent(SimfleetAgent):
         template2.set_metadata("protocol", QUERY_PROTOCOL)
         template2.set_metadata("performative", CANCEL_PERFORMATIVE)
 
-        instance = GetListOfAgentPosition(agent_type, agent_list)
-        self.add_behaviour(instance, template1 | template2)
+        template3 = Template()
+        template3.set_metadata("protocol", QUERY_PROTOCOL)
+        template3.set_metadata("performative", NOT_MODIFIED_PERFORMATIVE)
+
+        query = None
+        if near is not None:
+            query = {"near": near, "k": k, "radius": radius}
+        instance = GetListOfAgentPosition(agent_type, agent_list, query)
+        self.add_behaviour(instance, template1 | template2 | template3)
 
         # Wait for the behaviour to complete
         await instance.join()
@@ -188,20 +270,23 @@ class GetListOfAgentPosition(OneShotBehaviour):
         Attributes:
             agent_type (str): The type of agent being requested.
             agent_list (dict): The list of agents.
+            query (dict): The spatial query sent to the directory (or None to get all the agents).
     """
-    def __init__(self, agent_type, agent_list):
+    def __init__(self, agent_type, agent_list, query=None):
         super().__init__()
 
         self.agent_type = agent_type
         self.agent_list = agent_list
+        self.query = query
 
 
-    async def send_get_agents(self, content=None):
+    async def send_get_agents(self, content=None, version=None):
         """
             Sends a message to the directory agent to request a list of agents of a specific type.
 
             Args:
                 content (dict): Optional content to be included in the request message.
+                version (str): Optional version of the list already known, which is not sent again if unchanged.
         """
         if content is None or len(content) == 0:
             content = self.agent_type
@@ -216,6 +301,8 @@ class GetListOfAgentPosition(OneShotBehaviour):
         msg.to = str(self.agent.directory_id)
         msg.set_metadata("protocol", QUERY_PROTOCOL)
         msg.set_metadata("performative", REQUEST_PERFORMATIVE)
+        if version is not None:
+            msg.set_metadata("if_modified_since", version)
         msg.body = content
         await self.send(msg)
 
@@ -231,7 +318,12 @@ class GetListOfAgentPosition(OneShotBehaviour):
             Executes the behavior to request and receive the list of agent positions.
         """
         if self.agent_list is None:
-            await self.send_get_agents(self.agent_type)
+            if self.query is None:
+                request = self.agent_type
+            else:
+                request = json.dumps(dict(self.query, type=self.agent_type))
+            cached = self.agent.directory_cache.get(request)
+            await self.send_get_agents(request, cached[0] if cached else None)
 
             msg = await self.receive(timeout=300)
             if msg:
@@ -240,11 +332,21 @@ class GetListOfAgentPosition(OneShotBehaviour):
                     performative = msg.get_metadata("performative")
                     if performative == INFORM_PERFORMATIVE:
                         self.agent_list = json.loads(msg.body)
+                        version = msg.get_metadata("version")
+                        if version is not None:
+                            self.agent.directory_cache[request] = (version, self.agent_list)
                         logger.debug(
                             "Agent[{}]: The agent got services from directory: {}".format(
                                 self.agent.name, self.agent_list
                             )
                         )
+                    elif performative == NOT_MODIFIED_PERFORMATIVE and cached:
+                        self.agent_list = cached[1]
+                        logger.debug(
+                            "Agent[{}]: The services ({}) of the agent are up to date".format(
+                                self.agent.name, self.agent_type
+                            )
+                        )
                     elif performative == CANCEL_PERFORMATIVE:
                         logger.warning(
                             "Agent[{}]: THe agent got cancellation of request for ({}) information".format(
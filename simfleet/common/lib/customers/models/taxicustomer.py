@@ -4,7 +4,6 @@ from loguru import logger
 from spade.message import Message
 from spade.template import Template
 
-from simfleet.utils.helpers import new_random_position
 
 from simfleet.communications.protocol import (
     REQUEST_PROTOCOL,
@@ -131,7 +130,7 @@ class TaxiCustomerStrategyBehaviour(StrategyBehaviour):
                             origin, and destination will be used.
         """
         if not self.agent.customer_dest:
-            self.agent.customer_dest = new_random_position(self.agent.boundingbox, self.agent.route_host)
+            self.agent.customer_dest = await self.agent.random_position()
 
         if content is None or len(content) == 0:
             content = {
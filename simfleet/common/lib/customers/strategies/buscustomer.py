@@ -1,4 +1,3 @@
-import asyncio
 import json
 import time
 
@@ -44,8 +43,15 @@ class BusCustomerWaitingToMoveState(BusCustomerStrategyBehaviour):
         """
 
         if self.agent.stop_dic is None:
-            # Obtain the list of bus stops if not available
-            self.agent.stop_dic = await self.agent.get_list_agent_position(self.agent.type_service, self.agent.stop_dic)
+            # Obtain the bus stops closest to the customer and to its destination
+            origin_stops = await self.agent.get_list_agent_position(
+                self.agent.type_service, None, near=self.agent.get_position(), k=1
+            )
+            destination_stops = await self.agent.get_list_agent_position(
+                self.agent.type_service, None, near=self.agent.customer_dest, k=1
+            )
+            if origin_stops and destination_stops:
+                self.agent.stop_dic = {**origin_stops, **destination_stops}
 
             self.set_next_state(CUSTOMER_WAITING_TO_MOVE)
             return
@@ -126,7 +132,7 @@ class BusCustomerMovingToDestState(BusCustomerStrategyBehaviour):
         """
         try:
             if not self.agent.get_position() == self.agent.pedestrian_dest:
-                await asyncio.sleep(1)
+                await self.agent.sleep(1)
                 self.set_next_state(CUSTOMER_MOVING_TO_DEST)
             else:
 
@@ -1,6 +1,5 @@
 import json
 import datetime
-import asyncio
 
 from loguru import logger
 from spade.behaviour import CyclicBehaviour, OneShotBehaviour
@@ -165,7 +164,7 @@ class ChargingService(OneShotBehaviour):
             )
         )
 
-        await asyncio.sleep(recarge_time.total_seconds())
+        await self.agent.sleep(recarge_time.total_seconds())
 
 
     async def inform_charging_complete(self):
@@ -231,7 +230,7 @@ class GasolineService(OneShotBehaviour):
             )
         )
 
-        await asyncio.sleep(recarge_time.total_seconds())
+        await self.agent.sleep(recarge_time.total_seconds())
 
 
     async def inform_charging_complete(self):
@@ -294,7 +293,7 @@ class DieselService(OneShotBehaviour):
             )
         )
 
-        await asyncio.sleep(recarge_time.total_seconds())
+        await self.agent.sleep(recarge_time.total_seconds())
 
 
     async def inform_charging_complete(self):
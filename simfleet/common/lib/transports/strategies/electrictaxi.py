@@ -106,8 +106,10 @@ class ElectricTaxiNeedsChargingState(ElectricTaxiStrategyBehaviour):
         ):
             logger.info("Agent[{}]: The agent looking for a station.".format(self.agent.name))
 
-            # New
-            stations = await self.agent.get_list_agent_position(self.agent.service_type, self.agent.get_stations())
+            # The directory answers with the station closest to the current position
+            stations = await self.agent.get_list_agent_position(
+                self.agent.service_type, self.agent.get_stations(), near=self.agent.get_position(), k=1
+            )
 
             self.agent.set_stations(stations)
 
@@ -119,6 +121,8 @@ class ElectricTaxiNeedsChargingState(ElectricTaxiStrategyBehaviour):
             nearby_station_dest = self.agent.nearst_agent(self.agent.get_stations(), self.agent.get_position())
 
             self.agent.set_nearby_station(nearby_station_dest)
+            # Ask again the next time the taxi needs charging, from its new position
+            self.agent.set_stations(None)
 
             logger.info(
                  "Agent[{}]: The agent selected station [{}].".format(self.agent.name, self.agent.get_nearby_station_id())
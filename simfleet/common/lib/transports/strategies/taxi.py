@@ -1,5 +1,4 @@
 import json
-import asyncio
 
 from loguru import logger
 from simfleet.utils.abstractstrategies import FSMSimfleetBehaviour
@@ -373,7 +372,7 @@ class TaxiMovingToCustomerDestState(TaxiStrategyBehaviour):
         try:
 
             if not self.agent.is_in_destination():
-                await asyncio.sleep(1)
+                await self.agent.sleep(1)
                 self.set_next_state(TRANSPORT_MOVING_TO_DESTINATION)
             else:
                 logger.info(
@@ -95,7 +95,7 @@ class VehicleAgent(MovableMixin, GeoLocatedAgent):
         """
         if coords:
             self.vehicle_dest = coords
-        else:
+        elif not self.defer_random_position(self.set_target_position):
             self.vehicle_dest = new_random_position(self.boundingbox, self.route_host)
         logger.debug(
             "Agent[{}]: The agent target position is ({})".format(self.agent_id, self.vehicle_dest)
@@ -132,7 +132,7 @@ class VehicleAgent(MovableMixin, GeoLocatedAgent):
             else None,
             "distance": "{0:.2f}".format(sum(self.distances)),
             "speed": float("{0:.2f}".format(self.animation_speed)) if self.animation_speed else None,
-            "path": self.get("path"),
+            "path": self.get("path").tolist() if self.get("path") is not None else None,
         })
         return data
 
@@ -1,5 +1,3 @@
-import asyncio
-
 from loguru import logger
 from spade.behaviour import State, FSMBehaviour
 
@@ -53,7 +51,7 @@ class OneShotVehicleMovingState(VehicleStrategyBehaviour):
         try:
 
             if not self.agent.is_in_destination():
-                await asyncio.sleep(1)
+                await self.agent.sleep(1)
                 self.set_next_state(VEHICLE_MOVING_TO_DESTINATION)
             else:
                 self.set_next_state(VEHICLE_IN_DEST)
@@ -157,7 +155,7 @@ class CycleVehicleMovingState(VehicleStrategyBehaviour):
         try:
 
             if not self.agent.is_in_destination():
-                await asyncio.sleep(1)
+                await self.agent.sleep(1)
                 self.set_next_state(VEHICLE_MOVING_TO_DESTINATION)
             else:
                 self.set_next_state(VEHICLE_IN_DEST)
@@ -192,7 +190,7 @@ class CycleVehicleInDestState(VehicleStrategyBehaviour):
         logger.info("{} arrived at its destination".format(self.agent.jid))
 
         logger.debug("{} processes a new destination address".format(self.agent.jid))
-        self.agent.set_target_position()
+        self.agent.set_target_position(await self.agent.random_position())
         self.agent.status = VEHICLE_WAITING
         self.set_next_state(VEHICLE_WAITING)
         return
@@ -143,9 +143,7 @@ class ChargeableMixin:
             int: The total travel distance in kilometers.
         """
         fir_distance = distance_in_meters(current_pos, origin)
-        sec_distance = distance_in_meters(origin, dest)
-        if dest is None:
-            sec_distance = 0
+        sec_distance = distance_in_meters(origin, dest) if dest is not None else 0
         return (fir_distance + sec_distance) // 1000
 
     def has_enough_autonomy(self, orig, dest):
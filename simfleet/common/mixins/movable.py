@@ -1,9 +1,41 @@
+import asyncio
 from asyncio.log import logger
+
+import numpy as np
+
 from simfleet.utils.helpers import AlreadyInDestination, PathRequestException, distance_in_meters, kmh_to_ms
 from spade.behaviour import PeriodicBehaviour
-from simfleet.utils.routing import chunk_path, request_path
+from simfleet.utils.clock import get_clock
+from simfleet.utils.compactpath import CompactPath
+from simfleet.utils.des import real_time
+from simfleet.utils.distance import pairwise_distances
+from simfleet.utils.routing import backoff_delay, chunk_path, request_path
 
 ONESECOND_IN_MS = 1000
+INITIAL_CAPACITY = 1024
+
+_scheduler = None
+
+
+def get_movement_scheduler():
+    """
+    Returns the central movement scheduler of the simulation.
+
+    Returns:
+        MovementScheduler: the scheduler, or None if every agent moves with its own MovingBehaviour
+    """
+    return _scheduler
+
+
+def set_movement_scheduler(scheduler):
+    """
+    Sets the central movement scheduler of the simulation.
+
+    Args:
+        scheduler (MovementScheduler): the scheduler, or None to move every agent with its own MovingBehaviour
+    """
+    global _scheduler
+    _scheduler = scheduler
 
 
 class MovableMixin:
@@ -12,8 +44,9 @@ class MovableMixin:
         to a specific destination. It manages the movement process, path calculation, and speed handling.
 
         Attributes:
-            path (list): A list of coordinates that represents the path the vehicle should follow.
-            chunked_path (list): A list of smaller steps or 'chunks' of the path based on the speed of the vehicle.
+            path (CompactPath): The coordinates of the path the vehicle should follow.
+            chunked_path (CompactPath): The smaller steps or 'chunks' of the path based on the speed of the vehicle,
+                consumed one per step.
             animation_speed (int): The time in milliseconds between steps in the animation or movement process.
             speed_in_kmh (float): The current speed of the vehicle in kilometers per hour.
             dest (list): The destination coordinates (longitude, latitude) of the vehicle.
@@ -27,7 +60,7 @@ class MovableMixin:
         """
         self.set("path", None)
         self.chunked_path = None
-        self.animation_speed = ONESECOND_IN_MS
+        self._animation_speed = ONESECOND_IN_MS
         self.set("speed_in_kmh", None)
         self.dest = None
 
@@ -60,10 +93,15 @@ class MovableMixin:
                 self.get("current_pos"), dest
             )
             counter -= 1
+            if path is None and counter > 0:
+                # the backoff protects the route server, so it waits in real time even when the
+                # simulation runs on the discrete-event engine
+                with real_time():
+                    await asyncio.sleep(self.retry_delay(5 - counter - 1))
         if path is None:
             raise PathRequestException("Error requesting route.")
 
-        self.set("path", path)
+        self.set("path", CompactPath(path))
         try:
             self.chunked_path = chunk_path(path, self.get("speed_in_kmh"))
         except Exception as e:
@@ -72,8 +110,12 @@ class MovableMixin:
         self.dest = dest
         self.distances.append(distance)
         self.durations.append(duration)
-        behav = MovingBehaviour(period=1)
-        self.add_behaviour(behav)
+        scheduler = get_movement_scheduler()
+        if scheduler is not None:
+            scheduler.add(self, self.chunked_path)
+        else:
+            behav = MovingBehaviour(period=get_clock().to_real(1))
+            self.add_behaviour(behav)
 
 
     async def request_path(self, origin, destination):
@@ -99,6 +141,22 @@ class MovableMixin:
         """
         return await request_path(self, origin, destination, self.route_host)
 
+    def retry_delay(self, attempt):
+        """
+        Returns the time to wait before retrying a failed path request (a jittered exponential
+        backoff), so that agents do not hammer an overloaded route server with immediate retries.
+
+        Args:
+            attempt (int): number of failed attempts so far (starting at 0)
+
+        Returns:
+            float: the delay in seconds
+        """
+        route_client = getattr(self, "route_client", None)
+        if route_client is not None:
+            return route_client.retry_delay(attempt)
+        return backoff_delay(attempt)
+
 
     async def step(self):
         """
@@ -113,6 +171,53 @@ class MovableMixin:
             await self.set_position(_next)
 
 
+    @property
+    def animation_speed(self):
+        """
+        The time in milliseconds the last step took. The one of an agent moved by the movement scheduler is read
+        from the scheduler.
+        """
+        scheduler = get_movement_scheduler()
+        if scheduler is not None:
+            animation_speed = scheduler.animation_speed(self)
+            if animation_speed is not None:
+                return animation_speed
+        return self._animation_speed
+
+    @animation_speed.setter
+    def animation_speed(self, value):
+        self._animation_speed = value
+
+
+    def watches_movement(self):
+        """
+        Tells the movement scheduler whether every step must be notified to the agent (with set_position) or
+        only the arrival to its destination. It is asked when the agent starts moving and whenever
+        refresh_movement is called.
+
+        Returns:
+            bool: whether the agent needs to be called back at every step
+        """
+        return False
+
+
+    def get(self, key):
+        """
+        Returns a value of the agent's properties. The position of an agent moved by the movement scheduler is
+        read from the scheduler.
+
+        Args:
+            key (str): The property name.
+        """
+        if key == "current_pos":
+            scheduler = get_movement_scheduler()
+            if scheduler is not None:
+                position = scheduler.position(self)
+                if position is not None:
+                    return position
+        return super().get(key)
+
+
     def is_in_destination(self):
         """
         Checks if the transport has arrived to its destination.
@@ -131,6 +236,17 @@ class MovableMixin:
             speed_in_kmh (float): the speed of the transport in km per hour
         """
         self.set("speed_in_kmh", speed_in_kmh)
+        self.refresh_movement()
+
+
+    def refresh_movement(self):
+        """
+        Tells the movement scheduler that the speed of the agent or whether it watches its movement changed, so
+        that it applies from the next step.
+        """
+        scheduler = get_movement_scheduler()
+        if scheduler is not None:
+            scheduler.refresh(self)
 
 
 class MovingBehaviour(PeriodicBehaviour):
@@ -139,13 +255,227 @@ class MovingBehaviour(PeriodicBehaviour):
         It is triggered when the transport has a new destination and the periodic tick
         is recomputed at every step to show a fine animation.
         This moving behaviour includes to update the transport coordinates as it
-        moves along the path at the specified speed.
+        moves along the path at the specified speed. The ticks follow the simulation clock, so
+        they are shorter in real time when the simulation is accelerated.
     """
 
     async def run(self):
         await self.agent.step()
-        self.period = self.agent.animation_speed / ONESECOND_IN_MS
+        self.period = get_clock().to_real(self.agent.animation_speed / ONESECOND_IN_MS)
         if self.agent.is_in_destination():
             self.kill()
             self.agent.set("path", None)
             self.agent.chunked_path = None
+
+
+class MovementScheduler:
+    """
+    Moves all the agents with a path in one vectorized step per tick of the simulation clock, instead of
+    running one MovingBehaviour per agent. The points of the active paths are kept in one array with a cursor
+    per agent, so the position of a moving agent is read from that array.
+
+    Like the period of its MovingBehaviour, every agent waits at each point the time the last leg took at its
+    current speed. The agents whose next point is due at a tick move together: their cursors, the lengths of
+    their legs and their animation speeds are computed with array operations, and the time a point was due
+    before the tick is carried over to the next leg, so the travel times do not drift with the tick. The agents
+    are only called back (with set_position) when they arrive to their destination or, while they watch their
+    movement (e.g. a transport informing the customers on board of its location), at every step. Their speed
+    and whether they watch their movement are updated with ``refresh`` when they change.
+
+    Attributes:
+        tick (float): simulated seconds between steps
+    """
+
+    _SLOT_ARRAYS = ("_cursor", "_end", "_due", "_speed", "_animation", "_watched")
+
+    def __init__(self, tick=1):
+        self.tick = tick
+        self._points = np.empty((INITIAL_CAPACITY, 2), dtype=np.float64)
+        self._size = 0
+        self._cursor = np.empty(INITIAL_CAPACITY, dtype=np.int64)
+        self._end = np.empty(INITIAL_CAPACITY, dtype=np.int64)
+        # simulated time at which every agent moves to its next point
+        self._due = np.empty(INITIAL_CAPACITY, dtype=np.float64)
+        self._speed = np.empty(INITIAL_CAPACITY, dtype=np.float64)
+        self._animation = np.empty(INITIAL_CAPACITY, dtype=np.float64)
+        self._watched = np.empty(INITIAL_CAPACITY, dtype=bool)
+        self._agents = []
+        self._slots = {}
+        self._task = None
+
+    def add(self, agent, chunked_path):
+        """
+        Starts moving an agent along a path from its current position. A path that the agent was still
+        following is replaced. The first step is taken at the next tick.
+
+        Args:
+            agent (MovableMixin): the agent to move
+            chunked_path (CompactPath): the points of the path, one per second of travel
+        """
+        origin = agent.get_position()
+        if agent in self._slots:
+            self._remove(self._slots[agent])
+        points = chunked_path.remaining()
+        self._reserve_points(len(points) + 1)
+        start = self._size
+        self._points[start] = origin
+        self._points[start + 1:start + 1 + len(points)] = points
+        self._size += len(points) + 1
+
+        slot = len(self._agents)
+        self._reserve_slots(slot + 1)
+        self._cursor[slot] = start
+        self._end[slot] = start + len(points)
+        self._due[slot] = get_clock().time()
+        self._animation[slot] = agent.animation_speed
+        self._agents.append(agent)
+        self._slots[agent] = slot
+        self.refresh(agent)
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    def refresh(self, agent):
+        """
+        Updates the speed of a moving agent and whether it watches its movement, from its next step on.
+
+        Args:
+            agent (MovableMixin): the agent
+        """
+        slot = self._slots.get(agent)
+        if slot is not None:
+            self._speed[slot] = kmh_to_ms(agent.get("speed_in_kmh"))
+            self._watched[slot] = agent.watches_movement()
+
+    def position(self, agent):
+        """
+        Returns the position of a moving agent.
+
+        Args:
+            agent (MovableMixin): the agent
+
+        Returns:
+            list: the coordinates of the agent, or None if it is not moved by the scheduler
+        """
+        slot = self._slots.get(agent)
+        if slot is None:
+            return None
+        return self._points[self._cursor[slot]].tolist()
+
+    def animation_speed(self, agent):
+        """
+        Returns the time a moving agent takes to travel its last leg.
+
+        Args:
+            agent (MovableMixin): the agent
+
+        Returns:
+            float: the time in milliseconds, or None if the agent is not moved by the scheduler
+        """
+        slot = self._slots.get(agent)
+        if slot is None:
+            return None
+        return float(self._animation[slot])
+
+    def __len__(self):
+        return len(self._agents)
+
+    async def step(self):
+        """
+        Moves the agents whose next point is due to it, and calls back the ones that arrive to their
+        destination and the ones that watch their movement.
+        """
+        n = len(self._agents)
+        if not n:
+            return
+        now = get_clock().time()
+        # every agent moves at the tick closest to the time its next point is due
+        ready = np.flatnonzero(self._due[:n] < now + self.tick / 2)
+        if not len(ready):
+            return
+        previous = self._cursor[ready]
+        cursor = np.minimum(previous + 1, self._end[ready])
+        self._cursor[ready] = cursor
+        seconds = pairwise_distances(self._points[previous], self._points[cursor]) / self._speed[ready]
+        self._animation[ready] = seconds * ONESECOND_IN_MS
+        # an agent that fell behind by more than a tick does not catch up with several steps in a row
+        self._due[ready] = np.maximum(self._due[ready], now - self.tick) + seconds
+
+        arrived = cursor == self._end[ready]
+        watched = [
+            (self._agents[slot], self._points[self._cursor[slot]].tolist())
+            for slot in ready[~arrived & self._watched[ready]].tolist()
+        ]
+        arrivals = [self._agents[slot] for slot in ready[arrived].tolist()]
+        arrivals = [(agent, self.position(agent)) for agent in arrivals]
+        for agent, _ in arrivals:
+            self._remove(self._slots[agent])
+
+        for agent, position in watched:
+            await agent.set_position(position)
+        for agent, position in arrivals:
+            await agent.set_position(position)
+            if agent not in self._slots:
+                agent.set("path", None)
+                agent.chunked_path = None
+
+    def stop(self):
+        """
+        Stops moving the agents.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while self._agents:
+            await get_clock().sleep(self.tick)
+            try:
+                await self.step()
+            except Exception as e:
+                logger.error("Exception moving the agents: {}".format(e))
+
+    def _remove(self, slot):
+        # the last agent takes the place of the removed one, so that the active slots stay contiguous
+        agent = self._agents[slot]
+        position = self._points[self._cursor[slot]].tolist()
+        animation_speed = float(self._animation[slot])
+        last = len(self._agents) - 1
+        if slot != last:
+            moved = self._agents[last]
+            self._agents[slot] = moved
+            self._slots[moved] = slot
+            for name in self._SLOT_ARRAYS:
+                array = getattr(self, name)
+                array[slot] = array[last]
+        self._agents.pop()
+        del self._slots[agent]
+        agent.set("current_pos", position)
+        agent.animation_speed = animation_speed
+
+    def _reserve_slots(self, size):
+        if size > len(self._cursor):
+            capacity = 2 * size
+            for name in self._SLOT_ARRAYS:
+                array = getattr(self, name)
+                grown = np.empty(capacity, dtype=array.dtype)
+                grown[:len(array)] = array
+                setattr(self, name, grown)
+
+    def _reserve_points(self, size):
+        if self._size + size <= len(self._points):
+            return
+        # drop the points already travelled and the paths of the agents that are not moving anymore
+        n = len(self._agents)
+        lengths = self._end[:n] - self._cursor[:n] + 1
+        live = int(lengths.sum())
+        points = np.empty((max(2 * (live + size), INITIAL_CAPACITY), 2), dtype=np.float64)
+        offset = 0
+        for slot in range(n):
+            start, stop = self._cursor[slot], self._end[slot] + 1
+            points[offset:offset + stop - start] = self._points[start:stop]
+            self._cursor[slot] = offset
+            self._end[slot] = offset + stop - start - 1
+            offset += stop - start
+        self._points = points
+        self._size = offset
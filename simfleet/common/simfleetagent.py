@@ -1,11 +1,11 @@
 import time
-import asyncio
 
 from loguru import logger
 from spade.agent import Agent
 from collections import defaultdict
 from spade.message import Message
 
+from simfleet.utils.clock import get_clock
 from simfleet.utils.statistics import StatisticsStore
 
 class SimfleetAgent(Agent):
@@ -82,12 +82,12 @@ class SimfleetAgent(Agent):
 
     async def sleep(self, seconds):
         """
-            Pauses the agent’s operation for a specified duration.
+            Pauses the agent’s operation for a specified duration of simulated time.
 
             Args:
-                seconds (int): The duration in seconds for which the agent should pause.
+                seconds (int): The duration in simulated seconds for which the agent should pause.
         """
-        await asyncio.sleep(seconds)
+        await get_clock().sleep(seconds)
         #time.sleep(seconds)
 
 
@@ -149,7 +149,7 @@ class SimfleetAgent(Agent):
             Args:
                 msg (spade.message.Message): The message to be sent.
         """
-        if not msg.sender:
+        if not msg.sender or not str(msg.sender):
             msg.sender = str(self.jid)
             logger.debug(f"Adding agent's jid as sender to message: {msg}")
         await self.container.send(msg, self)
@@ -0,0 +1,199 @@
+"""
+Spatial index module
+
+A grid index over the positions of the agents (stations, stops, fleet managers...) that answers
+k-nearest and radius queries visiting only the cells around the query point, instead of computing
+the distance to every agent.
+"""
+
+import math
+
+import numpy as np
+
+from simfleet.utils.distance import distances_from
+
+DEFAULT_CELL_SIZE = 500
+METERS_PER_DEGREE = 111320.0
+# The cells are laid out on an equirectangular projection, which slightly distorts the distances
+# far from its reference latitude; the search goes on until the rings are this much farther away.
+PROJECTION_SLACK = 0.9
+
+
+class SpatialIndex:
+    """
+    A grid of square cells (``cell_size`` meters wide on an equirectangular projection) with the
+    keys of the agents whose position falls in each cell.
+
+    The index is updated incrementally: ``insert`` and ``remove`` touch a single cell, and ``sync``
+    applies to the index only the differences with a new answer of the directory.
+
+    Attributes:
+        cell_size (float): width of the cells in meters
+    """
+
+    def __init__(self, cell_size=DEFAULT_CELL_SIZE):
+        self.cell_size = cell_size
+        self._positions = {}
+        self._cell_of = {}
+        self._cells = {}
+        self._bounds = None
+        self._reference = None
+
+    def _cell(self, position):
+        if self._reference is None:
+            self._reference = math.cos(math.radians(position[0]))
+        x = position[1] * METERS_PER_DEGREE * self._reference
+        y = position[0] * METERS_PER_DEGREE
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def insert(self, key, position):
+        """
+        Adds an agent to the index or moves it to a new position.
+
+        Args:
+            key (str): the key of the agent
+            position (list): the position (latitude, longitude) of the agent
+        """
+        position = (float(position[0]), float(position[1]))
+        if self._positions.get(key) == position:
+            return
+        self.remove(key)
+        cell = self._cell(position)
+        self._positions[key] = position
+        self._cell_of[key] = cell
+        if cell not in self._cells:
+            self._cells[cell] = set()
+            self._bounds = None
+        self._cells[cell].add(key)
+
+    def remove(self, key):
+        """
+        Removes an agent from the index (if it is indexed).
+
+        Args:
+            key (str): the key of the agent
+        """
+        cell = self._cell_of.pop(key, None)
+        if cell is None:
+            return
+        del self._positions[key]
+        keys = self._cells[cell]
+        keys.discard(key)
+        if not keys:
+            del self._cells[cell]
+            self._bounds = None
+
+    def sync(self, agents):
+        """
+        Updates the index with the agents of a directory answer: new agents are inserted, moved
+        agents are updated and the agents that are no longer in the answer are removed.
+
+        Args:
+            agents (dict): the agents, with their position under the ``position`` key
+        """
+        for key in [key for key in self._positions if key not in agents]:
+            self.remove(key)
+        for key, agent in agents.items():
+            self.insert(key, agent["position"])
+
+    def position(self, key):
+        """
+        Returns the indexed position of an agent.
+
+        Args:
+            key (str): the key of the agent
+
+        Returns:
+            list: the position (latitude, longitude), or None if the agent is not indexed
+        """
+        position = self._positions.get(key)
+        return list(position) if position is not None else None
+
+    def _ring(self, center, radius):
+        # the cells at a Chebyshev distance of radius from the center, inside the occupied bounds
+        cx, cy = center
+        (min_x, min_y), (max_x, max_y) = self._occupied_bounds()
+        ys = range(max(cy - radius, min_y), min(cy + radius, max_y) + 1)
+        for x in sorted({cx - radius, cx + radius}):
+            if min_x <= x <= max_x:
+                for y in ys:
+                    yield x, y
+        xs = range(max(cx - radius + 1, min_x), min(cx + radius - 1, max_x) + 1)
+        for y in sorted({cy - radius, cy + radius}):
+            if min_y <= y <= max_y:
+                for x in xs:
+                    yield x, y
+
+    def _occupied_bounds(self):
+        if self._bounds is None:
+            cells = np.array(list(self._cells.keys()))
+            self._bounds = cells.min(axis=0).tolist(), cells.max(axis=0).tolist()
+        return self._bounds
+
+    def _first_ring(self, center):
+        # the rings closer to the center than the occupied bounds are empty
+        (min_x, min_y), (max_x, max_y) = self._occupied_bounds()
+        return max(min_x - center[0], center[0] - max_x, min_y - center[1], center[1] - max_y, 0)
+
+    def _max_ring(self, center):
+        (min_x, min_y), (max_x, max_y) = self._occupied_bounds()
+        return max(center[0] - min_x, max_x - center[0], center[1] - min_y, max_y - center[1], 0)
+
+    def _measure(self, position, keys):
+        keys = list(keys)
+        distances = distances_from(position, [self._positions[key] for key in keys])
+        return sorted(zip(keys, distances.tolist()), key=lambda item: item[1])
+
+    def nearest(self, position, k=1):
+        """
+        Returns the k agents closest to a position.
+
+        Args:
+            position (list): the position (latitude, longitude)
+            k (int): the number of agents
+
+        Returns:
+            list: up to k tuples (key, distance in meters) sorted by distance
+        """
+        if not self._positions or k < 1:
+            return []
+        center = self._cell(position)
+        max_ring = self._max_ring(center)
+        candidates = []
+        for radius in range(self._first_ring(center), max_ring + 1):
+            for cell in self._ring(center, radius):
+                candidates.extend(self._cells.get(cell, ()))
+            if len(candidates) >= k:
+                nearest = self._measure(position, candidates)[:k]
+                if nearest[-1][1] <= radius * self.cell_size * PROJECTION_SLACK:
+                    return nearest
+        return self._measure(position, candidates)[:k]
+
+    def within(self, position, radius):
+        """
+        Returns the agents closer to a position than a radius.
+
+        Args:
+            position (list): the position (latitude, longitude)
+            radius (float): the radius in meters
+
+        Returns:
+            list: tuples (key, distance in meters) sorted by distance
+        """
+        if not self._positions:
+            return []
+        center = self._cell(position)
+        rings = min(
+            math.ceil(radius / (self.cell_size * PROJECTION_SLACK)) + 1, self._max_ring(center)
+        )
+        candidates = []
+        for ring in range(self._first_ring(center), rings + 1):
+            for cell in self._ring(center, ring):
+                candidates.extend(self._cells.get(cell, ()))
+        return [item for item in self._measure(position, candidates) if item[1] <= radius]
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, key):
+        return key in self._positions
@@ -15,3 +15,4 @@ REFUSE_PERFORMATIVE = "refuse"
 PROPOSE_PERFORMATIVE = "propose"
 CANCEL_PERFORMATIVE = "cancel"
 INFORM_PERFORMATIVE = "inform"
+NOT_MODIFIED_PERFORMATIVE = "not-modified"
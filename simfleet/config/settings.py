@@ -2,7 +2,7 @@ import json
 from loguru import logger
 
 from simfleet.utils.reflection import load_class
-from simfleet.utils.helpers import get_bbox_from_location
+from simfleet.utils.geocoding import DEFAULT_GEOCODE_CACHE, GeocodeCache, resolve_location
 
 def hide_passwords(item, key=None):
     if isinstance(item, dict):
@@ -23,11 +23,15 @@ class SimfleetConfig(object):
     A scenario object reads a file with a JSON representation of a scenario and is used to create the participant agents.
     """
 
-    def __init__(self, filename=None, name=None, max_time=None, verbose=None):
+    def __init__(
+        self, filename=None, name=None, max_time=None, verbose=None, time_factor=None, engine=None
+    ):
         """
         The SimfleetConfig constructor reads the JSON file and sets.
         Args:
             filename (str): the name of the scenario file
+            time_factor (float): the speed-up of the simulation time, which overrides the scenario's
+            engine (str): the simulation engine ("realtime" or "des"), which overrides the scenario's
         """
 
         self.__config = dict()
@@ -47,29 +51,23 @@ class SimfleetConfig(object):
         self.__config["simulation_name"] = self.__config.get("simulation_name", name)
         self.__config["max_time"] = self.__config.get("max_time", max_time)
         self.__config["verbose"] = self.__config.get("verbose", verbose)
+        self.__config["time_factor"] = time_factor or self.__config.get("time_factor", 1)
+        self.__config["engine"] = engine or self.__config.get("engine", "realtime")
         self.__config["simulation_password"] = self.__config.get("simulation_password", "secret")
 
-        #New coords
-        if self.__config.get("coords"):
-            if self.__config.get("zoom"):
-                input_location = get_bbox_from_location(self.__config["coords"], self.__config["zoom"])
-                logger.debug(
-                    "BoundingBox for {} is {}".format(self.__config["coords"], input_location[1])
-                )
-                self.__config["coords"] = input_location
-            else:
+        # The location (a place name, a [lat, lon] point and/or an explicit "bbox") is only
+        # resolved to (central_point, bbox) when the coords are first used
+        self.__config["bbox"] = self.__config.get("bbox")
+        if self.__config.get("coords") or self.__config["bbox"]:
+            if not self.__config.get("zoom"):
                 logger.debug("Default value 12 for Zoom variable")
-                input_location = get_bbox_from_location(self.__config["coords"], 12)
-                self.__config["zoom"] = 12
-                self.__config["coords"] = input_location
+            self.__config["zoom"] = self.__config.get("zoom") or 12
         else:
-            #raise Exception("Could not find coordinates for the entered location")
-            logger.debug(
-                "Could not find coordinates for the entered location. Default coordinates: Valencia, ES"
-            )
-            default_location = get_bbox_from_location("Valencia, ES", 11.75)
+            logger.debug("No location in the config. Default coordinates: Valencia, ES")
+            self.__config["coords"] = "Valencia, ES"
             self.__config["zoom"] = self.__config.get("zoom", 11.75)
-            self.__config["coords"] = default_location
+        self.__config["coords"] = self.__config.get("coords")
+        self.__config["geocode_cache"] = self.__config.get("geocode_cache", DEFAULT_GEOCODE_CACHE)
 
         #self.__config["coords"] = self.__config.get("coords", [39.47, -0.37])
         #self.__config["zoom"] = self.__config.get("zoom", 12)
@@ -112,6 +110,33 @@ class SimfleetConfig(object):
             #"route_host", "http://router.project-osrm.org/"
             "route_host", "http://osrm.gti-ia.upv.es/"
         )
+        self.__config["route_balancing"] = self.__config.get("route_balancing", "round_robin")
+        self.__config["route_retry_interval"] = self.__config.get("route_retry_interval", 10)
+        self.__config["route_backend"] = self.__config.get("route_backend", "osrm")
+        self.__config["route_graph"] = self.__config.get("route_graph")
+        self.__config["route_record"] = self.__config.get("route_record")
+        self.__config["route_replay"] = self.__config.get("route_replay")
+        self.__config["route_replay_latency"] = self.__config.get("route_replay_latency", 0)
+        self.__config["route_max_connections"] = self.__config.get(
+            "route_max_connections", 100
+        )
+        self.__config["route_timeout"] = self.__config.get("route_timeout", 10)
+        self.__config["route_max_inflight"] = self.__config.get("route_max_inflight", 64)
+        self.__config["route_rate_limit"] = self.__config.get("route_rate_limit")
+        self.__config["route_backoff_base"] = self.__config.get("route_backoff_base", 0.5)
+        self.__config["route_backoff_max"] = self.__config.get("route_backoff_max", 10)
+        self.__config["route_cache_size"] = self.__config.get("route_cache_size", 10000)
+        self.__config["route_cache_precision"] = self.__config.get(
+            "route_cache_precision", 5
+        )
+        self.__config["route_cache_file"] = self.__config.get("route_cache_file")
+        self.__config["route_prewarm"] = self.__config.get("route_prewarm", False)
+        self.__config["route_prewarm_workers"] = self.__config.get(
+            "route_prewarm_workers", 16
+        )
+        self.__config["distance_method"] = self.__config.get("distance_method", "haversine")
+        self.__config["path_dtype"] = self.__config.get("path_dtype", "float64")
+        self.__config["movement_scheduler"] = self.__config.get("movement_scheduler", False)
         self.__config["route_name"] = self.__config.get("route_name", "route")
         self.__config["route_password"] = self.__config.get(
             "route_passwd", "route_passwd"
@@ -127,6 +152,7 @@ class SimfleetConfig(object):
         self.__config["xmpp_port"] = self.__config.get("xmpp_port", 5222)
         self.__config["http_port"] = self.__config.get("http_port", 9000)
         self.__config["http_ip"] = self.__config.get("http_ip", "127.0.0.1")
+        self.__config["stream_frame_rate"] = self.__config.get("stream_frame_rate", 10)
 
         logger.debug("Config loaded: {}".format(self))
 
@@ -135,6 +161,27 @@ class SimfleetConfig(object):
             logger.info("Reading config {}".format(filename))
             self.__config.update(json.load(f))
 
+    @property
+    def coords(self):
+        """
+        Returns the central point and the bounding box of the scenario, geocoding its location the
+        first time they are needed.
+
+        Returns:
+            tuple: (central_point, bbox)
+        """
+        coords = self.__config["coords"]
+        if not isinstance(coords, tuple):
+            coords = resolve_location(
+                coords,
+                self.__config["zoom"],
+                bbox=self.__config["bbox"],
+                cache=GeocodeCache(self.__config["geocode_cache"]),
+            )
+            logger.debug("BoundingBox for {} is {}".format(self.__config["coords"], coords[1]))
+            self.__config["coords"] = coords
+        return coords
+
     @property
     def num_managers(self):
         try:
@@ -187,6 +234,8 @@ class SimfleetConfig(object):
             return 0
 
     def __getitem__(self, item):
+        if item == "coords":
+            return self.coords
         return self.__config[item]
 
     def __getattr__(self, item):
@@ -3,15 +3,15 @@ import io
 import json
 import threading
 import time
-from datetime import datetime
 from pathlib import Path
 from typing import List
 
 import faker
+import numpy as np
 from aiohttp import web as aioweb
 from loguru import logger
 from spade.agent import Agent
-from spade.behaviour import TimeoutBehaviour, OneShotBehaviour, CyclicBehaviour
+from spade.behaviour import OneShotBehaviour, CyclicBehaviour
 from spade.template import Template
 from spade.message import Message
 
@@ -22,6 +22,20 @@ from simfleet.common.agents.factory.create import StationFactory
 from simfleet.common.agents.factory.create import TransportFactory
 from simfleet.common.agents.factory.create import VehicleFactory
 from simfleet.common.agents.factory.create import TransportStopFactory
+from simfleet.common.mixins.movable import MovementScheduler, set_movement_scheduler
+from simfleet.utils.clock import SimulationClock, set_clock
+from simfleet.utils.compactpath import set_default_dtype as set_path_dtype
+from simfleet.utils.des import DES_ENGINE
+from simfleet.utils.distance import haversine_in_meters, set_distance_method
+from simfleet.utils.entities import EntityStream, EntityTracker
+from simfleet.utils.routing import (
+    PositionPool,
+    RouteCache,
+    RouteClient,
+    RouteLimiter,
+    create_route_backend,
+    prewarm_routes,
+)
 from simfleet.utils.routing import request_path as async_request_path
 
 from simfleet.config.settings import set_default_strategies, set_default_metrics
@@ -102,9 +116,59 @@ class SimulatorAgent(Agent):
 
         self.metrics_class = set_default_metrics(config.mobility_metrics)
 
-        self.route_host = config.route_host
+        set_path_dtype(config.path_dtype)
+        set_distance_method(config.distance_method)
+        if config.engine == DES_ENGINE:
+            # the virtual clock of the discrete-event loop already skips the idle time
+            self.clock = SimulationClock(timer=self.loop.time)
+            logger.info("Running the simulation on the discrete-event engine")
+        else:
+            self.clock = SimulationClock(config.time_factor)
+            if self.clock.time_factor != 1:
+                logger.info("Simulation time runs {}x faster than real time".format(self.clock.time_factor))
+        set_clock(self.clock)
+        self.movement_scheduler = MovementScheduler() if config.movement_scheduler else None
+        set_movement_scheduler(self.movement_scheduler)
+        # agents use a single route server for the queries not sent through the route client
+        self.route_host = (
+            config.route_host if isinstance(config.route_host, str) else config.route_host[0]
+        )
+        self.route_client = RouteClient(
+            backend=create_route_backend(
+                config.route_backend,
+                route_host=config.route_host,
+                route_graph=config.route_graph,
+                max_connections_per_host=config.route_max_connections,
+                timeout=config.route_timeout,
+                record=config.route_record,
+                replay=config.route_replay,
+                replay_latency=config.route_replay_latency,
+                balancing=config.route_balancing,
+                retry_interval=config.route_retry_interval,
+            ),
+            cache=RouteCache(
+                max_size=config.route_cache_size,
+                precision=config.route_cache_precision,
+                filename=config.route_cache_file,
+            ),
+            matrix_cache=RouteCache(
+                max_size=config.route_cache_size,
+                precision=config.route_cache_precision,
+                filename=config.route_cache_file,
+                table="matrix",
+            ),
+            limiter=RouteLimiter(
+                max_inflight=config.route_max_inflight,
+                rate_limit=config.route_rate_limit,
+            ),
+            backoff_base=config.route_backoff_base,
+            backoff_max=config.route_backoff_max,
+            position_pool=PositionPool(filename=config.route_cache_file),
+        )
 
         self.clear_agents()
+        self.entity_tracker = EntityTracker()
+        self.entity_stream = EntityStream(self.get_entities, frame_rate=config.stream_frame_rate)
 
         self.base_path = Path(__file__).resolve().parent
 
@@ -130,6 +194,8 @@ class SimulatorAgent(Agent):
         self.web.add_get("/app", self.index_controller, "index.html")
         self.web.add_get("/init", self.init_controller, None)
         self.web.add_get("/entities", self.entities_controller, None)
+        self.web.add_get("/entities/stream", self.entity_stream.handle, None, raw=True)
+        self.web.add_get("/routing", self.routing_controller, None)
         self.web.add_get("/run", self.run_controller, None)
         self.web.add_get("/stop", self.stop_agents_controller, None)
 
@@ -139,23 +205,30 @@ class SimulatorAgent(Agent):
 
         self.web.app.router.add_static("/assets", str(self.template_path / "assets"))
 
-        self.web.start(
-            hostname=self.config.http_ip,
-            port=self.config.http_port,
-            templates_path=str(self.template_path),
-        )
-        logger.info(
-            "Web interface running at http://{}:{}/app".format(
-                self.config.http_ip, self.config.http_port
+        if self.config.engine != DES_ENGINE:
+            self.web.start(
+                hostname=self.config.http_ip,
+                port=self.config.http_port,
+                templates_path=str(self.template_path),
+            )
+            logger.info(
+                "Web interface running at http://{}:{}/app".format(
+                    self.config.http_ip, self.config.http_port
+                )
             )
-        )
 
         await self.create_directory_agent(
             name=self.config.directory_name, password=self.config.directory_password
         )
 
+        if not await self.route_client.check_health():
+            logger.error("None of the route servers is reachable")
+
         await self.load_scenario()
 
+        if self.config.route_prewarm:
+            await self.prewarm_routes()
+
         # Comunication template
         template = Template()
         template.set_metadata("protocol", COORDINATION_PROTOCOL)
@@ -231,9 +304,86 @@ class SimulatorAgent(Agent):
         except Exception as e:
             logger.exception("EXCEPTION creating Stop agents batch {}".format(e))
 
+        await self.resolve_random_positions()
+
         assert all([asyncio.iscoroutine(x) for x in all_agents])
         await self.gather_batch(all_agents)
 
+    async def resolve_random_positions(self):
+        """
+        Draws the random positions deferred by the agents of the scenario, snapping all the positions
+        of each bounding box to the road network in a single concurrent batch.
+        """
+        pending = {}
+        for agents in (
+            self.transport_agents,
+            self.customer_agents,
+            self.station_agents,
+            self.vehicle_agents,
+            self.bus_stop_agents,
+        ):
+            for agent in agents.values():
+                for setter in agent.deferred_positions:
+                    pending.setdefault(tuple(agent.boundingbox), []).append(setter)
+                agent.deferred_positions = []
+        if not pending:
+            return
+
+        start = time.time()
+        count = 0
+        for bbox, setters in pending.items():
+            positions = await self.route_client.random_positions(list(bbox), len(setters))
+            for setter, position in zip(setters, positions):
+                setter(position)
+            count += len(setters)
+        logger.info(
+            "Drew {} random positions in {:.2f} seconds".format(count, time.time() - start)
+        )
+
+    async def prewarm_routes(self):
+        """
+        Fills the route cache with the routes that the agents of the scenario are likely to request
+        when the simulation starts: the trip of every customer (origin to destination) and the leg
+        from every transport to its nearest station.
+        """
+        pairs = [
+            (customer.get_position(), customer.get_target_position())
+            for customer in self.customer_agents.values()
+        ]
+        stations = [
+            station.get_position()
+            for station in self.station_agents.values()
+            if station.get_position() is not None
+        ]
+        if stations:
+            station_coords = np.array(stations, dtype=float)
+            for transport in self.transport_agents.values():
+                position = transport.get_position()
+                if position is None:
+                    continue
+                distances = haversine_in_meters(
+                    position[0], position[1], station_coords[:, 0], station_coords[:, 1]
+                )
+                pairs.append((position, stations[int(distances.argmin())]))
+
+        logger.info("Prewarming {} routes...".format(len(pairs)))
+        cache_size = len(self.route_client.cache) if self.route_client.cache is not None else 0
+        stats = await prewarm_routes(
+            self.route_client, pairs, concurrency=self.config.route_prewarm_workers
+        )
+        new_cache_size = len(self.route_client.cache) if self.route_client.cache is not None else 0
+        logger.success(
+            "Prewarmed {} of {} routes in {} seconds ({} failed). Route cache: {} -> {} routes".format(
+                stats["found"],
+                stats["routes"],
+                stats["seconds"],
+                stats["failed"],
+                cache_size,
+                new_cache_size,
+            )
+        )
+        return stats
+
     async def gather_batch(self, all_coroutines):
         agents_batch = 20
         number = max(len(all_coroutines), 0)
@@ -557,16 +707,11 @@ class SimulatorAgent(Agent):
                         #    )
 
                     self.agent.simulation_running = True
-                    self.agent.simulation_init_time = time.time()
+                    self.agent.simulation_init_time = self.agent.clock.time()
 
                     for delay in self.agent.delayed_launch_agents:
                         agents = self.agent.delayed_launch_agents[delay]
-                        start_time = datetime.fromtimestamp(
-                            self.agent.simulation_init_time + delay
-                        )
-                        self.agent.add_behaviour(
-                            DelayedLaunchBehaviour(agents, start_at=start_time)
-                        )
+                        self.agent.add_behaviour(DelayedLaunchBehaviour(agents, delay))
 
                     logger.success("Simulation started.")
 
@@ -589,13 +734,21 @@ class SimulatorAgent(Agent):
             "Terminating... ({0:.1f} seconds elapsed)".format(self.simulation_time)
         )
 
-        coroutines = await self.stop_agents()
+        try:
+            coroutines = await self.stop_agents()
 
-        await asyncio.gather(*coroutines)
+            await asyncio.gather(*coroutines)
 
-        await self.generate_metrics()
+            await self.generate_metrics()
+        finally:
+            # the route cache batches its writes, so it is always flushed, even if the metrics fail
+            if self.movement_scheduler is not None:
+                self.movement_scheduler.stop()
+            self.entity_stream.stop()
+            logger.info("Route client stats: {}".format(self.get_route_stats()))
+            await self.route_client.close()
 
-        await super().stop()
+            await super().stop()
 
     async def generate_metrics(self):
 
@@ -754,6 +907,13 @@ class SimulatorAgent(Agent):
         """
         Web controller that returns a dict with the entities of the simulator and their statuses.
 
+        The response carries the ``version`` of the entities. A client that passes the last version it
+        received in the ``since`` query parameter (``/entities?since=42``) only receives the agents whose
+        position, status or path changed since then (without their path if it did not change), the ids of
+        the removed agents in ``removed`` and the tree only if an agent was added or removed. Without
+        ``since``, or if the version is too old, the response is the full snapshot (``"full": true``).
+        The same changes are pushed as Server-Sent Events to the clients subscribed to ``/entities/stream``.
+
         Example of the entities returned data::
 
             {
@@ -806,6 +966,8 @@ class SimulatorAgent(Agent):
                     ]
                 },
                 "authenticated": False,
+                "version": 42,
+                "full": True,
                 "stations": [
                     {
                         "status": 24,
@@ -816,31 +978,48 @@ class SimulatorAgent(Agent):
             }
 
         Returns:
-            dict:  no template is returned since this is an AJAX controller, a dict with the list of transports, the list of customers, the tree view to be showed in the sidebar and the stats of the simulation.
+            dict:  no template is returned since this is an AJAX controller, a dict with the list of transports, the list of customers, the tree view to be showed in the sidebar, the stats of the simulation and the version of the entities.
         """
-        result = {
-            "transports": [
-                transport.to_json()
-                for transport in self.transport_agents.values()
-                if transport.is_launched
-            ],
-            "customers": [
-                customer.to_json()
-                for customer in self.customer_agents.values()
-                if customer.is_launched
-            ],
-            "vehicles": [
-                vehicle.to_json()
-                for vehicle in self.vehicle_agents.values()
-                if vehicle.is_launched
-            ],
-            "tree": self.generate_tree(),
-            "stats": self.get_stats(),
-            "stations": [station.to_json() for station in self.station_agents.values()]
-            + [stop.to_json() for stop in self.bus_stop_agents.values()],
+        try:
+            since = int(request.query["since"])
+        except (KeyError, ValueError):
+            since = None
+        return self.get_entities(since)
+
+    def get_entities(self, since=None):
+        """
+        Returns the entities of the simulator and their statuses (see ``entities_controller``), the ones that
+        changed after a version or the full snapshot.
+
+        Args:
+            since (int): the last version of the entities known by the client, or None for a full snapshot
+
+        Returns:
+            dict: the entities, the tree (if needed), the stats and the version
+        """
+        groups = {
+            "transports": [t for t in self.transport_agents.values() if t.is_launched],
+            "customers": [c for c in self.customer_agents.values() if c.is_launched],
+            "vehicles": [v for v in self.vehicle_agents.values() if v.is_launched],
+            "stations": list(self.station_agents.values()) + list(self.bus_stop_agents.values()),
             # Bus line
             # "stops": [stop.to_json() for stop in self.bus_stop_agents.values()],
         }
+        tracker = self.entity_tracker
+        tracker.update(groups)
+        result = tracker.delta(since) if since is not None else None
+        if result is None:
+            result = tracker.snapshot()
+            result["full"] = True
+            result["tree"] = self.generate_tree()
+        else:
+            result["full"] = False
+            if tracker.members_version > since:
+                result["tree"] = self.generate_tree()
+        for group in groups:
+            result.setdefault(group, [])
+        result["version"] = tracker.version
+        result["stats"] = self.get_stats()
         return result
 
     def generate_tree(self):
@@ -931,6 +1110,26 @@ class SimulatorAgent(Agent):
             "is_running": self.simulation_running,
         }
 
+    async def routing_controller(self, request):
+        """
+        Web controller that returns the instrumentation of the routing layer.
+
+        Returns:
+            dict: the stats returned by ``get_route_stats``
+        """
+        return self.get_route_stats()
+
+    def get_route_stats(self):
+        """
+        Returns the instrumentation of the routing layer: latency percentiles, requests per second,
+        failures by type, retries and bytes received from the route backend, and the stats of the
+        limiter and the caches.
+
+        Returns:
+            dict: the stats of the route client of the simulator
+        """
+        return self.route_client.stats()
+
     async def run_controller(self, request):
         """
         Web controller that starts the simulator.
@@ -1103,6 +1302,7 @@ class SimulatorAgent(Agent):
             domain=self.jid.domain,
             jid_directory=self.get_directory().jid,
             route_host=self.route_host,
+            route_client=self.route_client,
             bbox=self.config.coords[1],
             name=name,
             password=password,
@@ -1154,6 +1354,7 @@ class SimulatorAgent(Agent):
             jid_directory=self.get_directory().jid,
             fleet_type=fleet_type,
             route_host=self.route_host,
+            route_client=self.route_client,
             bbox=self.config.coords[1],
             position=position,
             speed=speed,
@@ -1185,6 +1386,7 @@ class SimulatorAgent(Agent):
             strategy=strategy,
             jid_directory=self.get_directory().jid,
             route_host=self.route_host,
+            route_client=self.route_client,
             bbox=self.config.coords[1],
             position=position,
             services=services,
@@ -1220,6 +1422,7 @@ class SimulatorAgent(Agent):
             bbox=self.config.coords[1],
             fleet_type=fleet_type,
             route_host=self.route_host,
+            route_client=self.route_client,
             position=position,
             speed=speed,
             target=target,
@@ -1269,6 +1472,7 @@ class SimulatorAgent(Agent):
             strategy=strategy,
             jid_directory=self.get_directory().jid,
             route_host=self.route_host,
+            route_client=self.route_client,
             bbox=self.config.coords[1],
             position=position,
             services=services,
@@ -1354,7 +1558,7 @@ class SimulatorAgent(Agent):
 
     def get_simulation_time(self):
         """
-        Returns the elapsed simulation time to the current time.
+        Returns the elapsed simulation time (in simulated seconds) to the current time.
         If the simulation is not started it returns 0.
 
         Returns:
@@ -1364,7 +1568,7 @@ class SimulatorAgent(Agent):
             self.simulation_init_time = 0
             return 0
         if self.simulation_running:
-            return time.time() - self.simulation_init_time
+            return self.clock.time() - self.simulation_init_time
         return self.simulation_time
 
     def request_path(self, origin, destination):
@@ -1381,12 +1585,17 @@ class SimulatorAgent(Agent):
         return async_request_path(self, origin, destination, self.route_host)
 
 
-class DelayedLaunchBehaviour(TimeoutBehaviour):
-    def __init__(self, agents, *args, **kwargs):
+class DelayedLaunchBehaviour(OneShotBehaviour):
+    """
+    Starts a group of agents after a delay (in simulated seconds) since the simulation started.
+    """
+    def __init__(self, agents, delay):
         self.agents = agents
-        super().__init__(*args, **kwargs)
+        self.delay = delay
+        super().__init__()
 
     async def run(self):
+        await self.agent.clock.sleep(self.delay)
         for agent in self.agents:
             agent.is_launched = True
             await agent.start()
@@ -1407,11 +1616,13 @@ class CoordinationBehaviour(CyclicBehaviour):
     async def run(self):
 
         msg = await self.receive(timeout=5)
-        logger.warning(
-            "Agent[{}]: The agent has a mailbox size of ({})".format(
-                self.agent.name, self.mailbox_size()
+        if self.mailbox_size() > 0:
+            # only the messages that pile up faster than they are handled are worth a warning
+            logger.warning(
+                "Agent[{}]: The agent has a mailbox size of ({})".format(
+                    self.agent.name, self.mailbox_size()
+                )
             )
-        )
         if msg:
             performative = msg.get_metadata("performative")
             agent_id = msg.sender
@@ -25,15 +25,20 @@ new Vue({
             transportIcon: L.icon({iconUrl: 'assets/img/transport.png', iconSize: [38, 55]}),
             customerIcon: L.icon({iconUrl: 'assets/img/customer.png', iconSize: [38, 40]}),
             stationIcon: L.icon({iconUrl: 'assets/img/station.png', iconSize: [38, 40]}),
-            vehicleIcon: L.icon({ iconUrl: 'assets/img/transport.png', iconSize: [38, 55] })
+            vehicleIcon: L.icon({ iconUrl: 'assets/img/transport.png', iconSize: [38, 55] }),
+            version: null
         }
     },
     mounted() {
         this.init();
-        this.loadEntities();
-        setInterval(function () {
+        if (window.EventSource) {
+            this.subscribeEntities();
+        } else {
             this.loadEntities();
-        }.bind(this), 100);
+            setInterval(function () {
+                this.loadEntities();
+            }.bind(this), 100);
+        }
     },
     methods: {
         init: function () {
@@ -43,19 +48,39 @@ new Vue({
                     this.zoom = data.data.zoom;
                 });
         },
+        subscribeEntities: function () {
+            // the server pushes the changes of the entities (all of them when the stream is opened or reopened)
+            let stream = new EventSource("/entities/stream");
+            stream.onmessage = event => {
+                this.updateEntities(JSON.parse(event.data));
+            };
+        },
         loadEntities: function () {
-            axios.get("/entities")
+            // only the changes since the last version received are sent (all the entities the first time)
+            axios.get("/entities", {params: {since: this.version}})
                 .then(data => {
-                    this.$store.commit('addTransports', data.data.transports);
-                    this.$store.commit('addCustomers', data.data.customers);
-                    this.$store.commit("addStations", data.data.stations);
-                    this.$store.commit("addVehicles", data.data.vehicles);
-                    this.$store.state.total_time = data.data.stats.totaltime;
-                    this.$store.commit('update_simulation_status', data.data.stats);
-                    this.$store.commit("update_tree", data.data.tree);
+                    this.updateEntities(data.data);
                 }).catch(error => {
+                    this.version = null;
             });
         },
+        updateEntities: function (entities) {
+            if (entities.full) {
+                this.$store.commit('clearEntities');
+            } else {
+                this.$store.commit('removeEntities', entities.removed);
+            }
+            this.$store.commit('addTransports', entities.transports);
+            this.$store.commit('addCustomers', entities.customers);
+            this.$store.commit("addStations", entities.stations);
+            this.$store.commit("addVehicles", entities.vehicles);
+            this.$store.state.total_time = entities.stats.totaltime;
+            this.$store.commit('update_simulation_status', entities.stats);
+            if (entities.tree) {
+                this.$store.commit("update_tree", entities.tree);
+            }
+            this.version = entities.version;
+        },
         set_speed: function (event, item) {
             event.target._icon.style[L.DomUtil.TRANSITION] = ('all ' + item.speed + 'ms linear');
         },
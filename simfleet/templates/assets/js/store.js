@@ -13,54 +13,40 @@ export const store = new Vuex.Store({
     },
     mutations: {
         addTransports: (state, payload) => {
-        if (payload.length > 0) {
-            let new_paths = [];
             for (let i = 0; i < payload.length; i++) {
                 update_item_in_collection(state.transports, payload[i], transport_popup);
-
-                // Ahora el path se dibuja siempre que exista, sin depender del estado
-                if (payload[i].path) {
-                    new_paths.push({
-                        latlngs: payload[i].path,
-                        color: "rgb(255, 170, 0)"  // Color naranja para todos los paths
-                    });
-                }
             }
-            state.paths = new_paths;
-        } else {
-            state.transports = [];
-            state.paths = [];
-        }
-    },
+            update_paths(state);
+        },
         addCustomers: (state, payload) => {
-            if (payload.length > 0) {
-                for (let i = 0; i < payload.length; i++) {
-                    update_item_in_collection(state.customers, payload[i], customer_popup);
-                }
-            } else {
-                state.customers = [];
+            for (let i = 0; i < payload.length; i++) {
+                update_item_in_collection(state.customers, payload[i], customer_popup);
             }
         },
         addStations: (state, payload) => {
-            if (payload.length >0) {
-                for (let i = 0; i < payload.length; i++) {
-                    update_station_in_collection(state.stations, payload[i], station_popup);
-                }
-            } else {
-                state.stations = [];
+            for (let i = 0; i < payload.length; i++) {
+                update_station_in_collection(state.stations, payload[i], station_popup);
             }
         },
         addVehicles: (state, payload) => {
-            if (payload.length > 0) {
-                for (let i = 0; i < payload.length; i++) {
-                    update_item_in_collection(state.vehicles, payload[i], vehicle_popup); // Usa una función similar a la de transports
-
-
-                }
-            } else {
-                state.vehicles = [];
+            for (let i = 0; i < payload.length; i++) {
+                update_item_in_collection(state.vehicles, payload[i], vehicle_popup); // Usa una función similar a la de transports
             }
         },
+        removeEntities: (state, removed) => {
+            for (let group in removed) {
+                let ids = new Set(removed[group]);
+                state[group] = state[group].filter(item => !ids.has(item.id));
+            }
+            update_paths(state);
+        },
+        clearEntities: (state) => {
+            state.transports = [];
+            state.customers = [];
+            state.stations = [];
+            state.vehicles = [];
+            state.paths = [];
+        },
         update_simulation_status: (state, stats) => {
             if (!stats.is_running) state.simulation_status = false;
             else {
@@ -99,6 +85,20 @@ export const store = new Vuex.Store({
     }
 });
 
+let update_paths = function (state) {
+    // Ahora el path se dibuja siempre que exista, sin depender del estado
+    let new_paths = [];
+    for (let i = 0; i < state.transports.length; i++) {
+        if (state.transports[i].path) {
+            new_paths.push({
+                latlngs: state.transports[i].path,
+                color: "rgb(255, 170, 0)"  // Color naranja para todos los paths
+            });
+        }
+    }
+    state.paths = new_paths;
+};
+
 let update_item_in_collection = function (collection, item, get_popup) {
     let p = getitem(collection, item);
     if (p === false) {
@@ -119,6 +119,10 @@ let update_item_in_collection = function (collection, item, get_popup) {
         collection[p].latlng = L.latLng(item.position[0], item.position[1]);
         collection[p].popup = get_popup(item);
         collection[p].speed = item.speed;
+        if (item.path !== undefined) {
+            // the path is only sent when it changes
+            collection[p].path = item.path;
+        }
         collection[p].status = item.status;
         collection[p].icon_url = item.icon;
         if(item.icon) {
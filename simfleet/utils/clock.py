@@ -0,0 +1,114 @@
+"""
+Simulation clock module
+
+The clock that every agent, behaviour and statistics store reads to know the time of the simulation.
+The simulated time runs ``time_factor`` times faster than the wall clock (e.g. with a factor of 60 one
+simulated hour takes one real minute), so that movements, charges, delayed launches and the
+timestamps of the events keep the same semantics at any speed.
+"""
+
+import asyncio
+import time
+from datetime import datetime
+
+DEFAULT_TIME_FACTOR = 1
+
+
+class SimulationClock:
+    """
+    A clock whose time starts at the current wall-clock time and then advances ``time_factor``
+    simulated seconds per real second.
+
+    The real time is read from ``timer``, which is the monotonic wall clock by default and the
+    virtual clock of the event loop in the discrete-event engine.
+
+    Attributes:
+        time_factor (float): the simulated seconds that pass in one real second
+    """
+
+    def __init__(self, time_factor=DEFAULT_TIME_FACTOR, timer=time.monotonic):
+        self.time_factor = self._check_factor(time_factor)
+        self.timer = timer
+        self._sim_origin = time.time()
+        self._real_origin = timer()
+
+    @staticmethod
+    def _check_factor(time_factor):
+        time_factor = float(time_factor)
+        if time_factor <= 0:
+            raise ValueError("The time factor must be positive: {}".format(time_factor))
+        return time_factor
+
+    def set_time_factor(self, time_factor):
+        """
+        Changes the speed of the clock from now on, without a jump in the simulated time.
+
+        Args:
+            time_factor (float): the simulated seconds that pass in one real second
+        """
+        self._sim_origin = self.time()
+        self._real_origin = self.timer()
+        self.time_factor = self._check_factor(time_factor)
+
+    def time(self):
+        """
+        Returns the simulated time.
+
+        Returns:
+            float: the simulated time as seconds since the epoch (like ``time.time()``)
+        """
+        return self._sim_origin + (self.timer() - self._real_origin) * self.time_factor
+
+    def now(self):
+        """
+        Returns the simulated time as a datetime (like ``datetime.now()``).
+
+        Returns:
+            datetime: the simulated local date and time
+        """
+        return datetime.fromtimestamp(self.time())
+
+    def to_real(self, seconds):
+        """
+        Converts a simulated duration to the wall-clock time it takes.
+
+        Args:
+            seconds (float): the simulated duration in seconds
+
+        Returns:
+            float: the real duration in seconds
+        """
+        return seconds / self.time_factor
+
+    async def sleep(self, seconds):
+        """
+        Waits for a simulated duration.
+
+        Args:
+            seconds (float): the simulated duration in seconds
+        """
+        await asyncio.sleep(self.to_real(seconds))
+
+
+_clock = SimulationClock()
+
+
+def get_clock():
+    """
+    Returns the clock of the simulation.
+
+    Returns:
+        SimulationClock: the clock shared by the simulator and the agents
+    """
+    return _clock
+
+
+def set_clock(clock):
+    """
+    Sets the clock of the simulation.
+
+    Args:
+        clock (SimulationClock): the clock shared by the simulator and the agents
+    """
+    global _clock
+    _clock = clock
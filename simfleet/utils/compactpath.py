@@ -0,0 +1,164 @@
+"""
+Compact path module
+
+An array-backed representation of the paths followed by the moving agents. A path is stored in a
+single contiguous NumPy array plus a cursor, instead of a Python list with a 2-element list per
+point, so that thousands of moving agents keep far fewer objects alive and consuming the next point
+of a path is O(1).
+"""
+
+import numpy as np
+
+_default_dtype = np.float64
+
+
+def set_default_dtype(dtype):
+    """
+    Sets the precision used by the new paths: ``float64`` (default) or ``float32``, which halves
+    the memory of the paths while keeping an error below a millimeter.
+
+    Args:
+        dtype (str or numpy.dtype): the floating point type of the paths
+    """
+    global _default_dtype
+    dtype = np.dtype(dtype)
+    if dtype not in (np.float32, np.float64):
+        raise ValueError("Paths must be stored as float32 or float64, not {}".format(dtype))
+    _default_dtype = dtype.type
+
+
+class CompactPath:
+    """
+    A sequence of points (latitude, longitude) stored in a contiguous array and consumed with a cursor.
+
+    It behaves like the list of points it replaces: ``len``, truthiness, iteration and indexing only
+    see the points that have not been consumed yet, ``pop(0)`` returns (and consumes) the next point
+    and ``tolist`` returns the remaining points as a list of lists. The points are returned as lists
+    of Python floats.
+
+    In float32 mode the points are stored as offsets from the first point, which keeps the error
+    below a millimeter, and the last point is kept exactly so that the arrival to a destination can
+    still be detected comparing coordinates.
+
+    Attributes:
+        dtype (type): the floating point type of the array
+    """
+
+    __slots__ = ("_points", "_origin", "_last", "_cursor", "dtype")
+
+    def __init__(self, points, dtype=None):
+        """
+        Args:
+            points (list or numpy.ndarray): the points (latitude, longitude) of the path
+            dtype (str or numpy.dtype, optional): the floating point type of the array (the default
+                one set with ``set_default_dtype`` if it is not provided)
+        """
+        self.dtype = np.dtype(dtype or _default_dtype).type
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if self.dtype is np.float64:
+            self._origin = None
+            self._points = np.ascontiguousarray(points)
+        else:
+            self._origin = tuple(points[0].tolist()) if len(points) else (0.0, 0.0)
+            self._points = np.ascontiguousarray(points - self._origin, dtype=self.dtype)
+        self._last = points[-1].tolist() if len(points) else None
+        self._cursor = 0
+
+    def _point(self, index):
+        if index == len(self._points) - 1:
+            return list(self._last)
+        if self._origin is None:
+            return self._points[index].tolist()
+        lat, lon = self._points[index].tolist()
+        return [self._origin[0] + lat, self._origin[1] + lon]
+
+    def pop(self, index=0):
+        """
+        Returns and consumes the next point of the path.
+
+        Args:
+            index (int): must be 0, only the next point of the path can be consumed
+
+        Returns:
+            list: the next point (latitude, longitude)
+        """
+        if index != 0:
+            raise IndexError("Only the next point of a path can be popped")
+        if self._cursor >= len(self._points):
+            raise IndexError("pop from empty path")
+        point = self._point(self._cursor)
+        self._cursor += 1
+        return point
+
+    def peek(self):
+        """
+        Returns the next point of the path without consuming it.
+
+        Returns:
+            list: the next point (latitude, longitude), or None if the path has been consumed
+        """
+        if self._cursor >= len(self._points):
+            return None
+        return self._point(self._cursor)
+
+    def remaining(self):
+        """
+        Returns the points that have not been consumed.
+
+        Returns:
+            numpy.ndarray: (N, 2) float64 array with the remaining points
+        """
+        points = np.array(self._points[self._cursor:], dtype=np.float64)
+        if self._origin is not None:
+            points += self._origin
+        if len(points):
+            points[-1] = self._last
+        return points
+
+    def tolist(self):
+        """
+        Returns the points that have not been consumed.
+
+        Returns:
+            list: a list of points (latitude, longitude)
+        """
+        if self._origin is None:
+            return self._points[self._cursor:].tolist()
+        return self.remaining().tolist()
+
+    @property
+    def nbytes(self):
+        """
+        Returns the memory used by the array of points.
+
+        Returns:
+            int: the size of the array in bytes
+        """
+        return self._points.nbytes
+
+    def __len__(self):
+        return len(self._points) - self._cursor
+
+    def __bool__(self):
+        return self._cursor < len(self._points)
+
+    def __getitem__(self, index):
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("path index out of range")
+        return self._point(self._cursor + index)
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def __eq__(self, other):
+        if isinstance(other, CompactPath):
+            other = other.tolist()
+        if isinstance(other, list):
+            return self.tolist() == other
+        return NotImplemented
+
+    def __repr__(self):
+        return "CompactPath({} points, {})".format(len(self), self.dtype.__name__)
@@ -0,0 +1,182 @@
+"""
+Discrete-event engine module
+
+Runs a simulation headless on a discrete-event scheduler instead of in real time. The agents and
+their strategies (the same FSM behaviours of the real-time mode) run unchanged on an event loop
+whose clock is virtual: the timers of the loop (every ``asyncio.sleep``, message ``receive``
+timeout, movement tick, charge or delayed launch) are kept in its priority queue, and whenever no
+coroutine is ready to run the clock jumps straight to the next of them instead of waiting for it.
+
+The agents do not connect to an XMPP server: their messages are delivered in process by the SPADE
+container, and the web interface is not started.
+"""
+
+import asyncio
+import selectors
+import time
+from contextlib import contextmanager
+
+import spade.behaviour
+from loguru import logger
+from spade.agent import Agent
+from spade.behaviour import CyclicBehaviour
+from spade.container import Container
+
+from simfleet.utils.clock import get_clock
+
+REALTIME_ENGINE = "realtime"
+DES_ENGINE = "des"
+ENGINES = (REALTIME_ENGINE, DES_ENGINE)
+
+
+class _VirtualTimeSelector(selectors.DefaultSelector):
+    """
+    The selector of a ``DiscreteEventLoop``: instead of blocking until the next timer is due, it
+    polls the sockets and moves the clock of the loop forward to that timer.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.loop = None
+
+    def select(self, timeout=None):
+        loop = self.loop
+        if loop is None or timeout == 0:
+            return super().select(timeout)
+        if loop.busy or timeout is None:
+            # something outside the loop (a route request, a thread of the executor) has to finish
+            # in real time, so the virtual clock follows the wall clock meanwhile
+            start = time.monotonic()
+            events = super().select(timeout)
+            elapsed = time.monotonic() - start
+            loop.advance(elapsed if timeout is None else min(elapsed, timeout))
+            return events
+        events = super().select(0)
+        if not events:
+            loop.advance(timeout)
+        return events
+
+
+class DiscreteEventLoop(asyncio.SelectorEventLoop):
+    """
+    An event loop with a virtual clock that jumps to the next scheduled timer whenever the loop
+    would otherwise wait for it, so a simulation runs as fast as its events can be processed.
+
+    Attributes:
+        busy (int): number of operations in progress that need real time (e.g. requests to a route
+            server or tasks of the executor); the clock only jumps while there are none
+    """
+
+    def __init__(self):
+        selector = _VirtualTimeSelector()
+        super().__init__(selector)
+        self._now = time.monotonic()
+        self.busy = 0
+        selector.loop = self
+
+    def time(self):
+        return self._now
+
+    def advance(self, seconds):
+        """
+        Moves the virtual clock forward.
+
+        Args:
+            seconds (float): the seconds to move forward
+        """
+        if seconds > 0:
+            self._now += seconds
+
+    @contextmanager
+    def hold(self):
+        """
+        Keeps the virtual clock following the wall clock while an operation outside the loop is in
+        progress, so that it is not skipped by a jump to the next timer.
+        """
+        self.busy += 1
+        try:
+            yield
+        finally:
+            self.busy -= 1
+
+    def run_in_executor(self, executor, func, *args):
+        future = super().run_in_executor(executor, func, *args)
+        self.busy += 1
+
+        def release(_):
+            self.busy -= 1
+
+        future.add_done_callback(release)
+        return future
+
+
+@contextmanager
+def real_time():
+    """
+    Marks an operation that needs real time (e.g. a request to a route server) when the running
+    loop is a ``DiscreteEventLoop``. It does nothing on other loops.
+    """
+    loop = asyncio.get_running_loop()
+    if isinstance(loop, DiscreteEventLoop):
+        with loop.hold():
+            yield
+    else:
+        yield
+
+
+async def _connect_in_process(agent):
+    # without a connection the keepalive pings would only wake the loop up to fail
+    agent.client["xep_0199"].disable_keepalive()
+    logger.debug("Agent[{}]: The agent runs in process without XMPP".format(agent.name))
+
+
+async def _stop_in_process(agent):
+    for behaviour in agent.behaviours:
+        behaviour.kill()
+    agent.container.unregister(str(agent.jid))
+    agent._alive.clear()
+
+
+async def _drop_message(behaviour, msg):
+    logger.warning("Dropping message to {}: the agent is not in the simulation".format(msg.to))
+
+
+def _simulation_now():
+    return get_clock().now()
+
+
+def setup_event_loop():
+    """
+    Installs a ``DiscreteEventLoop`` in the SPADE container. It must be called before any agent is
+    created, since the agents take the loop of the container when they are created.
+
+    Returns:
+        DiscreteEventLoop: the event loop
+    """
+    loop = DiscreteEventLoop()
+    asyncio.set_event_loop(loop)
+    Container().loop = loop
+    return loop
+
+
+@contextmanager
+def in_process_agents():
+    """
+    Runs the SPADE agents in process: they start without connecting to an XMPP server, their
+    messages are only delivered to the agents of the container and the periodic behaviours follow
+    the simulation clock instead of the wall clock.
+    """
+    patches = [
+        (Agent, "_async_connect", _connect_in_process),
+        (Agent, "_async_stop", _stop_in_process),
+        (CyclicBehaviour, "_xmpp_send", _drop_message),
+        (spade.behaviour, "now", _simulation_now),
+    ]
+    originals = [(target, name, getattr(target, name)) for target, name, _ in patches]
+    for target, name, value in patches:
+        setattr(target, name, value)
+    try:
+        yield
+    finally:
+        for target, name, value in originals:
+            setattr(target, name, value)
@@ -0,0 +1,249 @@
+"""
+Distance module
+
+Distances between coordinates (latitude, longitude) in meters. Every distance computed by the
+helpers and the agents goes through this module, which offers three methods:
+
+* ``haversine`` (default): great-circle distance on a sphere, accurate to 0.5% at any distance.
+* ``equirectangular``: flat-earth approximation on the WGS-84 ellipsoid around the middle latitude.
+  It is accurate to the millimeter for the few kilometers of a city and is the cheapest one, but its
+  error grows with the distance.
+* ``geodesic``: the exact distance on the WGS-84 ellipsoid computed by geopy, tens of times slower.
+
+Each method has a scalar fast path (``distance``) that avoids NumPy overhead for a single pair, and
+the batch functions ``distances_from`` (one-to-many), ``pairwise_distances`` (pair by pair) and
+``distance_matrix`` (many-to-many) compute many distances at once with NumPy.
+"""
+
+import math
+
+import numpy as np
+from geopy.distance import geodesic
+
+EARTH_RADIUS_IN_METERS = 6371008.8
+WGS84_SEMI_MAJOR_AXIS = 6378137.0
+WGS84_ECCENTRICITY_SQUARED = 6.69437999014e-3
+
+HAVERSINE = "haversine"
+EQUIRECTANGULAR = "equirectangular"
+GEODESIC = "geodesic"
+METHODS = (HAVERSINE, EQUIRECTANGULAR, GEODESIC)
+
+_method = HAVERSINE
+
+
+def set_distance_method(method):
+    """
+    Sets the method used by default to compute distances.
+
+    Args:
+        method (str): ``haversine``, ``equirectangular`` or ``geodesic``
+    """
+    global _method
+    if method not in METHODS:
+        raise ValueError(
+            "Unknown distance method {}, expected one of {}".format(method, ", ".join(METHODS))
+        )
+    _method = method
+
+
+def get_distance_method():
+    """
+    Returns the method used by default to compute distances.
+
+    Returns:
+        str: the name of the method
+    """
+    return _method
+
+
+def haversine_in_meters(lat1, lon1, lat2, lon2):
+    """
+    Returns the great-circle distance in meters between coordinates given as scalars or NumPy arrays.
+
+    Args:
+        lat1 (float or numpy.ndarray): latitude of the first coordinates
+        lon1 (float or numpy.ndarray): longitude of the first coordinates
+        lat2 (float or numpy.ndarray): latitude of the second coordinates
+        lon2 (float or numpy.ndarray): longitude of the second coordinates
+
+    Returns:
+        float or numpy.ndarray: the distances in meters
+    """
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_IN_METERS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def equirectangular_in_meters(lat1, lon1, lat2, lon2):
+    """
+    Returns the distance in meters between coordinates given as scalars or NumPy arrays, using the
+    meridian and prime vertical radii of curvature of the WGS-84 ellipsoid at the middle latitude.
+
+    Args:
+        lat1 (float or numpy.ndarray): latitude of the first coordinates
+        lon1 (float or numpy.ndarray): longitude of the first coordinates
+        lat2 (float or numpy.ndarray): latitude of the second coordinates
+        lon2 (float or numpy.ndarray): longitude of the second coordinates
+
+    Returns:
+        float or numpy.ndarray: the distances in meters
+    """
+    latitudes = np.radians((np.asarray(lat1) + lat2) / 2)
+    sin_squared = np.sin(latitudes) ** 2
+    denominator = 1 - WGS84_ECCENTRICITY_SQUARED * sin_squared
+    meridian = WGS84_SEMI_MAJOR_AXIS * (1 - WGS84_ECCENTRICITY_SQUARED) / denominator ** 1.5
+    prime_vertical = WGS84_SEMI_MAJOR_AXIS / np.sqrt(denominator)
+    north = meridian * np.radians(np.asarray(lat2) - lat1)
+    east = prime_vertical * np.cos(latitudes) * np.radians(np.asarray(lon2) - lon1)
+    return np.hypot(north, east)
+
+
+def geodesic_in_meters(lat1, lon1, lat2, lon2):
+    """
+    Returns the geodesic distance in meters between coordinates given as scalars or NumPy arrays.
+    It is exact but it is computed pair by pair.
+
+    Args:
+        lat1 (float or numpy.ndarray): latitude of the first coordinates
+        lon1 (float or numpy.ndarray): longitude of the first coordinates
+        lat2 (float or numpy.ndarray): latitude of the second coordinates
+        lon2 (float or numpy.ndarray): longitude of the second coordinates
+
+    Returns:
+        float or numpy.ndarray: the distances in meters
+    """
+    lat1, lon1, lat2, lon2 = np.broadcast_arrays(lat1, lon1, lat2, lon2)
+    distances = np.empty(lat1.shape)
+    for index in np.ndindex(lat1.shape):
+        distances[index] = geodesic(
+            (lat1[index], lon1[index]), (lat2[index], lon2[index])
+        ).meters
+    return distances if distances.ndim else float(distances)
+
+
+_BATCH = {
+    HAVERSINE: haversine_in_meters,
+    EQUIRECTANGULAR: equirectangular_in_meters,
+    GEODESIC: geodesic_in_meters,
+}
+
+
+def _haversine(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_IN_METERS * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def _equirectangular(lat1, lon1, lat2, lon2):
+    latitude = math.radians((lat1 + lat2) / 2)
+    denominator = 1 - WGS84_ECCENTRICITY_SQUARED * math.sin(latitude) ** 2
+    meridian = WGS84_SEMI_MAJOR_AXIS * (1 - WGS84_ECCENTRICITY_SQUARED) / denominator ** 1.5
+    prime_vertical = WGS84_SEMI_MAJOR_AXIS / math.sqrt(denominator)
+    north = meridian * math.radians(lat2 - lat1)
+    east = prime_vertical * math.cos(latitude) * math.radians(lon2 - lon1)
+    return math.hypot(north, east)
+
+
+def _geodesic(lat1, lon1, lat2, lon2):
+    return geodesic((lat1, lon1), (lat2, lon2)).meters
+
+
+_SCALAR = {
+    HAVERSINE: _haversine,
+    EQUIRECTANGULAR: _equirectangular,
+    GEODESIC: _geodesic,
+}
+
+
+def distance(coord1, coord2, method=None):
+    """
+    Returns the distance between two coordinates in meters.
+
+    Args:
+        coord1 (list): a coordinate (latitude, longitude)
+        coord2 (list): another coordinate (latitude, longitude)
+        method (str, optional): the method to use (the one set with ``set_distance_method`` if it
+            is not provided)
+
+    Returns:
+        float: the distance in meters
+    """
+    return _SCALAR[method or _method](
+        float(coord1[0]), float(coord1[1]), float(coord2[0]), float(coord2[1])
+    )
+
+
+def distances_from(origin, points, method=None):
+    """
+    Returns the distances in meters from a coordinate to many others.
+
+    Args:
+        origin (list): a coordinate (latitude, longitude)
+        points (list or numpy.ndarray): (N, 2) coordinates (latitude, longitude)
+        method (str, optional): the method to use (the one set with ``set_distance_method`` if it
+            is not provided)
+
+    Returns:
+        numpy.ndarray: the N distances in meters
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    return np.asarray(
+        _BATCH[method or _method](origin[0], origin[1], points[:, 0], points[:, 1]),
+        dtype=np.float64,
+    )
+
+
+def pairwise_distances(origins, destinations, method=None):
+    """
+    Returns the distances in meters between every origin and the destination at the same position.
+
+    Args:
+        origins (list or numpy.ndarray): (N, 2) coordinates (latitude, longitude)
+        destinations (list or numpy.ndarray): (N, 2) coordinates (latitude, longitude)
+        method (str, optional): the method to use (the one set with ``set_distance_method`` if it
+            is not provided)
+
+    Returns:
+        numpy.ndarray: the N distances in meters
+    """
+    origins = np.asarray(origins, dtype=np.float64).reshape(-1, 2)
+    destinations = np.asarray(destinations, dtype=np.float64).reshape(-1, 2)
+    return np.asarray(
+        _BATCH[method or _method](
+            origins[:, 0], origins[:, 1], destinations[:, 0], destinations[:, 1]
+        ),
+        dtype=np.float64,
+    ).reshape(len(origins))
+
+
+def distance_matrix(origins, destinations, method=None):
+    """
+    Returns the distances in meters between every origin and every destination.
+
+    Args:
+        origins (list or numpy.ndarray): (N, 2) coordinates (latitude, longitude)
+        destinations (list or numpy.ndarray): (M, 2) coordinates (latitude, longitude)
+        method (str, optional): the method to use (the one set with ``set_distance_method`` if it
+            is not provided)
+
+    Returns:
+        numpy.ndarray: (N, M) matrix with the distances in meters
+    """
+    origins = np.asarray(origins, dtype=np.float64).reshape(-1, 2)
+    destinations = np.asarray(destinations, dtype=np.float64).reshape(-1, 2)
+    return np.asarray(
+        _BATCH[method or _method](
+            origins[:, 0, None],
+            origins[:, 1, None],
+            destinations[None, :, 0],
+            destinations[None, :, 1],
+        ),
+        dtype=np.float64,
+    ).reshape(len(origins), len(destinations))
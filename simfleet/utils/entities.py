@@ -0,0 +1,276 @@
+"""
+Entities module
+
+Keeps the state of the agents shown by the web interface between requests. Every agent is serialized
+again only when its position, status or path change, and each change is stamped with an increasing
+version, so that a client that already has the entities of a version only receives the agents that
+changed since then and the ones that were removed.
+
+The changes can also be pushed to the web clients as a stream of Server-Sent Events: they are
+coalesced into frames at a fixed rate, and each frame is serialized once for all the subscribers.
+"""
+
+import asyncio
+import json
+
+from aiohttp import web
+from loguru import logger
+
+MAX_REMOVALS = 10000
+DEFAULT_FRAME_RATE = 10
+MAX_PENDING_FRAMES = 8
+
+
+class _Entry:
+    __slots__ = ("group", "version", "path_version", "status", "position", "path", "data")
+
+
+class EntityTracker:
+    """
+    The versioned state of the entities of the simulation.
+
+    Attributes:
+        version (int): the version of the last change
+        members_version (int): the version of the last agent added or removed
+        max_removals (int): number of removed agents remembered for the clients that fall behind
+    """
+
+    def __init__(self, max_removals=MAX_REMOVALS):
+        self.version = 0
+        self.members_version = 0
+        self.max_removals = max_removals
+        # ordered by the version of their last change, so the changes since a version are at the end
+        self._entries = {}
+        self._removals = {}
+        self._horizon = 0
+
+    def update(self, groups):
+        """
+        Compares the agents with their last known state and serializes again the ones that changed.
+
+        Args:
+            groups (dict): the agents shown by the interface by group (e.g. "transports", "customers")
+
+        Returns:
+            int: the current version
+        """
+        version = self.version + 1
+        changed = False
+        seen = set()
+        for group, agents in groups.items():
+            for agent in agents:
+                key = (group, agent.name)
+                seen.add(key)
+                status, position, path = agent.status, agent.get("current_pos"), agent.get("path")
+                entry = self._entries.get(key)
+                if entry is not None:
+                    if entry.status == status and entry.position == position and entry.path is path:
+                        continue
+                    del self._entries[key]
+                    if entry.path is not path:
+                        entry.path_version = version
+                else:
+                    entry = _Entry()
+                    entry.group = group
+                    entry.path_version = version
+                    self._removals.pop(key, None)
+                    self.members_version = version
+                entry.version = version
+                entry.status, entry.position, entry.path = status, position, path
+                entry.data = agent.to_json()
+                self._entries[key] = entry
+                changed = True
+
+        for key in [key for key in self._entries if key not in seen]:
+            entry = self._entries.pop(key)
+            self._removals.pop(key, None)
+            self._removals[key] = (entry.data["id"], version)
+            self.members_version = version
+            changed = True
+        while len(self._removals) > self.max_removals:
+            key = next(iter(self._removals))
+            self._horizon = self._removals.pop(key)[1]
+
+        if changed:
+            self.version = version
+        return self.version
+
+    def snapshot(self):
+        """
+        Returns the last known state of every agent.
+
+        Returns:
+            dict: the serialized agents by group
+        """
+        result = {}
+        for entry in self._entries.values():
+            result.setdefault(entry.group, []).append(entry.data)
+        return result
+
+    def delta(self, since):
+        """
+        Returns the agents that changed after a version and the ones that were removed. The path of an
+        agent is only sent again when it changed.
+
+        Args:
+            since (int): the last version known by the client
+
+        Returns:
+            dict: the changed agents by group and the ids of the removed ones by group in "removed", or
+            None if the version is unknown or too old to compute the changes (a snapshot is needed)
+        """
+        if since < self._horizon or since > self.version:
+            return None
+        result = {}
+        for entry in reversed(self._entries.values()):
+            if entry.version <= since:
+                break
+            data = entry.data
+            if entry.path_version <= since and "path" in data:
+                data = {key: value for key, value in data.items() if key != "path"}
+            result.setdefault(entry.group, []).append(data)
+        removed = {}
+        for (group, _), (agent_id, version) in reversed(self._removals.items()):
+            if version <= since:
+                break
+            removed.setdefault(group, []).append(agent_id)
+        result["removed"] = removed
+        return result
+
+
+class EntityStream:
+    """
+    Broadcasts the changes of the entities to the subscribed web clients as Server-Sent Events. At every frame
+    the changes since the previous one are serialized once and queued for every subscriber. A client that
+    does not read its frames fast enough has its queue dropped and receives a full snapshot instead, so a
+    slow client neither delays the others nor makes the simulator keep an unbounded backlog.
+
+    Attributes:
+        entities (function): returns the entities changed after a version, or the full snapshot with None
+            (e.g. ``SimulatorAgent.get_entities``)
+        frame_rate (float): frames sent per second
+        max_pending (int): frames queued for a subscriber before it is resynchronized with a snapshot
+    """
+
+    def __init__(self, entities, frame_rate=DEFAULT_FRAME_RATE, max_pending=MAX_PENDING_FRAMES):
+        self.entities = entities
+        self.frame_rate = frame_rate
+        self.max_pending = max_pending
+        self._subscribers = set()
+        self._resync = set()
+        self._version = None
+        self._stats = None
+        self._task = None
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    async def handle(self, request):
+        """
+        Web controller that subscribes a client to the stream. The first frame is a full snapshot.
+
+        Returns:
+            StreamResponse: the event stream, once the client or the simulator closes it
+        """
+        response = web.StreamResponse(
+            headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"}
+        )
+        await response.prepare(request)
+        queue = self.subscribe()
+        try:
+            while True:
+                frame = await queue.get()
+                if frame is None:
+                    break
+                await response.write(frame)
+        except ConnectionError:
+            logger.debug("A client closed the entities stream")
+        finally:
+            self.unsubscribe(queue)
+        return response
+
+    def subscribe(self):
+        """
+        Adds a subscriber, which receives a full snapshot in the next frame.
+
+        Returns:
+            asyncio.Queue: the queue of frames of the subscriber
+        """
+        queue = asyncio.Queue(maxsize=self.max_pending)
+        self._subscribers.add(queue)
+        self._resync.add(queue)
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+        return queue
+
+    def unsubscribe(self, queue):
+        """
+        Removes a subscriber.
+
+        Args:
+            queue (asyncio.Queue): the queue of frames of the subscriber
+        """
+        self._subscribers.discard(queue)
+        self._resync.discard(queue)
+
+    def publish(self):
+        """
+        Queues the changes since the previous frame for every subscriber, and a snapshot for the new ones and
+        the ones that fell behind. Nothing is sent when nothing changed.
+        """
+        if self._version is None:
+            delta = self.entities(None)
+        else:
+            delta = self.entities(self._version)
+        changed = delta["full"] or delta["version"] != self._version or delta["stats"] != self._stats
+        self._version, self._stats = delta["version"], delta["stats"]
+
+        frame = _event(delta) if changed else None
+        snapshot = None
+        for queue in list(self._subscribers):
+            if queue in self._resync:
+                if snapshot is None:
+                    snapshot = frame if delta["full"] else _event(self.entities(None))
+                self._put(queue, snapshot)
+            elif frame is not None:
+                self._put(queue, frame)
+
+    def stop(self):
+        """
+        Stops the stream and closes the connection of every subscriber.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for queue in list(self._subscribers):
+            _drain(queue)
+            queue.put_nowait(None)
+        self._subscribers.clear()
+        self._resync.clear()
+
+    def _put(self, queue, frame):
+        try:
+            queue.put_nowait(frame)
+            self._resync.discard(queue)
+        except asyncio.QueueFull:
+            # the client is too slow: it will start again from a snapshot once its queue is read
+            _drain(queue)
+            self._resync.add(queue)
+
+    async def _run(self):
+        while self._subscribers:
+            try:
+                self.publish()
+            except Exception as e:
+                logger.error("Exception publishing the entities: {}".format(e))
+            await asyncio.sleep(1 / self.frame_rate)
+        self._version = None
+
+
+def _event(data):
+    return "data: {}\n\n".format(json.dumps(data)).encode("utf-8")
+
+
+def _drain(queue):
+    while not queue.empty():
+        queue.get_nowait()
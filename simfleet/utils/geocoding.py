@@ -0,0 +1,213 @@
+"""
+Geocoding module
+
+Resolves the location of a scenario (a place name, a coordinate or an explicit bounding box) to its
+central point and bounding box. Place names are looked up first in a gazetteer bundled with SimFleet
+with the coordinates of common cities, then in a persistent cache of previous answers, and only then
+in Nominatim, so that loading a scenario does not need the network in most cases.
+"""
+
+import json
+import os
+import unicodedata
+
+from geopy.geocoders import Nominatim
+from loguru import logger
+
+GAZETTEER_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "templates", "data", "gazetteer.json"
+)
+DEFAULT_GEOCODE_CACHE = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")),
+    "simfleet",
+    "geocode.json",
+)
+GEOCODE_TIMEOUT = 10
+
+_gazetteer = None
+
+
+def normalize(location):
+    """
+    Normalizes a place name to look it up: lowercase, without accents and with single spaces.
+
+    Args:
+        location (str): the place name
+
+    Returns:
+        str: the normalized name
+    """
+    location = unicodedata.normalize("NFKD", location)
+    location = "".join(c for c in location if not unicodedata.combining(c))
+    parts = [" ".join(part.split()) for part in location.lower().split(",")]
+    return ", ".join(part for part in parts if part)
+
+
+def load_gazetteer():
+    """
+    Returns the bundled gazetteer, which is read the first time it is needed.
+
+    Returns:
+        dict: the coordinates (latitude, longitude) of each normalized place name
+    """
+    global _gazetteer
+    if _gazetteer is None:
+        with open(GAZETTEER_FILE, encoding="utf-8") as f:
+            places = json.load(f)
+        _gazetteer = {}
+        for place in places:
+            for name in [place["name"]] + place["aliases"]:
+                for suffix in ("", ", " + place["country"], ", " + place["country_name"]):
+                    _gazetteer.setdefault(normalize(name + suffix), place["position"])
+    return _gazetteer
+
+
+class GeocodeCache:
+    """
+    A persistent cache of the coordinates of the place names geocoded with Nominatim, stored as a
+    JSON file.
+
+    Attributes:
+        filename (str): the path of the cache file (or None to keep it in memory)
+    """
+
+    def __init__(self, filename=DEFAULT_GEOCODE_CACHE):
+        self.filename = filename
+        self._places = None
+
+    def _load(self):
+        if self._places is None:
+            self._places = {}
+            if self.filename and os.path.exists(self.filename):
+                try:
+                    with open(self.filename, encoding="utf-8") as f:
+                        self._places = json.load(f)
+                except (OSError, ValueError) as e:
+                    logger.warning("Could not read the geocode cache {}: {}".format(self.filename, e))
+        return self._places
+
+    def get(self, location):
+        """
+        Looks up a place name in the cache.
+
+        Args:
+            location (str): the place name
+
+        Returns:
+            list: the coordinates (latitude, longitude), or None if they are not cached
+        """
+        return self._load().get(normalize(location))
+
+    def put(self, location, position):
+        """
+        Stores the coordinates of a place name and saves the cache file.
+
+        Args:
+            location (str): the place name
+            position (list): the coordinates (latitude, longitude)
+        """
+        self._load()[normalize(location)] = list(position)
+        if not self.filename:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.filename)), exist_ok=True)
+            with open(self.filename, "w", encoding="utf-8") as f:
+                json.dump(self._places, f, indent=1, ensure_ascii=False)
+        except OSError as e:
+            logger.warning("Could not write the geocode cache {}: {}".format(self.filename, e))
+
+
+def geocode(location, cache=None):
+    """
+    Returns the coordinates of a place name, from the bundled gazetteer, the cache or Nominatim
+    (in this order).
+
+    Args:
+        location (str): the place name (e.g. "Valencia, ES")
+        cache (GeocodeCache, optional): the cache of previous answers of Nominatim
+
+    Returns:
+        list: the coordinates (latitude, longitude)
+    """
+    position = load_gazetteer().get(normalize(location))
+    if position is not None:
+        return list(position)
+    if cache is not None:
+        position = cache.get(location)
+        if position is not None:
+            return position
+
+    logger.info("Geocoding {} with Nominatim".format(location))
+    geolocator = Nominatim(user_agent="zoom_bbox_simfleet")
+    result = geolocator.geocode(location, addressdetails=True, timeout=GEOCODE_TIMEOUT)
+    if result is None:
+        raise Exception("Could not find coordinates for the entered location")
+    position = [result.latitude, result.longitude]
+    if cache is not None:
+        cache.put(location, position)
+    return position
+
+
+def bbox_around(center, zoom):
+    """
+    Returns the bounding box that the map shows around a point at a zoom level.
+
+    Args:
+        center (list): the central point (latitude, longitude)
+        zoom (float): the zoom level of the map
+
+    Returns:
+        tuple: the bounding box (min_lat, min_lon, max_lat, max_lon)
+    """
+    lat, lon = center
+    bbox_width = 360 / (2 ** zoom)
+    bbox_height = bbox_width / 2  # Proporción arbitraria para ajustar el Bounding Box
+
+    min_lon = lon - bbox_width / 2
+    max_lon = lon + bbox_width / 2
+    min_lat = lat - bbox_height / 2
+    max_lat = lat + bbox_height / 2
+
+    return (min_lat, min_lon, max_lat, max_lon)
+
+
+def is_point(value):
+    """
+    Checks whether a value is a coordinate (latitude, longitude).
+
+    Args:
+        value: the value to check
+
+    Returns:
+        bool: whether it is a list or tuple of two numbers
+    """
+    return (
+        isinstance(value, (list, tuple))
+        and len(value) == 2
+        and all(isinstance(v, (int, float)) for v in value)
+    )
+
+
+def resolve_location(location, zoom, bbox=None, cache=None):
+    """
+    Resolves the location of a scenario to its central point and bounding box. Only a place name
+    without an explicit bounding box needs geocoding.
+
+    Args:
+        location (str or list): a place name or the central point (latitude, longitude), or None
+        zoom (float): the zoom level used to compute the bounding box around the central point
+        bbox (list, optional): an explicit bounding box (min_lat, min_lon, max_lat, max_lon)
+        cache (GeocodeCache, optional): the cache of previous answers of Nominatim
+
+    Returns:
+        tuple: (central_point, bbox)
+    """
+    if bbox is not None:
+        bbox = tuple(bbox)
+        if is_point(location):
+            center = list(location)
+        else:
+            center = [(bbox[0] + bbox[2]) / 2, (bbox[1] + bbox[3]) / 2]
+        return center, bbox
+    center = list(location) if is_point(location) else geocode(location, cache)
+    return center, bbox_around(center, zoom)
@@ -7,41 +7,65 @@ These functions are useful for the develop of new strategies.
 import json
 import os
 import random
+
+import numpy as np
 import requests
 
-from geopy.distance import geodesic as vincenty
-from geopy.geocoders import Nominatim
+from simfleet.utils.distance import distance
+from simfleet.utils.geocoding import GeocodeCache, resolve_location
 
-def get_bbox_from_location(location_str, zoom):
+NEAREST_REQUEST_TIMEOUT = 10
+
+_http_session = None
+_station_positions = None
+
+
+def get_http_session():
     """
-    Get BoundingBox from str location
+    Returns a module-wide ``requests.Session`` so that synchronous requests to the route server
+    reuse keep-alive connections instead of opening a new one per call.
 
-    Return:
-        Tupla: (central_point, bbox)
+    Returns:
+        requests.Session: the shared HTTP session
     """
-    # Obtener las coordenadas de la ubicación (ciudad, calle, avenida, etc.)
-    geolocator = Nominatim(user_agent="zoom_bbox_simfleet")
-    location = geolocator.geocode(location_str, addressdetails=True, timeout=10)
+    global _http_session
+    if _http_session is None:
+        _http_session = requests.Session()
+    return _http_session
 
-    if location is None:
-        raise Exception ("Could not find coordinates for the entered location")
-        return None
 
-    lat, lon = location.latitude, location.longitude
+def get_bbox_from_location(location_str, zoom):
+    """
+    Get BoundingBox from str location. The location is looked up in the bundled gazetteer and the
+    geocode cache before asking Nominatim.
 
-    # Calcular el Bounding Box en función del zoom
-    bbox_width = 360 / (2 ** zoom)
-    bbox_height = bbox_width / 2  # Proporción arbitraria para ajustar el Bounding Box
+    Return:
+        Tupla: (central_point, bbox)
+    """
+    return resolve_location(location_str, zoom, cache=GeocodeCache())
 
-    min_lon = lon - bbox_width / 2
-    max_lon = lon + bbox_width / 2
-    min_lat = lat - bbox_height / 2
-    max_lat = lat + bbox_height / 2
 
-    bbox = (min_lat, min_lon, max_lat, max_lon)
-    central_point = [lat, lon]
+def load_station_positions():
+    """
+    Returns the candidate positions of ``random_position``: the taxi stations of
+    ``templates/data/taxi_stations.json``. The file is read only the first time.
 
-    return (central_point, bbox)
+    Returns:
+        numpy.ndarray: (N, 2) array with the positions (latitude, longitude) rounded to 6 decimals
+    """
+    global _station_positions
+    if _station_positions is None:
+        path = os.path.join(
+            os.path.dirname(os.path.dirname(__file__)), "templates", "data", "taxi_stations.json"
+        )
+        with open(path) as f:
+            stations = json.load(f)["features"]
+        positions = np.array(
+            [station["geometry"]["coordinates"][::-1] for station in stations], dtype=np.float64
+        )
+        _station_positions = np.round(positions, 6)
+        _station_positions.flags.writeable = False
+    return _station_positions
 
 
 def random_position():
@@ -51,35 +75,36 @@ def random_position():
     Returns:
         list: a point (longitude and latitude)
     """
-    base_dir_utils = os.path.dirname(__file__)
-    base_dir = os.path.dirname(base_dir_utils)
-
-    path = (
-        base_dir
-        + os.sep
-        + "templates"
-        + os.sep
-        + "data"
-        + os.sep
-        + "taxi_stations.json"
-    )
-    with open(path) as f:
-        stations = json.load(f)["features"]
-        pos = random.choice(stations)
-        coords = [pos["geometry"]["coordinates"][1], pos["geometry"]["coordinates"][0]]
-        lat = float("{0:.6f}".format(coords[0]))
-        lng = float("{0:.6f}".format(coords[1]))
-        return [lat, lng]
+    positions = load_station_positions()
+    return positions[random.randrange(len(positions))].tolist()
 
 
-def new_random_position(bbox, route_host):
+def random_positions(n, seed=None):
     """
-        Returns a random position inside the map.
+    Returns many random positions inside the map at once.
 
-        Returns:
-            list: a point (longitude and latitude)
+    Args:
+        n (int): the number of positions
+        seed (int, optional): the seed of the random generator, for reproducible scenarios
+
+    Returns:
+        numpy.ndarray: (n, 2) array with the positions (latitude, longitude)
+    """
+    positions = load_station_positions()
+    rng = np.random.default_rng(seed)
+    return positions[rng.integers(0, len(positions), size=n)]
+
+
+def random_point_in_bbox(bbox):
     """
+    Returns a random point inside a bounding box, more likely near its center.
+
+    Args:
+        bbox (list): the bounding box (min latitude, min longitude, max latitude, max longitude)
 
+    Returns:
+        list: a point (latitude, longitude)
+    """
     min_lat, min_lon, max_lat, max_lon = bbox
 
     # Generar ubicación aleatoria dentro del Bounding Box -- Vrs 1
@@ -91,12 +116,26 @@ def new_random_position(bbox, route_host):
     zoom_factor = 1 / zoom
     random_lon = random.uniform(min_lon + (max_lon - min_lon) * (1 - zoom_factor) / 2, max_lon - (max_lon - min_lon) * (1 - zoom_factor) / 2)
     random_lat = random.uniform(min_lat + (max_lat - min_lat) * (1 - zoom_factor) / 2, max_lat - (max_lat - min_lat) * (1 - zoom_factor) / 2)
+    return [random_lat, random_lon]
+
+
+def new_random_position(bbox, route_host):
+    """
+        Returns a random position inside the map, snapped to the road network with a blocking
+        request to the ``nearest`` service of OSRM. Agents with a route client use the asynchronous
+        ``RouteClient.random_positions`` instead.
+
+        Returns:
+            list: a point (longitude and latitude)
+    """
+
+    random_lat, random_lon = random_point_in_bbox(bbox)
 
     # URL del servicio OSRM
     osrm_url = f'{route_host}/nearest/v1/driving/{random_lon},{random_lat}'
 
     # Realizar la solicitud a la API de OSRM
-    response = requests.get(osrm_url)
+    response = get_http_session().get(osrm_url, timeout=NEAREST_REQUEST_TIMEOUT)
 
     # Comprobar si la solicitud fue exitosa
     if response.status_code == 200:
@@ -122,12 +161,13 @@ def are_close(coord1, coord2, tolerance=10):
     Returns:
         bool: whether the two coordinates are closer than tolerance or not
     """
-    return vincenty(coord1, coord2).meters < tolerance
+    return distance(coord1, coord2) < tolerance
 
 
 def distance_in_meters(coord1, coord2):
     """
-    Returns the distance between two coordinates in meters.
+    Returns the distance between two coordinates in meters, computed with the method selected with
+    ``simfleet.utils.distance.set_distance_method`` (haversine by default).
 
     Args:
         coord1 (list): a coordinate (longitude, latitude)
@@ -136,7 +176,7 @@ def distance_in_meters(coord1, coord2):
     Returns:
         float: distance meters between the two coordinates
     """
-    return vincenty(coord1, coord2).meters
+    return distance(coord1, coord2)
 
 
 def kmh_to_ms(speed_in_kmh):
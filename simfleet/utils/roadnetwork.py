@@ -0,0 +1,468 @@
+"""
+Road network module
+
+An in-process road graph that can answer route and nearest-point queries without an OSRM server.
+The graph is stored in compressed sparse row (CSR) arrays that are saved as ``.npy`` files and
+memory-mapped when loaded, so that large graphs are available almost instantly.
+"""
+
+import heapq
+import json
+import math
+import os
+
+import click
+import numpy as np
+from loguru import logger
+
+from simfleet.utils.distance import haversine_in_meters
+
+DEFAULT_SPEED_IN_KMH = 30
+NODES_PER_CELL = 4
+# the legs between a point and its closest node are travelled at the default speed (in m/s)
+SNAP_SPEED = DEFAULT_SPEED_IN_KMH * 1000 / 3600
+GRAPH_ARRAYS = ("coords", "indptr", "indices", "lengths", "durations")
+
+
+def _parse_speed(value, default):
+    try:
+        return float(str(value).split()[0])
+    except (TypeError, ValueError, IndexError):
+        return default
+
+
+def _is_oneway(value):
+    return value in (True, 1, "yes", "true", "1")
+
+
+class _GridIndex:
+    """
+    A uniform grid over the nodes of a graph (in an equirectangular projection around their mean
+    latitude), to find the node closest to a point looking only at the cells around it.
+    """
+
+    def __init__(self, coords, nodes_per_cell=NODES_PER_CELL):
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        self.coords = coords
+        if len(coords):
+            self.origin = coords.min(axis=0)
+            self.scale = math.cos(math.radians(float(coords[:, 0].mean())))
+        else:
+            self.origin, self.scale = np.zeros(2), 1.0
+        projected = self._project(coords)
+        extent = projected.max(axis=0) if len(coords) else np.zeros(2)
+        area = float(extent[0]) * float(extent[1]) or float(extent.max()) ** 2
+        self.cell = math.sqrt(area * nodes_per_cell / max(len(coords), 1)) or 1e-6
+        cells = np.floor(projected / self.cell).astype(np.int64)
+        self.shape = cells.max(axis=0) + 1 if len(coords) else np.ones(2, dtype=np.int64)
+        keys = cells[:, 0] * self.shape[1] + cells[:, 1]
+        self.nodes = np.argsort(keys, kind="stable")
+        self.keys, self.starts = np.unique(keys[self.nodes], return_index=True)
+        self.ends = np.append(self.starts[1:], len(keys))
+
+    def _project(self, points):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2) - self.origin
+        return np.column_stack((points[:, 0], points[:, 1] * self.scale))
+
+    def _ring(self, cx, cy, radius):
+        # the nodes in the cells of the grid at a Chebyshev distance of radius from (cx, cy)
+        width, height = (int(size) for size in self.shape)
+        keys = []
+        ys = np.arange(max(cy - radius, 0), min(cy + radius, height - 1) + 1)
+        for x in sorted({cx - radius, cx + radius}):
+            if 0 <= x < width and len(ys):
+                keys.append(x * height + ys)
+        xs = np.arange(max(cx - radius + 1, 0), min(cx + radius - 1, width - 1) + 1)
+        for y in sorted({cy - radius, cy + radius}):
+            if 0 <= y < height and len(xs):
+                keys.append(xs * height + y)
+        if not keys:
+            return np.empty(0, dtype=np.int64)
+        keys = np.concatenate(keys)
+        found = np.searchsorted(self.keys, keys).astype(np.int64)
+        found = found[found < len(self.keys)]
+        found = found[np.isin(self.keys[found], keys)]
+        if not len(found):
+            return found
+        return np.concatenate([self.nodes[self.starts[i]:self.ends[i]] for i in found])
+
+    def nearest(self, point):
+        """
+        Returns the node closest to a point, measuring the distances in degrees with the longitude
+        scaled by the cosine of the latitude of the point.
+
+        Args:
+            point (list): a coordinate (latitude, longitude)
+
+        Returns:
+            int: the index of the closest node (-1 if the graph is empty)
+        """
+        lat, lon = point
+        scale = math.cos(math.radians(lat))
+        # the nodes out of the rings searched are at least radius * bound away from the point
+        bound = self.cell * min(1.0, scale / self.scale)
+        cx, cy = (int(c) for c in np.floor(self._project([point])[0] / self.cell))
+        # the rings closer than the grid are empty, so the search starts at the first one that reaches it
+        first = max(0, -cx, cx - int(self.shape[0]) + 1, -cy, cy - int(self.shape[1]) + 1)
+        last = max(abs(cx), abs(cy), abs(self.shape[0] - 1 - cx), abs(self.shape[1] - 1 - cy))
+        best, best_distance = -1, math.inf
+        for radius in range(first, last + 1):
+            candidates = self._ring(cx, cy, radius)
+            if len(candidates):
+                dlat = self.coords[candidates, 0] - lat
+                dlon = (self.coords[candidates, 1] - lon) * scale
+                distances = dlat * dlat + dlon * dlon
+                i = int(np.argmin(distances))
+                if distances[i] < best_distance:
+                    best, best_distance = int(candidates[i]), float(distances[i])
+            if best >= 0 and math.sqrt(best_distance) <= radius * bound:
+                break
+        return best
+
+
+class RoadNetwork:
+    """
+    A directed road graph stored in CSR arrays.
+
+    Attributes:
+        coords (numpy.ndarray): (N, 2) array with the latitude and longitude of every node
+        indptr (numpy.ndarray): (N + 1) array with the offset of the outgoing edges of every node
+        indices (numpy.ndarray): (E) array with the target node of every edge
+        lengths (numpy.ndarray): (E) array with the length of every edge in meters
+        durations (numpy.ndarray): (E) array with the travel time of every edge in seconds
+
+    The nodes are indexed in a grid when the graph is built or loaded, so snapping a point to the
+    network only looks at the nodes around it.
+    """
+
+    def __init__(self, coords, indptr, indices, lengths, durations):
+        self.coords = coords
+        self.indptr = indptr
+        self.indices = indices
+        self.lengths = lengths
+        self.durations = durations
+        max_speed = float(np.max(lengths / np.maximum(durations, 1e-9))) if len(lengths) else 1.0
+        self._max_speed = max(max_speed, 1e-9)
+        self._grid = _GridIndex(coords)
+
+    @property
+    def num_nodes(self):
+        return len(self.coords)
+
+    @property
+    def num_edges(self):
+        return len(self.indices)
+
+    @classmethod
+    def from_edges(cls, coords, sources, targets, speeds_in_kmh):
+        """
+        Builds a road network from a list of directed edges.
+
+        Args:
+            coords (numpy.ndarray): (N, 2) array with the latitude and longitude of every node
+            sources (numpy.ndarray): (E) array with the source node of every edge
+            targets (numpy.ndarray): (E) array with the target node of every edge
+            speeds_in_kmh (numpy.ndarray): (E) array with the speed of every edge in km per hour
+
+        Returns:
+            RoadNetwork: the road network
+        """
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        speeds = np.asarray(speeds_in_kmh, dtype=np.float64) * 1000 / 3600
+
+        order = np.argsort(sources, kind="stable")
+        sources, targets, speeds = sources[order], targets[order], speeds[order]
+        lengths = haversine_in_meters(
+            coords[sources, 0], coords[sources, 1], coords[targets, 0], coords[targets, 1]
+        )
+        indptr = np.zeros(len(coords) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=len(coords)), out=indptr[1:])
+        return cls(
+            coords,
+            indptr,
+            targets.astype(np.int32),
+            lengths.astype(np.float32),
+            (lengths / speeds).astype(np.float32),
+        )
+
+    @classmethod
+    def from_geojson(cls, filename, default_speed_in_kmh=DEFAULT_SPEED_IN_KMH):
+        """
+        Builds a road network from a GeoJSON file of LineString (or MultiLineString) features, such
+        as the roads of an OSM extract exported to GeoJSON. Consecutive points of a line become
+        edges. The ``oneway`` and ``maxspeed`` properties of the features are honoured.
+
+        Args:
+            filename (str): the GeoJSON file
+            default_speed_in_kmh (float): speed of the roads without a ``maxspeed`` property
+
+        Returns:
+            RoadNetwork: the road network
+        """
+        with open(filename) as f:
+            features = json.load(f)["features"]
+
+        nodes = {}
+        sources, targets, speeds = [], [], []
+
+        def node_id(point):
+            key = (round(point[1], 7), round(point[0], 7))
+            if key not in nodes:
+                nodes[key] = len(nodes)
+            return nodes[key]
+
+        for feature in features:
+            geometry = feature.get("geometry") or {}
+            properties = feature.get("properties") or {}
+            if geometry.get("type") == "LineString":
+                lines = [geometry["coordinates"]]
+            elif geometry.get("type") == "MultiLineString":
+                lines = geometry["coordinates"]
+            else:
+                continue
+            speed = _parse_speed(properties.get("maxspeed"), default_speed_in_kmh)
+            oneway = _is_oneway(properties.get("oneway"))
+            for line in lines:
+                ids = [node_id(point) for point in line]
+                for u, v in zip(ids, ids[1:]):
+                    if u == v:
+                        continue
+                    sources.append(u)
+                    targets.append(v)
+                    speeds.append(speed)
+                    if not oneway:
+                        sources.append(v)
+                        targets.append(u)
+                        speeds.append(speed)
+
+        coords = np.array(list(nodes.keys()), dtype=np.float64).reshape(-1, 2)
+        logger.info(
+            "Built road network from {} with {} nodes and {} edges".format(
+                filename, len(coords), len(sources)
+            )
+        )
+        return cls.from_edges(coords, sources, targets, speeds)
+
+    def save(self, directory):
+        """
+        Saves the arrays of the graph as ``.npy`` files in a directory.
+
+        Args:
+            directory (str): the directory where the graph is saved
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name in GRAPH_ARRAYS:
+            np.save(os.path.join(directory, name + ".npy"), getattr(self, name))
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """
+        Loads a graph saved with ``save``.
+
+        Args:
+            directory (str): the directory where the graph was saved
+            mmap (bool): whether the arrays are memory-mapped instead of read into memory
+
+        Returns:
+            RoadNetwork: the road network
+        """
+        mode = "r" if mmap else None
+        arrays = {
+            name: np.load(os.path.join(directory, name + ".npy"), mmap_mode=mode)
+            for name in GRAPH_ARRAYS
+        }
+        return cls(**arrays)
+
+    def nearest_node(self, point):
+        """
+        Returns the node closest to a point.
+
+        Args:
+            point (list): a coordinate (latitude, longitude)
+
+        Returns:
+            int: the index of the closest node
+        """
+        return self._grid.nearest(point)
+
+    def nearest(self, point):
+        """
+        Snaps a point to the road network.
+
+        Args:
+            point (list): a coordinate (latitude, longitude)
+
+        Returns:
+            list: the coordinate (latitude, longitude) of the closest node
+        """
+        return self.coords[self.nearest_node(point)].tolist()
+
+    def _heuristic(self, node, target):
+        lat1, lon1 = self.coords[node]
+        lat2, lon2 = self.coords[target]
+        return float(haversine_in_meters(lat1, lon1, lat2, lon2)) / self._max_speed
+
+    def shortest_path(self, source, target):
+        """
+        Finds the fastest path between two nodes with A* (the heuristic is the straight-line distance
+        travelled at the highest speed of the graph, so it never overestimates).
+
+        Args:
+            source (int): the source node
+            target (int): the target node
+
+        Returns:
+            list, float, float: the nodes of the path, its length in meters and its duration in
+            seconds, or None, None, None if the target is unreachable
+        """
+        indptr, indices = self.indptr, self.indices
+        lengths, durations = self.lengths, self.durations
+        best = {source: 0.0}
+        length_to = {source: 0.0}
+        parent = {source: -1}
+        queue = [(self._heuristic(source, target), source)]
+        settled = set()
+        while queue:
+            _, node = heapq.heappop(queue)
+            if node == target:
+                break
+            if node in settled:
+                continue
+            settled.add(node)
+            start, end = int(indptr[node]), int(indptr[node + 1])
+            for neighbour, length, duration in zip(
+                indices[start:end].tolist(),
+                lengths[start:end].tolist(),
+                durations[start:end].tolist(),
+            ):
+                cost = best[node] + duration
+                if cost < best.get(neighbour, math.inf):
+                    best[neighbour] = cost
+                    length_to[neighbour] = length_to[node] + length
+                    parent[neighbour] = node
+                    heapq.heappush(queue, (cost + self._heuristic(neighbour, target), neighbour))
+        if target not in parent:
+            return None, None, None
+        nodes = [target]
+        while parent[nodes[-1]] != -1:
+            nodes.append(parent[nodes[-1]])
+        nodes.reverse()
+        return nodes, length_to[target], best[target]
+
+    def _snap(self, point):
+        node = self.nearest_node(point)
+        lat, lon = self.coords[node]
+        return node, float(haversine_in_meters(point[0], point[1], lat, lon))
+
+    def route(self, origin, destination):
+        """
+        Computes the fastest route between two points, snapping them to the road network. The legs
+        between the points and their closest nodes (travelled at the default speed) are part of the
+        path, its distance and its duration.
+
+        Args:
+            origin (list): origin coordinate (latitude, longitude)
+            destination (list): target coordinate (latitude, longitude)
+
+        Returns:
+            list, float, float = the path, the distance of the path and the estimated duration, with
+            the same shape returned by the OSRM route service
+        """
+        source, origin_leg = self._snap(origin)
+        target, destination_leg = self._snap(destination)
+        nodes, distance, duration = self.shortest_path(source, target)
+        if nodes is None:
+            return None, None, None
+        path = self.coords[nodes].tolist()
+        if path[0] != list(origin):
+            path.insert(0, list(origin))
+        if path[-1] != list(destination):
+            path.append(list(destination))
+        legs = origin_leg + destination_leg
+        return path, distance + legs, duration + legs / SNAP_SPEED
+
+    def table(self, origins, destinations):
+        """
+        Computes the distance and duration of the fastest routes from every origin to every
+        destination with one Dijkstra search per origin. As in ``route``, the legs between the points
+        and their closest nodes are included.
+
+        Args:
+            origins (list): list of origin coordinates (latitude, longitude)
+            destinations (list): list of target coordinates (latitude, longitude)
+
+        Returns:
+            numpy.ndarray, numpy.ndarray: the distances and durations matrices (NaN where there
+            is no route)
+        """
+        targets = [self._snap(point) for point in destinations]
+        distances = np.full((len(origins), len(destinations)), np.nan)
+        durations = np.full((len(origins), len(destinations)), np.nan)
+        for i, origin in enumerate(origins):
+            source, origin_leg = self._snap(origin)
+            best, length_to = self._dijkstra(source, set(target for target, _ in targets))
+            for j, (target, destination_leg) in enumerate(targets):
+                if target in best:
+                    legs = origin_leg + destination_leg
+                    distances[i, j] = length_to[target] + legs
+                    durations[i, j] = best[target] + legs / SNAP_SPEED
+        return distances, durations
+
+    def _dijkstra(self, source, targets):
+        indptr, indices = self.indptr, self.indices
+        lengths, durations = self.lengths, self.durations
+        best = {source: 0.0}
+        length_to = {source: 0.0}
+        queue = [(0.0, source)]
+        settled = set()
+        pending = set(targets)
+        while queue and pending:
+            cost, node = heapq.heappop(queue)
+            if node in settled:
+                continue
+            settled.add(node)
+            pending.discard(node)
+            start, end = int(indptr[node]), int(indptr[node + 1])
+            for neighbour, length, duration in zip(
+                indices[start:end].tolist(),
+                lengths[start:end].tolist(),
+                durations[start:end].tolist(),
+            ):
+                new_cost = cost + duration
+                if new_cost < best.get(neighbour, math.inf):
+                    best[neighbour] = new_cost
+                    length_to[neighbour] = length_to[node] + length
+                    heapq.heappush(queue, (new_cost, neighbour))
+        return (
+            {node: best[node] for node in settled},
+            {node: length_to[node] for node in settled},
+        )
+
+
+@click.command()
+@click.argument("geojson")
+@click.argument("directory")
+@click.option(
+    "-s",
+    "--speed",
+    default=DEFAULT_SPEED_IN_KMH,
+    help="Speed (km/h) of the roads without a maxspeed property.",
+    type=float,
+)
+def main(geojson, directory, speed):
+    """
+    Builds a road network from a GEOJSON edge list and saves it in DIRECTORY.
+    """
+    network = RoadNetwork.from_geojson(geojson, default_speed_in_kmh=speed)
+    network.save(directory)
+    click.echo(
+        "Saved road network with {} nodes and {} edges in {}".format(
+            network.num_nodes, network.num_edges, directory
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
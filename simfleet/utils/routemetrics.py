@@ -0,0 +1,163 @@
+"""
+Route metrics module
+
+Structured instrumentation of the routing layer: latency histograms, throughput, failures by type
+and retries, so that it is possible to see when routing becomes the bottleneck of a simulation.
+"""
+
+import bisect
+import time
+from collections import Counter, deque
+
+# Upper bounds (in seconds) of the latency buckets: from 1 ms to about 2 minutes, 25% apart.
+LATENCY_BUCKETS = [0.001 * 1.25 ** i for i in range(53)]
+THROUGHPUT_WINDOW = 10
+
+
+class LatencyHistogram:
+    """
+    A histogram of latencies with logarithmic buckets, whose percentiles are accurate to 25%
+    with a constant memory footprint regardless of the number of observations.
+
+    Attributes:
+        count (int): number of observations
+        total (float): sum of the observations (in seconds)
+        max (float): largest observation (in seconds)
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, latency):
+        """
+        Adds an observation to the histogram.
+
+        Args:
+            latency (float): the latency in seconds
+        """
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+        self.count += 1
+        self.total += latency
+        self.max = max(self.max, latency)
+
+    def percentile(self, percent):
+        """
+        Returns an upper bound of a percentile of the observations.
+
+        Args:
+            percent (float): the percentile, between 0 and 100
+
+        Returns:
+            float: the upper bound (in seconds) of the bucket that contains the percentile
+        """
+        if not self.count:
+            return 0.0
+        rank = percent / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                if index < len(LATENCY_BUCKETS):
+                    return min(LATENCY_BUCKETS[index], self.max)
+                return self.max
+        return self.max
+
+    def summary(self):
+        """
+        Returns the summary of the histogram.
+
+        Returns:
+            dict: the number of observations, the mean, p50, p95, p99 and max latencies (in seconds)
+        """
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 6) if self.count else 0.0,
+            "p50": round(self.percentile(50), 6),
+            "p95": round(self.percentile(95), 6),
+            "p99": round(self.percentile(99), 6),
+            "max": round(self.max, 6),
+        }
+
+
+class RouteMetrics:
+    """
+    Counters of the queries sent to a route backend.
+
+    Attributes:
+        latency (LatencyHistogram): latency of all the queries
+        latency_by_kind (dict): latency of the queries of each kind (route, table, nearest)
+        requests (Counter): number of queries of each kind
+        failures (Counter): number of failed queries by failure type
+        retries (int): number of retries of failed route requests
+    """
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.latency_by_kind = {}
+        self.requests = Counter()
+        self.failures = Counter()
+        self.retries = 0
+        self._start = time.monotonic()
+        self._recent = deque()
+
+    def observe(self, kind, latency, failure=None):
+        """
+        Records a query sent to the backend.
+
+        Args:
+            kind (str): the kind of query (route, table or nearest)
+            latency (float): the time (in seconds) the backend took to answer
+            failure (str, optional): the type of failure if the query failed
+        """
+        now = time.monotonic()
+        self.requests[kind] += 1
+        self.latency.observe(latency)
+        self.latency_by_kind.setdefault(kind, LatencyHistogram()).observe(latency)
+        if failure is not None:
+            self.failures[failure] += 1
+        self._recent.append(now)
+        while self._recent and self._recent[0] < now - THROUGHPUT_WINDOW:
+            self._recent.popleft()
+
+    def retry(self):
+        """
+        Records the retry of a failed route request.
+        """
+        self.retries += 1
+
+    def requests_per_second(self):
+        """
+        Returns the throughput of the backend over the last ``THROUGHPUT_WINDOW`` seconds.
+
+        Returns:
+            float: the number of queries per second
+        """
+        now = time.monotonic()
+        while self._recent and self._recent[0] < now - THROUGHPUT_WINDOW:
+            self._recent.popleft()
+        window = min(THROUGHPUT_WINDOW, now - self._start) or 1
+        return len(self._recent) / window
+
+    def summary(self):
+        """
+        Returns the summary of the metrics.
+
+        Returns:
+            dict: the latency percentiles, throughput, failures and retries
+        """
+        elapsed = time.monotonic() - self._start
+        total = sum(self.requests.values())
+        return {
+            "requests": dict(self.requests),
+            "requests_per_second": round(self.requests_per_second(), 3),
+            "average_requests_per_second": round(total / elapsed, 3) if elapsed else 0.0,
+            "latency": self.latency.summary(),
+            "latency_by_kind": {
+                kind: histogram.summary() for kind, histogram in self.latency_by_kind.items()
+            },
+            "failures": dict(self.failures),
+            "retries": self.retries,
+        }
@@ -1,24 +1,1361 @@
 import asyncio
 import json
+import os
+import random
 import socket
+import sqlite3
 import time
-import uuid
+from collections import OrderedDict
 
 import aiohttp
+import numpy as np
 from loguru import logger
 from spade.behaviour import OneShotBehaviour
 from spade.message import Message
-from spade.template import Template
 
-from simfleet.utils.helpers import distance_in_meters, kmh_to_ms
+from simfleet.utils.compactpath import CompactPath
+from simfleet.utils.des import real_time
+from simfleet.utils.distance import distance_matrix, equirectangular_in_meters
+from simfleet.utils.helpers import (
+    PathRequestException,
+    kmh_to_ms,
+    random_point_in_bbox,
+)
+from simfleet.utils.routemetrics import LatencyHistogram, RouteMetrics
+from simfleet.utils.roadnetwork import RoadNetwork
+
+DEFAULT_ROUTE_HOST = "http://router.project-osrm.org/"
+DEFAULT_MAX_CONNECTIONS_PER_HOST = 100
+DEFAULT_ROUTE_TIMEOUT = 10
+DEFAULT_KEEPALIVE_TIMEOUT = 60
+DEFAULT_ROUTE_CACHE_SIZE = 10000
+DEFAULT_ROUTE_CACHE_PRECISION = 5
+ROUTE_STORE_COMMIT_EVERY = 64
+DEFAULT_MATRIX_CHUNK_SIZE = 100
+MATRIX_FALLBACK_SPEED_IN_KMH = 30
+DEFAULT_ROUTE_RETRY_INTERVAL = 10
+HEALTH_CHECK_POINT = [0.0, 0.0]
+DEFAULT_PREWARM_CONCURRENCY = 16
+DEFAULT_ROUTE_MAX_INFLIGHT = 64
+DEFAULT_ROUTE_BACKOFF_BASE = 0.5
+DEFAULT_ROUTE_BACKOFF_MAX = 10
+
+
+def route_key(origin, destination, precision=DEFAULT_ROUTE_CACHE_PRECISION):
+    """
+    Builds the key that identifies a route, snapping the coordinates to ``precision`` decimal places.
+
+    Args:
+        origin (list): origin coordinate (latitude, longitude)
+        destination (list): target coordinate (latitude, longitude)
+        precision (int): number of decimal places kept
+
+    Returns:
+        tuple: the snapped coordinates of the origin and the destination
+    """
+    return (
+        round(origin[0], precision),
+        round(origin[1], precision),
+        round(destination[0], precision),
+        round(destination[1], precision),
+    )
+
+
+class RouteCache:
+    """
+    A two-tier cache of routes. Routes are kept in a bounded in-memory LRU and, optionally, in a
+    persistent SQLite store so that repeated runs of the same scenario reuse the routes computed
+    by previous runs.
+
+    Routes are keyed by their origin and destination coordinates rounded to ``precision`` decimal
+    places (5 decimals are about 1 meter), so requests that only differ in GPS noise share an entry.
+
+    Attributes:
+        max_size (int): maximum number of routes kept in memory
+        precision (int): number of decimal places used to snap the coordinates of the key
+        filename (str): path of the SQLite file of the persistent store (or None)
+        table (str): name of the table of the persistent store
+        hits (int): number of lookups answered by the cache (from memory or disk)
+        disk_hits (int): number of lookups answered by the persistent store
+        misses (int): number of lookups not found in the cache
+        evictions (int): number of routes evicted from memory
+    """
+
+    def __init__(
+        self,
+        max_size=DEFAULT_ROUTE_CACHE_SIZE,
+        precision=DEFAULT_ROUTE_CACHE_PRECISION,
+        filename=None,
+        table="routes",
+    ):
+        self.max_size = max_size
+        self.precision = precision
+        self.filename = filename
+        self.table = table
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._routes = OrderedDict()
+        self._db = None
+        self._pending_writes = 0
+        if filename:
+            self._open_store(filename)
+
+    def _open_store(self, filename):
+        self._db = sqlite3.connect(filename)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=OFF")
+        self._db.execute("PRAGMA mmap_size=268435456")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS {} "
+            "(key TEXT PRIMARY KEY, path TEXT, distance REAL, duration REAL)".format(self.table)
+        )
+        self._db.commit()
+        logger.info("Using persistent route cache {} ({})".format(filename, self.table))
+
+    def key(self, origin, destination):
+        """
+        Builds the cache key of a route.
+
+        Args:
+            origin (list): origin coordinate (latitude, longitude)
+            destination (list): target coordinate (latitude, longitude)
+
+        Returns:
+            tuple: the snapped coordinates of the origin and the destination
+        """
+        return route_key(origin, destination, self.precision)
+
+    @staticmethod
+    def _store_key(key):
+        return ",".join(repr(coord) for coord in key)
+
+    def get(self, origin, destination):
+        """
+        Looks up a route in memory and then in the persistent store.
+
+        Args:
+            origin (list): origin coordinate (latitude, longitude)
+            destination (list): target coordinate (latitude, longitude)
+
+        Returns:
+            tuple: the cached (path, distance, duration) or None if the route is not cached
+        """
+        key = self.key(origin, destination)
+        route = self._routes.get(key)
+        if route is not None:
+            self._routes.move_to_end(key)
+            self.hits += 1
+            return route
+        if self._db is not None:
+            row = self._db.execute(
+                "SELECT path, distance, duration FROM {} WHERE key = ?".format(self.table),
+                (self._store_key(key),),
+            ).fetchone()
+            if row is not None:
+                route = (json.loads(row[0]), row[1], row[2])
+                self._remember(key, route)
+                self.hits += 1
+                self.disk_hits += 1
+                return route
+        self.misses += 1
+        return None
+
+    def put(self, origin, destination, route):
+        """
+        Stores a route in memory and in the persistent store.
+
+        Args:
+            origin (list): origin coordinate (latitude, longitude)
+            destination (list): target coordinate (latitude, longitude)
+            route (tuple): the (path, distance, duration) to be stored
+        """
+        key = self.key(origin, destination)
+        self._remember(key, route)
+        if self._db is not None:
+            path, distance, duration = route
+            self._db.execute(
+                "INSERT OR REPLACE INTO {} VALUES (?, ?, ?, ?)".format(self.table),
+                (self._store_key(key), json.dumps(path), distance, duration),
+            )
+            self._pending_writes += 1
+            if self._pending_writes >= ROUTE_STORE_COMMIT_EVERY:
+                self.flush()
+
+    def _remember(self, key, route):
+        self._routes[key] = route
+        self._routes.move_to_end(key)
+        while len(self._routes) > self.max_size:
+            self._routes.popitem(last=False)
+            self.evictions += 1
+
+    def flush(self):
+        """
+        Commits the pending writes of the persistent store.
+        """
+        if self._db is not None and self._pending_writes:
+            self._db.commit()
+        self._pending_writes = 0
+
+    def close(self):
+        """
+        Flushes and closes the persistent store. The in-memory tier keeps working.
+        """
+        if self._db is not None:
+            self.flush()
+            self._db.close()
+            self._db = None
+
+    def stats(self):
+        """
+        Returns the counters of the cache.
+
+        Returns:
+            dict: the size of the memory tier and the hits, disk hits, misses and evictions
+        """
+        return {
+            "size": len(self._routes),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def __len__(self):
+        return len(self._routes)
+
+
+class PositionPool:
+    """
+    A pool of random positions already snapped to the road network, grouped by bounding box.
+
+    Positions snapped during a run are added to the pool and, when a SQLite file is given, persisted
+    so that later runs of a scenario with random positions draw them from the pool instead of
+    snapping new points. Within a run every position is handed out only once.
+
+    Attributes:
+        filename (str): path of the SQLite file of the persistent store (or None)
+        hits (int): number of positions taken from the pool
+        snapped (int): number of positions added to the pool
+    """
+
+    def __init__(self, filename=None, table="positions"):
+        self.filename = filename
+        self.table = table
+        self.hits = 0
+        self.snapped = 0
+        self._available = {}
+        self._db = None
+        if filename:
+            self._db = sqlite3.connect(filename)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS {} (bbox TEXT, lat REAL, lon REAL)".format(self.table)
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS {0}_bbox ON {0} (bbox)".format(self.table)
+            )
+            self._db.commit()
+
+    @staticmethod
+    def key(bbox):
+        """
+        Builds the key that identifies a bounding box.
+
+        Args:
+            bbox (list): the bounding box (min latitude, min longitude, max latitude, max longitude)
+
+        Returns:
+            str: the key of the bounding box
+        """
+        return ",".join("{:.6f}".format(coord) for coord in bbox)
+
+    def _positions(self, key):
+        if key not in self._available:
+            positions = []
+            if self._db is not None:
+                positions = [
+                    [lat, lon]
+                    for lat, lon in self._db.execute(
+                        "SELECT lat, lon FROM {} WHERE bbox = ?".format(self.table), (key,)
+                    )
+                ]
+                random.shuffle(positions)
+            self._available[key] = positions
+        return self._available[key]
+
+    def take(self, bbox, count):
+        """
+        Takes up to ``count`` positions of a bounding box from the pool.
+
+        Args:
+            bbox (list): the bounding box
+            count (int): number of positions wanted
+
+        Returns:
+            list: the positions (latitude, longitude) taken, which may be fewer than ``count``
+        """
+        positions = self._positions(self.key(bbox))
+        taken = positions[len(positions) - min(count, len(positions)):]
+        del positions[len(positions) - len(taken):]
+        self.hits += len(taken)
+        return taken
+
+    def add(self, bbox, positions):
+        """
+        Adds positions that have been snapped (and handed out) to the persistent store.
+
+        Args:
+            bbox (list): the bounding box
+            positions (list): the positions (latitude, longitude)
+        """
+        self.snapped += len(positions)
+        if self._db is not None and positions:
+            key = self.key(bbox)
+            self._db.executemany(
+                "INSERT INTO {} (bbox, lat, lon) VALUES (?, ?, ?)".format(self.table),
+                [(key, lat, lon) for lat, lon in positions],
+            )
+            self._db.commit()
+
+    def close(self):
+        """
+        Closes the persistent store.
+        """
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def stats(self):
+        """
+        Returns the counters of the pool.
+
+        Returns:
+            dict: the number of positions taken from the pool and snapped
+        """
+        return {"hits": self.hits, "snapped": self.snapped}
+
+
+def backoff_delay(
+    attempt, base=DEFAULT_ROUTE_BACKOFF_BASE, maximum=DEFAULT_ROUTE_BACKOFF_MAX
+):
+    """
+    Returns the time to wait before retrying a failed request, following a jittered exponential
+    backoff: a random delay between 0 and ``base * 2 ** attempt`` seconds (capped at ``maximum``).
+    The jitter spreads the retries of many agents that failed at the same time.
+
+    Args:
+        attempt (int): number of failed attempts so far (starting at 0)
+        base (float): delay (in seconds) of the first retry
+        maximum (float): maximum delay (in seconds)
+
+    Returns:
+        float: the delay in seconds
+    """
+    return random.uniform(0, min(maximum, base * 2 ** attempt))
+
+
+class RouteLimiter:
+    """
+    Limits the requests sent to the route backend: at most ``max_inflight`` requests run at the same
+    time (an ``asyncio.Semaphore``) and at most ``rate_limit`` requests are started per second (a
+    token bucket). Requests over the limits wait in a queue instead of overloading the route server.
+
+    It is used as an async context manager around every call to the backend::
+
+        async with limiter:
+            route = await backend.route(origin, destination)
+
+    Attributes:
+        max_inflight (int): maximum number of simultaneous requests (0 or None for no limit)
+        rate_limit (float): maximum number of requests started per second (0 or None for no limit)
+        waiting (int): number of requests currently queued
+        max_waiting (int): maximum number of requests that have been queued at the same time
+        in_flight (int): number of requests currently running
+        throttled (int): number of requests that had to wait
+        wait_time (float): total time (in seconds) spent waiting by the requests
+    """
+
+    def __init__(self, max_inflight=DEFAULT_ROUTE_MAX_INFLIGHT, rate_limit=None):
+        self.max_inflight = max_inflight
+        self.rate_limit = rate_limit
+        self._semaphore = asyncio.Semaphore(max_inflight) if max_inflight else None
+        self._tokens = float(max(rate_limit, 1)) if rate_limit else 0.0
+        self._last_refill = time.monotonic()
+        self._bucket_lock = asyncio.Lock()
+        self.waiting = 0
+        self.max_waiting = 0
+        self.in_flight = 0
+        self.throttled = 0
+        self.wait_time = 0.0
+
+    async def _take_token(self):
+        async with self._bucket_lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    float(max(self.rate_limit, 1)),
+                    self._tokens + (now - self._last_refill) * self.rate_limit,
+                )
+                self._last_refill = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate_limit)
+
+    async def __aenter__(self):
+        start = time.monotonic()
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            if self._semaphore is not None:
+                await self._semaphore.acquire()
+            try:
+                if self.rate_limit:
+                    await self._take_token()
+            except BaseException:
+                if self._semaphore is not None:
+                    self._semaphore.release()
+                raise
+        finally:
+            self.waiting -= 1
+        waited = time.monotonic() - start
+        if waited > 0.001:
+            self.throttled += 1
+        self.wait_time += waited
+        self.in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.in_flight -= 1
+        if self._semaphore is not None:
+            self._semaphore.release()
+
+    def stats(self):
+        """
+        Returns the queue-depth counters of the limiter.
+
+        Returns:
+            dict: the number of queued, running and throttled requests and the time spent waiting
+        """
+        return {
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "in_flight": self.in_flight,
+            "throttled": self.throttled,
+            "wait_time": round(self.wait_time, 3),
+        }
+
+
+class RouteBackend:
+    """
+    Interface of the engines that compute the routes requested to a ``RouteClient``.
+
+    A backend answers three kinds of queries (routes, distance/duration tables and snapping a point
+    to the road network) with the same shapes returned by the OSRM services, so the client, its
+    caches and the agents do not depend on the engine that is being used. A query that fails may
+    either raise an exception or return None.
+    """
+
+    name = None
+    bytes_received = 0
+
+    async def route(self, origin, destination):
+        """
+        Computes a route between two points.
+
+        Args:
+            origin (list): origin coordinate (latitude, longitude)
+            destination (list): target coordinate (latitude, longitude)
+
+        Returns:
+            list, float, float = the path, the distance of the path and the estimated duration,
+            or None, None, None if there is no route
+        """
+        raise NotImplementedError
+
+    async def table(self, origins, destinations):
+        """
+        Computes the distances and durations between two sets of points.
+
+        Args:
+            origins (list): list of origin coordinates (latitude, longitude)
+            destinations (list): list of target coordinates (latitude, longitude)
+
+        Returns:
+            numpy.ndarray, numpy.ndarray = the distances and durations matrices (NaN where there is
+            no route), or None, None if the request failed
+        """
+        raise NotImplementedError
+
+    async def nearest(self, point):
+        """
+        Snaps a point to the road network.
+
+        Args:
+            point (list): a coordinate (latitude, longitude)
+
+        Returns:
+            list: the closest coordinate (latitude, longitude) of the road network, or None
+        """
+        raise NotImplementedError
+
+    async def check_health(self):
+        """
+        Checks whether the backend is able to answer queries.
+
+        Returns:
+            bool: whether the backend is healthy
+        """
+        return True
+
+    def stats(self):
+        """
+        Returns the statistics specific to the backend.
+
+        Returns:
+            dict: the statistics of the backend (or None)
+        """
+        return None
+
+    async def close(self):
+        """
+        Releases the resources held by the backend.
+        """
+
+
+class OSRMBackend(RouteBackend):
+    """
+    Route backend that queries an OSRM server over HTTP.
+
+    Every request reuses the same pool of keep-alive connections instead of opening a new TCP (and
+    TLS) connection per route. The underlying ``aiohttp.ClientSession`` is created lazily inside the
+    running event loop and must be released with ``close`` when the simulation stops.
+
+    Attributes:
+        route_host (str): the URL of the OSRM server
+        max_connections_per_host (int): maximum number of simultaneous connections to the route server
+        timeout (float): total timeout (in seconds) of a route request
+        keepalive_timeout (float): time (in seconds) an idle connection is kept open in the pool
+        bytes_received (int): number of bytes received from the route server
+    """
+
+    name = "osrm"
+
+    def __init__(
+        self,
+        route_host=DEFAULT_ROUTE_HOST,
+        max_connections_per_host=DEFAULT_MAX_CONNECTIONS_PER_HOST,
+        timeout=DEFAULT_ROUTE_TIMEOUT,
+        keepalive_timeout=DEFAULT_KEEPALIVE_TIMEOUT,
+    ):
+        self.route_host = route_host
+        self.max_connections_per_host = max_connections_per_host
+        self.timeout = timeout
+        self.keepalive_timeout = keepalive_timeout
+        self.bytes_received = 0
+        self._session = None
+
+    @property
+    def session(self):
+        """
+        Returns the shared ``aiohttp.ClientSession``, creating it on first use.
+
+        Returns:
+            aiohttp.ClientSession: the pooled HTTP session
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=0,
+                limit_per_host=self.max_connections_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=300,
+            )
+            trace_config = aiohttp.TraceConfig()
+            trace_config.on_response_chunk_received.append(self._count_bytes)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                trace_configs=[trace_config],
+            )
+        return self._session
+
+    async def _count_bytes(self, session, context, params):
+        self.bytes_received += len(params.chunk)
+
+    async def route(self, origin, destination):
+        return await request_route_to_server(
+            origin, destination, self.route_host, session=self.session, raise_errors=True
+        )
+
+    async def table(self, origins, destinations):
+        return await request_table_to_server(
+            origins, destinations, self.route_host, session=self.session, raise_errors=True
+        )
+
+    async def nearest(self, point):
+        return await request_nearest_to_server(
+            point, self.route_host, session=self.session, raise_errors=True
+        )
+
+    async def close(self):
+        """
+        Closes the pooled session and its connections. The backend may be reused afterwards, in
+        which case a new session is created.
+        """
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+class LocalRouteBackend(RouteBackend):
+    """
+    Route backend that computes the routes in-process on a ``RoadNetwork`` graph, so simulations can
+    run without an OSRM server (offline, in CI or at scale). Route and table searches run in the
+    default executor to keep the event loop responsive.
+
+    Attributes:
+        network (RoadNetwork): the road graph
+    """
+
+    name = "local"
+
+    def __init__(self, network):
+        self.network = network
+
+    @classmethod
+    def from_file(cls, filename):
+        """
+        Loads the road graph of the backend. ``filename`` may be a directory with a graph saved by
+        ``RoadNetwork.save`` (whose arrays are memory-mapped) or a GeoJSON edge list.
+
+        Args:
+            filename (str): the graph directory or GeoJSON file
+
+        Returns:
+            LocalRouteBackend: the backend
+        """
+        if os.path.isdir(filename):
+            network = RoadNetwork.load(filename)
+        else:
+            network = RoadNetwork.from_geojson(filename)
+        logger.info(
+            "Loaded road network {} with {} nodes and {} edges".format(
+                filename, network.num_nodes, network.num_edges
+            )
+        )
+        return cls(network)
+
+    async def route(self, origin, destination):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.network.route, origin, destination)
+
+    async def table(self, origins, destinations):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.network.table, origins, destinations)
+
+    async def nearest(self, point):
+        return self.network.nearest(point)
+
+
+class _PoolMember:
+    def __init__(self, backend):
+        self.backend = backend
+        self.name = getattr(backend, "route_host", None) or backend.name
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.latency = LatencyHistogram()
+        self.healthy = True
+        self.retry_at = 0.0
+
+    def stats(self):
+        return {
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "latency": self.latency.summary(),
+        }
+
+
+class BalancedBackend(RouteBackend):
+    """
+    Route backend that spreads the queries over several backends (e.g. several OSRM instances).
+
+    The backend of each query is chosen in ``round_robin`` order or the one with the fewest
+    ``least_outstanding`` queries. A backend that fails with a connection error or a timeout is
+    marked as unhealthy and the query fails over to the next one; unhealthy backends receive no
+    queries until ``retry_interval`` seconds have passed, when the next query is used to probe them.
+    Errors that are an answer of the route server (such as ``NoRoute``) are not retried.
+
+    Attributes:
+        members (list): the backends of the pool with their statistics
+        strategy (str): the balancing strategy (``round_robin`` or ``least_outstanding``)
+        retry_interval (float): seconds an unhealthy backend is left out of the pool
+        failovers (int): number of queries retried on another backend
+    """
+
+    name = "balanced"
+    STRATEGIES = ("round_robin", "least_outstanding")
+
+    def __init__(
+        self, backends, strategy="round_robin", retry_interval=DEFAULT_ROUTE_RETRY_INTERVAL
+    ):
+        if strategy not in self.STRATEGIES:
+            raise ValueError("Unknown route balancing strategy: {}".format(strategy))
+        self.members = [_PoolMember(backend) for backend in backends]
+        self.strategy = strategy
+        self.retry_interval = retry_interval
+        self.failovers = 0
+        self._next = 0
+
+    def _candidates(self):
+        now = time.monotonic()
+        available = [m for m in self.members if m.healthy or now >= m.retry_at]
+        if not available:
+            available = list(self.members)
+        if self.strategy == "least_outstanding":
+            return sorted(available, key=lambda m: (m.outstanding, m.requests))
+        start = self._next % len(available)
+        self._next += 1
+        return available[start:] + available[:start]
+
+    async def _query(self, method, *args):
+        error = None
+        for attempt, member in enumerate(self._candidates()):
+            if attempt:
+                self.failovers += 1
+            member.outstanding += 1
+            member.requests += 1
+            start = time.monotonic()
+            try:
+                result = await getattr(member.backend, method)(*args)
+            except PathRequestException:
+                member.healthy = True
+                raise
+            except Exception as e:
+                member.failures += 1
+                if member.healthy:
+                    logger.warning(
+                        "Route backend {} is unhealthy ({!r}), failing over".format(member.name, e)
+                    )
+                member.healthy = False
+                member.retry_at = time.monotonic() + self.retry_interval
+                error = e
+                continue
+            finally:
+                member.outstanding -= 1
+                member.latency.observe(time.monotonic() - start)
+            if not member.healthy:
+                logger.info("Route backend {} is healthy again".format(member.name))
+            member.healthy = True
+            return result
+        raise error
+
+    async def route(self, origin, destination):
+        return await self._query("route", origin, destination)
+
+    async def table(self, origins, destinations):
+        return await self._query("table", origins, destinations)
+
+    async def nearest(self, point):
+        return await self._query("nearest", point)
+
+    async def check_health(self):
+        """
+        Probes every backend of the pool with a ``nearest`` query and marks the ones that do not
+        answer as unhealthy.
+
+        Returns:
+            bool: whether at least one backend is healthy
+        """
+        async def probe(member):
+            try:
+                await member.backend.nearest(HEALTH_CHECK_POINT)
+                member.healthy = True
+            except PathRequestException:
+                member.healthy = True
+            except Exception as e:
+                logger.warning("Route backend {} is unhealthy ({!r})".format(member.name, e))
+                member.failures += 1
+                member.healthy = False
+                member.retry_at = time.monotonic() + self.retry_interval
+
+        await asyncio.gather(*[probe(member) for member in self.members])
+        return any(member.healthy for member in self.members)
+
+    @property
+    def bytes_received(self):
+        return sum(member.backend.bytes_received for member in self.members)
+
+    def stats(self):
+        return {
+            "strategy": self.strategy,
+            "failovers": self.failovers,
+            "backends": {member.name: member.stats() for member in self.members},
+        }
+
+    async def close(self):
+        for member in self.members:
+            await member.backend.close()
+
+
+def _recording_key(*points):
+    return json.dumps([[round(float(c), 7) for c in point] for point in points])
+
+
+class RecordingBackend(RouteBackend):
+    """
+    Route backend that forwards every query to another backend and records the request, the response
+    and its latency in a SQLite file, which can be served later by a ``ReplayBackend``.
+
+    Attributes:
+        backend (RouteBackend): the backend whose responses are recorded
+        filename (str): path of the SQLite file of the recording
+        recorded (int): number of responses recorded
+    """
+
+    name = "record"
+
+    def __init__(self, backend, filename):
+        self.backend = backend
+        self.filename = filename
+        self.recorded = 0
+        self._pending_writes = 0
+        self._db = sqlite3.connect(filename)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=OFF")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS recording "
+            "(kind TEXT, key TEXT, response TEXT, latency REAL, PRIMARY KEY (kind, key))"
+        )
+        self._db.commit()
+        logger.info("Recording route responses in {}".format(filename))
+
+    def _record(self, kind, key, response, latency):
+        self._db.execute(
+            "INSERT OR REPLACE INTO recording VALUES (?, ?, ?, ?)",
+            (kind, key, json.dumps(response), latency),
+        )
+        self.recorded += 1
+        self._pending_writes += 1
+        if self._pending_writes >= ROUTE_STORE_COMMIT_EVERY:
+            self._db.commit()
+            self._pending_writes = 0
+
+    async def route(self, origin, destination):
+        start = time.monotonic()
+        route = await self.backend.route(origin, destination)
+        self._record(
+            "route", _recording_key(origin, destination), list(route), time.monotonic() - start
+        )
+        return route
+
+    async def table(self, origins, destinations):
+        start = time.monotonic()
+        distances, durations = await self.backend.table(origins, destinations)
+        response = [None, None]
+        if distances is not None:
+            response = [
+                np.where(np.isnan(distances), None, distances).tolist(),
+                np.where(np.isnan(durations), None, durations).tolist(),
+            ]
+        self._record(
+            "table",
+            json.dumps([_recording_key(*origins), _recording_key(*destinations)]),
+            response,
+            time.monotonic() - start,
+        )
+        return distances, durations
+
+    async def nearest(self, point):
+        start = time.monotonic()
+        position = await self.backend.nearest(point)
+        self._record("nearest", _recording_key(point), position, time.monotonic() - start)
+        return position
+
+    @property
+    def bytes_received(self):
+        return self.backend.bytes_received
+
+    async def close(self):
+        await self.backend.close()
+        if self._db is not None:
+            self._db.commit()
+            self._db.close()
+            self._db = None
+
+
+class ReplayBackend(RouteBackend):
+    """
+    Route backend that serves the responses recorded by a ``RecordingBackend`` without any network
+    access, so benchmark runs are reproducible. Requests that were not recorded fail with a
+    ``NotRecorded`` error.
+
+    Attributes:
+        filename (str): path of the SQLite file of the recording
+        latency (float or str): simulated latency (in seconds) of every response, or ``"recorded"``
+            to wait the latency measured when the response was recorded
+        hits (int): number of requests answered from the recording
+        misses (int): number of requests that were not recorded
+    """
+
+    name = "replay"
+
+    def __init__(self, filename, latency=0):
+        if not os.path.exists(filename):
+            raise ValueError("Route recording {} does not exist".format(filename))
+        self.filename = filename
+        self.latency = latency
+        self.hits = 0
+        self.misses = 0
+        self._db = sqlite3.connect(filename)
+        logger.info("Replaying route responses from {}".format(filename))
+
+    async def _replay(self, kind, key):
+        row = self._db.execute(
+            "SELECT response, latency FROM recording WHERE kind = ? AND key = ?", (kind, key)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            raise PathRequestException("NotRecorded")
+        self.hits += 1
+        latency = row[1] if self.latency == "recorded" else float(self.latency or 0)
+        if latency:
+            await asyncio.sleep(latency)
+        return json.loads(row[0])
+
+    async def route(self, origin, destination):
+        route = await self._replay("route", _recording_key(origin, destination))
+        return tuple(route)
+
+    async def table(self, origins, destinations):
+        response = await self._replay(
+            "table", json.dumps([_recording_key(*origins), _recording_key(*destinations)])
+        )
+        if response[0] is None:
+            return None, None
+        return np.array(response[0], dtype=float), np.array(response[1], dtype=float)
+
+    async def nearest(self, point):
+        return await self._replay("nearest", _recording_key(point))
+
+    async def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+def create_route_backend(
+    backend="osrm",
+    route_host=DEFAULT_ROUTE_HOST,
+    route_graph=None,
+    max_connections_per_host=DEFAULT_MAX_CONNECTIONS_PER_HOST,
+    timeout=DEFAULT_ROUTE_TIMEOUT,
+    record=None,
+    replay=None,
+    replay_latency=0,
+    balancing="round_robin",
+    retry_interval=DEFAULT_ROUTE_RETRY_INTERVAL,
+):
+    """
+    Creates the route backend selected in the configuration.
+
+    Args:
+        backend (str): name of the backend (``osrm`` or ``local``)
+        route_host (str or list): the URL of the OSRM server, or a list of URLs of several OSRM
+            servers that are load balanced (``osrm`` backend)
+        route_graph (str): the road graph directory or GeoJSON file (``local`` backend)
+        max_connections_per_host (int): maximum number of simultaneous connections to the route server
+        timeout (float): total timeout (in seconds) of a route request
+        record (str): file where the responses of the backend are recorded (or None)
+        replay (str): recording whose responses are served instead of using the backend (or None)
+        replay_latency (float or str): simulated latency of the replayed responses, or ``"recorded"``
+        balancing (str): balancing strategy when there are several OSRM servers
+        retry_interval (float): seconds an unhealthy OSRM server is left out of the pool
+
+    Returns:
+        RouteBackend: the route backend
+    """
+    if replay:
+        return ReplayBackend(replay, latency=replay_latency)
+    if backend == OSRMBackend.name:
+        route_hosts = [route_host] if isinstance(route_host, str) else list(route_host)
+        backends = [
+            OSRMBackend(host, max_connections_per_host=max_connections_per_host, timeout=timeout)
+            for host in route_hosts
+        ]
+        if len(backends) == 1:
+            route_backend = backends[0]
+        else:
+            route_backend = BalancedBackend(
+                backends, strategy=balancing, retry_interval=retry_interval
+            )
+    elif backend == LocalRouteBackend.name:
+        if route_graph is None:
+            raise ValueError("The local route backend requires a road graph (route_graph)")
+        route_backend = LocalRouteBackend.from_file(route_graph)
+    else:
+        raise ValueError("Unknown route backend: {}".format(backend))
+    if record:
+        return RecordingBackend(route_backend, record)
+    return route_backend
+
+
+class RouteClient:
+    """
+    A long-lived client used to query the route backend (by default an OSRM server).
+
+    A single ``RouteClient`` is owned by the simulator and shared by every agent, so all the route
+    requests go through the same backend, caches and connection pool. It must be released with
+    ``close`` when the simulation stops.
+
+    Concurrent requests for the same route (after snapping their coordinates) are coalesced: only
+    the first one reaches the backend and the rest wait for its response.
+
+    Attributes:
+        backend (RouteBackend): the engine that computes the routes
+        cache (RouteCache): cache of the routes already computed (or None)
+        matrix_cache (RouteCache): cache of the distances and durations computed by ``request_matrix`` (or None)
+        limiter (RouteLimiter): limits the concurrency and rate of the requests sent to the backend (or None)
+        position_pool (PositionPool): pool of random positions already snapped to the road network (or None)
+        metrics (RouteMetrics): latency, throughput, failures and retries of the queries sent to the backend
+        backoff_base (float): delay (in seconds) before the first retry of a failed route request
+        backoff_max (float): maximum delay (in seconds) between retries of a failed route request
+        requests (int): number of routes requested to the client
+        coalesced (int): number of requests that joined an identical request already in flight
+    """
+
+    def __init__(
+        self,
+        route_host=DEFAULT_ROUTE_HOST,
+        max_connections_per_host=DEFAULT_MAX_CONNECTIONS_PER_HOST,
+        timeout=DEFAULT_ROUTE_TIMEOUT,
+        keepalive_timeout=DEFAULT_KEEPALIVE_TIMEOUT,
+        cache=None,
+        matrix_cache=None,
+        backend=None,
+        limiter=None,
+        backoff_base=DEFAULT_ROUTE_BACKOFF_BASE,
+        backoff_max=DEFAULT_ROUTE_BACKOFF_MAX,
+        position_pool=None,
+    ):
+        if backend is None:
+            backend = OSRMBackend(
+                route_host, max_connections_per_host, timeout, keepalive_timeout
+            )
+        self.backend = backend
+        self.cache = cache
+        self.matrix_cache = matrix_cache
+        self.limiter = limiter
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.position_pool = position_pool
+        self.metrics = RouteMetrics()
+        self.requests = 0
+        self.coalesced = 0
+        self._inflight = {}
+
+    async def request_route(self, origin, destination):
+        """
+        Queries the route backend for a path. Routes found in the cache are returned without
+        contacting the backend, and a request identical to one already in flight waits for its
+        response instead of issuing a new one.
+
+        Args:
+            origin (list): origin coordinate (latitude, longitude)
+            destination (list): target coordinate (latitude, longitude)
+
+        Returns:
+            list, float, float = the path, the distance of the path and the estimated duration
+        """
+        self.requests += 1
+        if self.cache is not None:
+            route = self.cache.get(origin, destination)
+            if route is not None:
+                return copy_route(route, destination)
+
+        key = route_key(origin, destination, self.precision)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_route(origin, destination))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        route = await asyncio.shield(task)
+        if route[0] is None:
+            return route
+        return copy_route(route, destination)
+
+    async def _call(self, kind, query, *args):
+        start = time.monotonic()
+        try:
+            # waiting for the limiter throttles the real route server too, so it also takes real time
+            with real_time():
+                if self.limiter is None:
+                    result = await query(*args)
+                else:
+                    async with self.limiter:
+                        start = time.monotonic()
+                        result = await query(*args)
+        except Exception as e:
+            failure = str(e) if isinstance(e, PathRequestException) else type(e).__name__
+            self.metrics.observe(kind, time.monotonic() - start, failure or "PathRequestException")
+            logger.debug("Exception in {} query to the route backend: {!r}".format(kind, e))
+            return None
+        failed = result is None or (isinstance(result, tuple) and result[0] is None)
+        self.metrics.observe(kind, time.monotonic() - start, "NoRoute" if failed else None)
+        return result
+
+    async def _fetch_route(self, origin, destination):
+        route = await self._call("route", self.backend.route, origin, destination)
+        if route is None:
+            return None, None, None
+        if route[0] is not None and self.cache is not None:
+            self.cache.put(origin, destination, route)
+        return route
+
+    async def request_matrix(self, origins, destinations, chunk_size=DEFAULT_MATRIX_CHUNK_SIZE):
+        """
+        Computes the road distance and duration from every origin to every destination using the
+        ``table`` query of the backend (the ``table`` service of OSRM). The matrix is split in blocks of at most ``chunk_size``
+        coordinates which are requested concurrently. Cells found in the matrix cache are not
+        requested, and cells the backend could not compute fall back to the straight-line distance
+        travelled at ``MATRIX_FALLBACK_SPEED_IN_KMH``.
+
+        Args:
+            origins (list): list of origin coordinates (latitude, longitude)
+            destinations (list): list of target coordinates (latitude, longitude)
+            chunk_size (int): maximum number of coordinates sent in a single request
+
+        Returns:
+            numpy.ndarray, numpy.ndarray: the distances (meters) and durations (seconds) matrices,
+            with one row per origin and one column per destination
+        """
+        distances = np.full((len(origins), len(destinations)), np.nan)
+        durations = np.full((len(origins), len(destinations)), np.nan)
+        if self.matrix_cache is not None:
+            for i, origin in enumerate(origins):
+                for j, destination in enumerate(destinations):
+                    cell = self.matrix_cache.get(origin, destination)
+                    if cell is not None:
+                        distances[i, j], durations[i, j] = cell[1], cell[2]
+
+        block = max(chunk_size // 2, 1)
+        blocks = []
+        for i in range(0, len(origins), block):
+            for j in range(0, len(destinations), block):
+                if np.isnan(distances[i:i + block, j:j + block]).any():
+                    blocks.append((i, j))
+
+        async def request_block(i, j):
+            result = await self._call(
+                "table", self.backend.table, origins[i:i + block], destinations[j:j + block]
+            )
+            if result is None or result[0] is None:
+                return
+            block_distances, block_durations = result
+            missing = np.isnan(distances[i:i + block, j:j + block])
+            distances[i:i + block, j:j + block][missing] = block_distances[missing]
+            durations[i:i + block, j:j + block][missing] = block_durations[missing]
+            if self.matrix_cache is not None:
+                for bi, bj in zip(*np.nonzero(missing & ~np.isnan(block_distances))):
+                    self.matrix_cache.put(
+                        origins[i + bi],
+                        destinations[j + bj],
+                        (None, float(block_distances[bi, bj]), float(block_durations[bi, bj])),
+                    )
+
+        await asyncio.gather(*[request_block(i, j) for i, j in blocks])
+
+        missing = np.isnan(distances) | np.isnan(durations)
+        if missing.any():
+            logger.warning(
+                "Using straight-line distances for {} cells of the route matrix".format(
+                    int(missing.sum())
+                )
+            )
+            fallback_speed = kmh_to_ms(MATRIX_FALLBACK_SPEED_IN_KMH)
+            straight = distance_matrix(origins, destinations)
+            distances[missing] = straight[missing]
+            durations[missing] = straight[missing] / fallback_speed
+        return distances, durations
+
+    @property
+    def precision(self):
+        """
+        Returns the number of decimal places used to identify identical routes.
+
+        Returns:
+            int: the precision of the cache, or the default one when there is no cache
+        """
+        if self.cache is not None:
+            return self.cache.precision
+        return DEFAULT_ROUTE_CACHE_PRECISION
+
+    def stats(self):
+        """
+        Returns the counters of the client.
+
+        Returns:
+            dict: the number of requests, coalesced requests, the metrics of the backend and the
+            stats of the limiter and caches
+        """
+        backend = self.metrics.summary()
+        backend["name"] = self.backend.name
+        backend["bytes_received"] = self.backend.bytes_received
+        if self.backend.stats() is not None:
+            backend["pool"] = self.backend.stats()
+        return {
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight),
+            "backend": backend,
+            "limiter": self.limiter.stats() if self.limiter is not None else None,
+            "position_pool": self.position_pool.stats()
+            if self.position_pool is not None
+            else None,
+            "cache": self.cache.stats() if self.cache is not None else None,
+            "matrix_cache": self.matrix_cache.stats()
+            if self.matrix_cache is not None
+            else None,
+        }
+
+    def route_future(self, origin, destination):
+        """
+        Schedules a route request and returns a future that is resolved when the response of the
+        route server arrives. Useful to launch several requests and await them later.
+
+        Args:
+            origin (list): origin coordinate (latitude, longitude)
+            destination (list): target coordinate (latitude, longitude)
+
+        Returns:
+            asyncio.Future: a future whose result is the (path, distance, duration) tuple
+        """
+        return asyncio.ensure_future(self.request_route(origin, destination))
+
+    async def request_nearest(self, point):
+        """
+        Snaps a point to the road network of the backend.
+
+        Args:
+            point (list): a coordinate (latitude, longitude)
+
+        Returns:
+            list: the closest coordinate (latitude, longitude) of the road network, or None
+        """
+        return await self._call("nearest", self.backend.nearest, point)
+
+    async def check_health(self):
+        """
+        Checks whether the route backend is able to answer queries.
+
+        Returns:
+            bool: whether the backend is healthy
+        """
+        with real_time():
+            return await self.backend.check_health()
+
+    async def request_nearest_many(self, points):
+        """
+        Snaps a batch of points to the road network concurrently (bounded by the limiter of the
+        client).
+
+        Args:
+            points (list): list of coordinates (latitude, longitude)
+
+        Returns:
+            list: the closest coordinates of the road network (None for the points that failed)
+        """
+        return await asyncio.gather(*[self.request_nearest(point) for point in points])
+
+    async def random_positions(self, bbox, count):
+        """
+        Returns random positions of a bounding box snapped to the road network. Positions are taken
+        from the position pool first, and the rest are drawn and snapped in a single concurrent batch.
+        Points that cannot be snapped are used as they are.
+
+        Args:
+            bbox (list): the bounding box (min latitude, min longitude, max latitude, max longitude)
+            count (int): number of positions
+
+        Returns:
+            list: the positions (latitude, longitude)
+        """
+        positions = self.position_pool.take(bbox, count) if self.position_pool is not None else []
+        points = [random_point_in_bbox(bbox) for _ in range(count - len(positions))]
+        if points:
+            snapped = await self.request_nearest_many(points)
+            snapped = [
+                position if position is not None else point
+                for position, point in zip(snapped, points)
+            ]
+            if self.position_pool is not None:
+                self.position_pool.add(bbox, snapped)
+            positions += snapped
+        return positions
+
+    def retry_delay(self, attempt):
+        """
+        Returns the time to wait before retrying a failed route request.
+
+        Args:
+            attempt (int): number of failed attempts so far (starting at 0)
+
+        Returns:
+            float: the jittered exponential backoff delay in seconds
+        """
+        self.metrics.retry()
+        return backoff_delay(attempt, self.backoff_base, self.backoff_max)
+
+    async def close(self):
+        """
+        Releases the backend (closing its pooled connections) and flushes the route caches. The
+        client may be reused afterwards.
+        """
+        try:
+            await self.backend.close()
+        finally:
+            if self.position_pool is not None:
+                self.position_pool.close()
+            if self.cache is not None:
+                self.cache.close()
+            if self.matrix_cache is not None:
+                self.matrix_cache.close()
+
+
+def copy_route(route, destination):
+    """
+    Copies a cached route so that callers can modify it, making it end at the requested destination.
+
+    Args:
+        route (tuple): the cached (path, distance, duration)
+        destination (list): the requested destination (latitude, longitude)
+
+    Returns:
+        list, float, float = the path, the distance of the path and the estimated duration
+    """
+    path, distance, duration = route
+    path = [list(point) for point in path]
+    if path[-1] != destination:
+        path.append(destination)
+    return path, distance, duration
 
 
 class RequestRouteBehaviour(OneShotBehaviour):
     """
     A one-shot behaviour that is executed to request for a new route to the route agent.
+    The result is stored in the exit code of the behaviour.
+
+    ``request_path`` no longer uses this behaviour (it awaits the route client directly); it is kept
+    for strategies that want to request a route in the background and ``join`` it later.
     """
 
-    def __init__(self, msg: Message, origin: list, destination: list, route_host: str):
+    def __init__(self, msg: Message, origin: list, destination: list, route_host: str, route_client=None):
         """
         Behaviour to request a route to a route agent
         Args:
@@ -26,20 +1363,27 @@ class RequestRouteBehaviour(OneShotBehaviour):
             origin (list): origin of the route
             destination (list): destination of the route
             route_host (str): name of the route host server
+            route_client (RouteClient, optional): shared client used to query the route server
         """
         self.origin = origin
         self.destination = destination
         self._msg = msg
         self.route_host = route_host
+        self.route_client = route_client
         self.result = {"path": None, "distance": None, "duration": None}
         super().__init__()
 
     async def run(self):
         try:
             response_time = time.time()
-            path, distance, duration = await request_route_to_server(
-                self.origin, self.destination, self.route_host
-            )
+            if self.route_client is not None:
+                path, distance, duration = await self.route_client.request_route(
+                    self.origin, self.destination
+                )
+            else:
+                path, distance, duration = await request_route_to_server(
+                    self.origin, self.destination, self.route_host
+                )
             response_time = time.time() - response_time
             if path is None:
                 logger.error(
@@ -51,13 +1395,14 @@ class RequestRouteBehaviour(OneShotBehaviour):
                 self.kill()
                 return
             logger.debug("Got route in response time={}".format(response_time))
-            reply_content = {
-                "path": path,
-                "distance": distance,
-                "duration": duration,
-                "type": "success",
-            }
-            self.kill(json.loads(json.dumps(reply_content)))
+            self.kill(
+                {
+                    "path": path,
+                    "distance": distance,
+                    "duration": duration,
+                    "type": "success",
+                }
+            )
 
         except Exception as e:
             response_time = time.time() - response_time
@@ -66,11 +1411,16 @@ class RequestRouteBehaviour(OneShotBehaviour):
                     response_time, e
                 )
             )
+            self.exit_code = {"type": "error"}
+            self.kill()
 
 
 async def request_path(agent, origin, destination, route_host):
     """
-    Sends a message to the RouteAgent to request a path
+    Requests a path to the route server on behalf of an agent.
+
+    The request is awaited directly: the coroutine is resumed as soon as the response of the route
+    server arrives (or the route is found in the cache), without polling.
 
     Args:
         agent: the agent who is requesting the path
@@ -83,7 +1433,7 @@ async def request_path(agent, origin, destination, route_host):
                             the distance of the path in meters, a estimation of the duration of the path
 
     Examples:
-        >>> path, distance, duration = request_path(agent, origin=[0,0], destination=[1,1])
+        >>> path, distance, duration = await request_path(agent, origin=[0,0], destination=[1,1])
         >>> print(path)
         [[0,0], [0,1], [1,1]]
         >>> print(distance)
@@ -94,28 +1444,106 @@ async def request_path(agent, origin, destination, route_host):
     if origin[0] == destination[0] and origin[1] == destination[1]:
         return [[origin[1], origin[0]]], 0, 0
 
-    msg = Message()
-    msg.thread = str(uuid.uuid4()).replace("-", "")
-    template = Template()
-    template.thread = msg.thread
-    behav = RequestRouteBehaviour(msg, origin, destination, route_host)
-    agent.add_behaviour(behav, template)
-
-    while not behav.is_killed():
-        await asyncio.sleep(0.01)
-
-    if (
-        behav.exit_code is {}
-        or "type" in behav.exit_code
-        and behav.exit_code["type"] == "error"
-    ):
+    route_client = getattr(agent, "route_client", None)
+    response_time = time.time()
+    try:
+        if route_client is not None:
+            path, distance, duration = await route_client.request_route(
+                origin, destination
+            )
+        else:
+            path, distance, duration = await request_route_to_server(
+                origin, destination, route_host
+            )
+    except Exception as e:
+        logger.error(
+            "Exception requesting route, response time={}, error: {} ".format(
+                time.time() - response_time, e
+            )
+        )
         return None, None, None
-    else:
-        return (
-            behav.exit_code["path"],
-            behav.exit_code["distance"],
-            behav.exit_code["duration"],
+
+    response_time = time.time() - response_time
+    if path is None:
+        logger.error(
+            "There was an unknown error requesting the route. Response time={}".format(
+                response_time
+            )
         )
+        return None, None, None
+    logger.debug("Got route in response time={}".format(response_time))
+    return path, distance, duration
+
+
+async def request_matrix(origins, destinations, route_host=DEFAULT_ROUTE_HOST, route_client=None):
+    """
+    Computes the road distance and duration matrices between a list of origins and a list of
+    destinations with a single batch of requests to the route server.
+
+    Args:
+        origins (list): list of origin coordinates (latitude, longitude)
+        destinations (list): list of target coordinates (latitude, longitude)
+        route_host (str): name of the route host server
+        route_client (RouteClient, optional): shared client used to query the route server
+
+    Returns:
+        numpy.ndarray, numpy.ndarray: the distances (meters) and durations (seconds) matrices,
+        with one row per origin and one column per destination
+
+    Examples:
+        >>> distances, durations = await request_matrix([[39.47, -0.37]], [[39.48, -0.38], [39.46, -0.36]])
+        >>> print(distances.argmin())
+        1
+    """
+    if route_client is None:
+        route_client = RouteClient(route_host)
+        try:
+            return await route_client.request_matrix(origins, destinations)
+        finally:
+            await route_client.close()
+    return await route_client.request_matrix(origins, destinations)
+
+
+async def prewarm_routes(route_client, pairs, concurrency=DEFAULT_PREWARM_CONCURRENCY):
+    """
+    Requests a batch of routes that are likely to be needed so that they are in the route cache
+    before the simulation starts. At most ``concurrency`` routes are requested at the same time.
+    Duplicated pairs (after snapping the coordinates) and pairs with the same origin and destination
+    are requested once or skipped.
+
+    Args:
+        route_client (RouteClient): the shared client whose cache is filled
+        pairs (list): list of (origin, destination) coordinates (latitude, longitude)
+        concurrency (int): maximum number of simultaneous route requests
+
+    Returns:
+        dict: the number of routes requested, found and failed and the seconds spent
+    """
+    unique = {}
+    for origin, destination in pairs:
+        if origin is None or destination is None or list(origin) == list(destination):
+            continue
+        unique.setdefault(route_key(origin, destination, route_client.precision), (origin, destination))
+
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def prewarm(origin, destination):
+        async with semaphore:
+            try:
+                path, _, _ = await route_client.request_route(origin, destination)
+            except Exception as e:
+                logger.warning("Exception prewarming route {} -> {}: {}".format(origin, destination, e))
+                return False
+            return path is not None
+
+    start = time.time()
+    found = await asyncio.gather(*[prewarm(o, d) for o, d in unique.values()])
+    return {
+        "routes": len(unique),
+        "found": sum(found),
+        "failed": len(found) - sum(found),
+        "seconds": round(time.time() - start, 3),
+    }
 
 
 def unused_port(hostname):
@@ -127,42 +1555,66 @@ def unused_port(hostname):
     return port
 
 
+def segment_lengths(starts, ends):
+    """
+    Computes the lengths of many short segments at once on the WGS-84 ellipsoid, using the meridian
+    and prime vertical radii of curvature at the middle latitude of each segment. For the segments
+    of a route (up to a few kilometers) it agrees with the geodesic distance to the
+    millimeter, while a spherical formula such as haversine is off by up to 0.5%.
+
+    Args:
+        starts (numpy.ndarray): (N, 2) array with the first point (latitude, longitude) of each segment
+        ends (numpy.ndarray): (N, 2) array with the last point (latitude, longitude) of each segment
+
+    Returns:
+        numpy.ndarray: the length of each segment in meters
+    """
+    return equirectangular_in_meters(starts[:, 0], starts[:, 1], ends[:, 0], ends[:, 1])
+
+
 def chunk_path(path, speed_in_kmh):
     """
     Splits the path into smaller chunks taking into account the speed.
 
+    Every segment longer than the distance travelled in one second is replaced by the points reached
+    each second along it (the start of the segment is dropped), and shorter segments keep their start
+    point. The lengths of all the segments are computed at once with ``segment_lengths`` and the
+    points are interpolated in bulk with NumPy, so the cost no longer grows with a geodesic
+    computation per generated point.
+
     Args:
         path (list): the original path. A list of points (lon, lat)
         speed_in_kmh (float): the speed in km per hour at which the path is being traveled.
 
     Returns:
-        list: a new path equivalent (to the first one), that has at least the same number of points.
+        CompactPath: a new path equivalent (to the first one), that has at least the same number of points.
     """
     meters_per_second = kmh_to_ms(speed_in_kmh)
-    length = len(path)
-    chunked_lat_lngs = []
+    points = np.asarray(path, dtype=np.float64).reshape(-1, 2)
+    starts, ends = points[:-1], points[1:]
+    moving = (starts != ends).any(axis=1)
+    starts, ends = starts[moving], ends[moving]
 
-    for i in range(1, length):
-        _cur = path[i - 1]
-        _next = path[i]
-        if _cur == _next:
-            continue
-        distance = distance_in_meters(_cur, _next)
-        factor = meters_per_second / distance if distance else 0
-        diff_lat = factor * (_next[0] - _cur[0])
-        diff_lng = factor * (_next[1] - _cur[1])
-
-        if distance > meters_per_second:
-            while distance > meters_per_second:
-                _cur = [_cur[0] + diff_lat, _cur[1] + diff_lng]
-                distance = distance_in_meters(_cur, _next)
-                chunked_lat_lngs.append(_cur)
-        else:
-            chunked_lat_lngs.append(_cur)
+    distances = segment_lengths(starts, ends)
+    long_segments = distances > meters_per_second
+    counts = np.where(
+        long_segments, np.ceil(distances / meters_per_second) - 1, 1
+    ).astype(np.int64)
 
-    chunked_lat_lngs.append(path[length - 1])
+    segment = np.repeat(np.arange(len(starts)), counts)
+    first = np.repeat(np.cumsum(counts) - counts, counts)
+    steps = np.arange(len(segment)) - first + long_segments[segment]
+    factors = np.divide(
+        meters_per_second,
+        distances,
+        out=np.zeros_like(distances),
+        where=distances > 0,
+    )
+    chunked = starts[segment] + (steps * factors[segment])[:, None] * (
+        ends[segment] - starts[segment]
+    )
 
-    return chunked_lat_lngs
+    return CompactPath(np.vstack([chunked, [path[len(path) - 1]]]))
 
 
 def avg(array):
@@ -182,8 +1634,23 @@ def avg(array):
     )
 
 
+def check_response(result):
+    """
+    Checks the code of a response of OSRM.
+
+    Args:
+        result (dict): the decoded response
+
+    Raises:
+        PathRequestException: if the code of the response is not ``Ok``, with the code as message
+    """
+    code = result.get("code", "Ok")
+    if code != "Ok":
+        raise PathRequestException(code)
+
+
 async def request_route_to_server(
-    origin, destination, route_host="http://router.project-osrm.org/"
+    origin, destination, route_host=DEFAULT_ROUTE_HOST, session=None, raise_errors=False
 ):
     """
     Queries the OSRM for a path.
@@ -192,6 +1659,9 @@ async def request_route_to_server(
         origin (list): origin coordinate (longitude, latitude)
         destination (list): target coordinate (longitude, latitude)
         route_host (string): route to host server of OSRM service
+        session (aiohttp.ClientSession, optional): pooled session to reuse. If it is not provided
+            a one-time session is opened for this request.
+        raise_errors (bool): whether errors are raised instead of returning None
 
     Returns:
         list, float, float = the path, the distance of the path and the estimated duration
@@ -205,10 +1675,15 @@ async def request_route_to_server(
         src1, src2, dest1, dest2 = origin[1], origin[0], destination[1], destination[0]
         url = url.format(src1=src1, src2=src2, dest1=dest1, dest2=dest2)
 
-        async with aiohttp.ClientSession() as session:
+        if session is None:
+            async with aiohttp.ClientSession() as one_time_session:
+                async with one_time_session.get(url) as response:
+                    result = await response.json()
+        else:
             async with session.get(url) as response:
                 result = await response.json()
 
+        check_response(result)
         path = result["routes"][0]["geometry"]["coordinates"]
         path = [[point[1], point[0]] for point in path]
         duration = result["routes"][0]["duration"]
@@ -217,4 +1692,97 @@ async def request_route_to_server(
             path.append(destination)
         return path, distance, duration
     except Exception as e:
+        if raise_errors:
+            raise
+        logger.error("Exception requesting route: {}".format(e))
         return None, None, None
+
+
+async def request_table_to_server(
+    origins, destinations, route_host=DEFAULT_ROUTE_HOST, session=None, raise_errors=False
+):
+    """
+    Queries the ``table`` service of OSRM for the distances and durations between two sets of points.
+
+    Args:
+        origins (list): list of origin coordinates (latitude, longitude)
+        destinations (list): list of target coordinates (latitude, longitude)
+        route_host (string): route to host server of OSRM service
+        session (aiohttp.ClientSession, optional): pooled session to reuse. If it is not provided
+            a one-time session is opened for this request.
+        raise_errors (bool): whether errors are raised instead of returning None
+
+    Returns:
+        numpy.ndarray, numpy.ndarray = the distances and durations matrices (NaN where there is no
+        route), or None, None if the request failed
+    """
+    try:
+        coordinates = ";".join(
+            "{},{}".format(point[1], point[0]) for point in list(origins) + list(destinations)
+        )
+        sources = ";".join(str(i) for i in range(len(origins)))
+        targets = ";".join(
+            str(i) for i in range(len(origins), len(origins) + len(destinations))
+        )
+        url = (
+            route_host
+            + "table/v1/car/{}?sources={}&destinations={}&annotations=distance,duration".format(
+                coordinates, sources, targets
+            )
+        )
+
+        if session is None:
+            async with aiohttp.ClientSession() as one_time_session:
+                async with one_time_session.get(url) as response:
+                    result = await response.json()
+        else:
+            async with session.get(url) as response:
+                result = await response.json()
+
+        check_response(result)
+        distances = np.array(result["distances"], dtype=float)
+        durations = np.array(result["durations"], dtype=float)
+        return distances, durations
+    except Exception as e:
+        if raise_errors:
+            raise
+        logger.error("Exception requesting route matrix: {}".format(e))
+        return None, None
+
+
+async def request_nearest_to_server(
+    point, route_host=DEFAULT_ROUTE_HOST, session=None, raise_errors=False
+):
+    """
+    Queries the ``nearest`` service of OSRM to snap a point to the road network.
+
+    Args:
+        point (list): a coordinate (latitude, longitude)
+        route_host (string): route to host server of OSRM service
+        session (aiohttp.ClientSession, optional): pooled session to reuse. If it is not provided
+            a one-time session is opened for this request.
+        raise_errors (bool): whether errors are raised instead of returning None
+
+    Returns:
+        list: the closest coordinate (latitude, longitude) of the road network, or None if the
+        request failed
+    """
+    try:
+        url = route_host + "nearest/v1/car/{},{}".format(point[1], point[0])
+
+        if session is None:
+            async with aiohttp.ClientSession() as one_time_session:
+                async with one_time_session.get(url) as response:
+                    result = await response.json()
+        else:
+            async with session.get(url) as response:
+                result = await response.json()
+
+        check_response(result)
+        location = result["waypoints"][0]["location"]
+        return [location[1], location[0]]
+    except Exception as e:
+        if raise_errors:
+            raise
+        logger.error("Exception requesting nearest point: {}".format(e))
+        return None
@@ -3,6 +3,8 @@ from datetime import datetime
 from typing import Optional, List, Dict, Callable
 import time
 
+from simfleet.utils.clock import get_clock
+
 
 class Event:
     """
@@ -14,7 +16,7 @@ class Event:
         self.name = name  # Corresponds to "name" in your logs
         self.event_type = event_type  # Corresponds to "event" in your logs
         self.class_type = class_type.__name__  # New parameter to store the type of class
-        self.timestamp = datetime.fromisoformat(timestamp) if timestamp else datetime.now()
+        self.timestamp = datetime.fromisoformat(timestamp) if timestamp else get_clock().now()
         self.details = details if details else {}  # Corresponds to "details" in your logs
 
     def to_dict(self) -> Dict:
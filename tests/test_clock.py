@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the simulation clock of `simfleet`."""
+
+import json
+import time
+
+import pytest
+
+from simfleet.config.settings import SimfleetConfig
+from simfleet.utils.clock import SimulationClock, get_clock, set_clock
+from simfleet.utils.statistics import StatisticsStore
+
+
+@pytest.fixture
+def clock():
+    previous = get_clock()
+    clock = SimulationClock(time_factor=600)
+    set_clock(clock)
+    yield clock
+    set_clock(previous)
+
+
+@pytest.mark.asyncio
+async def test_clock_sleeps_in_simulated_time(clock):
+    start_sim, start_real = clock.time(), time.monotonic()
+    await clock.sleep(60)
+    assert time.monotonic() - start_real < 1
+    assert clock.time() - start_sim >= 60
+
+    clock.set_time_factor(1200)
+    assert clock.to_real(60) == 0.05
+    assert abs(clock.time() - start_sim - 60) < 10
+
+    with pytest.raises(ValueError):
+        clock.set_time_factor(0)
+
+
+def test_events_are_stamped_with_the_simulation_clock(clock):
+    store = StatisticsStore(agent_name="taxi", class_type=SimulationClock)
+    store.emit("customer_request")
+    time.sleep(0.05)
+    store.emit("customer_pickup")
+    first, second = store.all()
+    assert (second.timestamp - first.timestamp).total_seconds() >= 30
+
+
+def test_time_factor_option_overrides_the_scenario(tmp_path):
+    scenario = tmp_path / "scenario.json"
+    scenario.write_text(json.dumps({"coords": [39.47, -0.37], "time_factor": 10}))
+    assert SimfleetConfig(str(scenario)).time_factor == 10
+    assert SimfleetConfig(str(scenario), time_factor=60).time_factor == 60
+    assert SimfleetConfig().time_factor == 1
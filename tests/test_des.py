@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the discrete-event engine of `simfleet`."""
+
+import asyncio
+import json
+import time
+
+import pytest
+from spade.agent import Agent
+from spade.behaviour import CyclicBehaviour, OneShotBehaviour
+from spade.container import Container
+from spade.message import Message
+
+from simfleet.config.settings import SimfleetConfig
+from simfleet.simulator import SimulatorAgent
+from simfleet.utils.clock import SimulationClock, get_clock, set_clock
+from simfleet.utils.des import (
+    DES_ENGINE,
+    REALTIME_ENGINE,
+    DiscreteEventLoop,
+    in_process_agents,
+    real_time,
+    setup_event_loop,
+)
+from simfleet.utils.routing import RouteBackend, RouteClient, RouteLimiter
+
+
+@pytest.fixture
+def des_loop():
+    container = Container()
+    previous_loop, previous_clock = container.loop, get_clock()
+    loop = setup_event_loop()
+    set_clock(SimulationClock(timer=loop.time))
+    yield loop
+    tasks = asyncio.all_tasks(loop)
+    for task in tasks:
+        task.cancel()
+    loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+    container.loop = previous_loop
+    asyncio.set_event_loop(previous_loop)
+    set_clock(previous_clock)
+
+
+def test_loop_jumps_to_the_next_timer():
+    loop = DiscreteEventLoop()
+    order = []
+
+    async def wait(name, seconds):
+        await asyncio.sleep(seconds)
+        order.append((name, loop.time()))
+
+    async def main():
+        start = loop.time()
+        await asyncio.gather(wait("charge", 3600), wait("arrival", 60), wait("launch", 600))
+        with real_time():
+            await asyncio.sleep(0.01)
+        return loop.time() - start
+
+    wall = time.monotonic()
+    elapsed = loop.run_until_complete(main())
+    loop.close()
+    assert time.monotonic() - wall < 1
+    assert [name for name, _ in order] == ["arrival", "launch", "charge"]
+    assert 3600 < elapsed < 3601
+
+
+class PingBehaviour(OneShotBehaviour):
+    async def run(self):
+        await get_clock().sleep(1800)
+        msg = Message(to="pong@localhost", body="ping")
+        await self.send(msg)
+        reply = await self.receive(timeout=60)
+        self.agent.reply = (reply.body, str(reply.sender))
+
+
+class PongBehaviour(CyclicBehaviour):
+    async def run(self):
+        msg = await self.receive(timeout=10)
+        if msg:
+            await self.send(msg.make_reply())
+
+
+def test_agents_exchange_messages_in_process(des_loop):
+    ping, pong = Agent("ping@localhost", "secret"), Agent("pong@localhost", "secret")
+
+    async def main():
+        start = get_clock().time()
+        await pong.start()
+        await ping.start()
+        pong.add_behaviour(PongBehaviour())
+        behaviour = PingBehaviour()
+        ping.add_behaviour(behaviour)
+        while not behaviour.is_done():
+            await asyncio.sleep(1)
+        await ping.stop()
+        await pong.stop()
+        return get_clock().time() - start
+
+    connect = Agent._async_connect
+    with in_process_agents():
+        assert Agent._async_connect is not connect
+        elapsed = des_loop.run_until_complete(main())
+    assert Agent._async_connect is connect
+    assert ping.reply == ("ping", "pong@localhost")
+    assert 1800 <= elapsed < 1810
+
+
+class InstantBackend(RouteBackend):
+    name = "instant"
+
+    async def route(self, origin, destination):
+        return [origin, destination], 100.0, 10.0
+
+
+def test_rate_limited_route_requests_take_real_time(des_loop):
+    client = RouteClient(backend=InstantBackend(), limiter=RouteLimiter(max_inflight=0, rate_limit=2))
+
+    async def main():
+        start = get_clock().time()
+        for i in range(6):
+            path, _, _ = await client.request_route([39.47, -0.37], [39.47 + i / 1000, -0.37])
+            assert path is not None
+        return get_clock().time() - start
+
+    wall = time.monotonic()
+    elapsed = des_loop.run_until_complete(main())
+    wall = time.monotonic() - wall
+    # the 6 requests wait for the tokens of the bucket (2 per second) in real time
+    assert 1.5 <= wall < 5
+    assert elapsed == pytest.approx(wall, abs=0.5)
+
+
+@pytest.fixture
+def taxi_scenario(tmp_path, unused_tcp_port, monkeypatch):
+    """A taxi serving two customers, one of them launched later, on a grid of streets."""
+    # the metrics of the simulation are written to the working directory
+    monkeypatch.chdir(tmp_path)
+    lons, lats = [-0.39, -0.385, -0.38, -0.375], [39.46, 39.464, 39.468]
+    features = [[[lon, lat] for lon in lons] for lat in lats] + [[[lon, lat] for lat in lats] for lon in lons]
+    roads = tmp_path / "roads.geojson"
+    roads.write_text(json.dumps({"type": "FeatureCollection", "features": [
+        {"type": "Feature", "properties": {}, "geometry": {"type": "LineString", "coordinates": line}}
+        for line in features
+    ]}))
+    customer = "simfleet.common.lib.customers.models.taxicustomer.TaxiCustomerAgent"
+    scenario = {
+        "fleets": [{"name": "fleetmanager", "password": "secret", "fleet_type": "drone"}],
+        "transports": [{
+            "name": "taxi1", "password": "secret", "fleet_type": "drone", "speed": 2000,
+            "class": "simfleet.common.lib.transports.models.taxi.TaxiAgent",
+            "position": [39.46, -0.39], "optional": {"fleet": "fleetmanager@localhost"},
+        }],
+        "customers": [
+            {"name": "c1", "password": "secret", "fleet_type": "drone", "class": customer,
+             "position": [39.468, -0.38], "destination": [39.464, -0.385]},
+            {"name": "c2", "password": "secret", "fleet_type": "drone", "class": customer,
+             "position": [39.464, -0.375], "destination": [39.468, -0.39], "delay": 8},
+        ],
+        "simulation_name": "e2e", "host": "localhost", "http_port": unused_tcp_port,
+        "max_time": 15, "route_backend": "local", "route_graph": str(roads),
+        "coords": [39.464, -0.38], "zoom": 14,
+    }
+    filename = tmp_path / "scenario.json"
+    filename.write_text(json.dumps(scenario))
+    return str(filename)
+
+
+def run_scenario(filename, engine, time_factor=None):
+    container = Container()
+    previous_loop, previous_clock = container.loop, get_clock()
+    if engine == DES_ENGINE:
+        loop = setup_event_loop()
+    else:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        container.loop = loop
+    config = SimfleetConfig(filename, time_factor=time_factor, engine=engine)
+    simulator = SimulatorAgent(config=config, agentjid="simulator_e2e@localhost", password="secret")
+
+    async def simulate():
+        await simulator.start()
+        simulator.run()
+        while not simulator.is_simulation_finished():
+            await asyncio.sleep(0.1)
+        await simulator.stop()
+        simulator.generate_all_events()
+        return simulator.events_log.all_events()
+
+    try:
+        # without an XMPP server both engines run the agents in process
+        with in_process_agents():
+            return loop.run_until_complete(simulate())
+    finally:
+        tasks = asyncio.all_tasks(loop)
+        for task in tasks:
+            task.cancel()
+        loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        loop.close()
+        container.loop = previous_loop
+        asyncio.set_event_loop(previous_loop)
+        set_clock(previous_clock)
+
+
+def test_des_reproduces_the_events_of_a_real_time_run(taxi_scenario):
+    wall = time.monotonic()
+    des_events = run_scenario(taxi_scenario, DES_ENGINE)
+    assert time.monotonic() - wall < 10
+    realtime_events = run_scenario(taxi_scenario, REALTIME_ENGINE)
+
+    def by_agent(events):
+        result = {}
+        for event in events:
+            result.setdefault(event["name"], []).append((event["event_type"], event["timestamp"]))
+        return result
+
+    des_log, realtime_log = by_agent(des_events), by_agent(realtime_events)
+    assert sorted(des_log) == sorted(realtime_log) == ["c1@localhost", "c2@localhost", "taxi1@localhost"]
+    for name, events in des_log.items():
+        assert [event for event, _ in events] == [event for event, _ in realtime_log[name]]
+        for (_, des_time), (_, realtime_time) in zip(events, realtime_log[name]):
+            # the real-time run is delayed by the processing time, multiplied by the time factor
+            assert des_time == pytest.approx(realtime_time, abs=5)
+    taxi_events = [event for event, _ in des_log["taxi1@localhost"]]
+    assert taxi_events[0] == "initial_event" and taxi_events.count("travel_to_destination") == 2
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the distance kernel of `simfleet`."""
+
+import numpy as np
+import pytest
+
+from simfleet.utils.distance import (
+    EQUIRECTANGULAR,
+    GEODESIC,
+    HAVERSINE,
+    distance,
+    distance_matrix,
+    distances_from,
+    get_distance_method,
+    pairwise_distances,
+    set_distance_method,
+)
+from simfleet.utils.helpers import are_close, distance_in_meters
+
+VALENCIA = [39.4697, -0.3763]
+POINTS = [[39.4803, -0.3412], [39.4551, -0.3902], [39.47, -0.3763], [40.4168, -3.7038]]
+
+
+@pytest.fixture
+def distance_method():
+    method = get_distance_method()
+    yield set_distance_method
+    set_distance_method(method)
+
+
+@pytest.mark.parametrize(
+    "method, tolerance", [(HAVERSINE, 0.005), (EQUIRECTANGULAR, 1e-6), (GEODESIC, 0)]
+)
+def test_scalar_distance_agrees_with_geodesic(method, tolerance):
+    for point in POINTS[:3]:
+        exact = distance(VALENCIA, point, GEODESIC)
+        assert distance(VALENCIA, point, method) == pytest.approx(exact, rel=tolerance, abs=1e-6)
+    assert distance(VALENCIA, VALENCIA, method) == 0
+
+
+@pytest.mark.parametrize("method", [HAVERSINE, EQUIRECTANGULAR, GEODESIC])
+def test_batch_distances_match_scalar(method):
+    scalar = [distance(VALENCIA, point, method) for point in POINTS]
+    assert distances_from(VALENCIA, POINTS, method) == pytest.approx(scalar)
+
+    matrix = distance_matrix([VALENCIA, POINTS[0]], POINTS, method)
+    assert matrix.shape == (2, len(POINTS))
+    assert matrix[0] == pytest.approx(scalar)
+    assert matrix[1, 0] == 0
+
+    pairs = pairwise_distances([VALENCIA] * len(POINTS), POINTS, method)
+    assert pairs == pytest.approx(scalar)
+    assert pairwise_distances(POINTS, POINTS, method).tolist() == [0] * len(POINTS)
+
+
+def test_helpers_use_the_selected_method(distance_method):
+    madrid = POINTS[3]
+    exact = distance(VALENCIA, madrid, GEODESIC)
+    distance_method(GEODESIC)
+    assert distance_in_meters(VALENCIA, madrid) == exact
+    distance_method(HAVERSINE)
+    assert distance_in_meters(VALENCIA, madrid) != exact
+    assert distance_in_meters(VALENCIA, madrid) == pytest.approx(exact, rel=0.005)
+    assert are_close(VALENCIA, [39.46975, -0.3763])
+    assert not are_close(VALENCIA, POINTS[2])
+
+    with pytest.raises(ValueError):
+        distance_method("manhattan")
+    assert isinstance(distances_from(VALENCIA, []), np.ndarray)
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the versioned entities of the web interface of `simfleet`."""
+
+import asyncio
+import json
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from simfleet.utils.entities import EntityStream, EntityTracker
+
+
+class Entity:
+    def __init__(self, name, position, path=None):
+        self.name = name
+        self.status = 10
+        self.properties = {"current_pos": position, "path": path}
+        self.serialized = 0
+
+    def get(self, key):
+        return self.properties[key]
+
+    def to_json(self):
+        self.serialized += 1
+        return {
+            "id": self.name.split("@")[0],
+            "status": self.status,
+            "position": self.properties["current_pos"],
+            "path": self.properties["path"],
+        }
+
+
+def test_tracker_sends_only_the_changes_since_a_version():
+    path = [[39.47, -0.37], [39.48, -0.37]]
+    moving = Entity("taxi1@localhost", [39.47, -0.37], path)
+    idle = Entity("taxi2@localhost", [39.46, -0.36])
+    customer = Entity("c1@localhost", [39.45, -0.35])
+    tracker = EntityTracker()
+
+    first = tracker.update({"transports": [moving, idle], "customers": [customer]})
+    snapshot = tracker.snapshot()
+    assert [t["id"] for t in snapshot["transports"]] == ["taxi1", "taxi2"]
+    assert tracker.update({"transports": [moving, idle], "customers": [customer]}) == first
+    assert tracker.delta(first) == {"removed": {}}
+    assert idle.serialized == 1
+
+    moving.properties["current_pos"] = [39.475, -0.37]
+    second = tracker.update({"transports": [moving, idle], "customers": [customer]})
+    delta = tracker.delta(first)
+    assert delta["transports"] == [{"id": "taxi1", "status": 10, "position": [39.475, -0.37]}]
+    assert "customers" not in delta and tracker.members_version == first
+
+    customer.status = 21
+    third = tracker.update({"transports": [moving, idle], "customers": []})
+    delta = tracker.delta(first)
+    assert [t["id"] for t in delta["transports"]] == ["taxi1"]
+    assert delta["removed"] == {"customers": ["c1"]}
+    assert tracker.delta(second) == {"removed": {"customers": ["c1"]}}
+    assert tracker.members_version == third
+    assert idle.serialized == 1 and tracker.delta(third + 1) is None
+
+
+def test_tracker_asks_for_a_snapshot_after_forgetting_removals():
+    agents = [Entity("c{}@localhost".format(i), [39.47, -0.37]) for i in range(3)]
+    tracker = EntityTracker(max_removals=1)
+    first = tracker.update({"customers": agents})
+    tracker.update({"customers": agents[:2]})
+    tracker.update({"customers": agents[:1]})
+    assert tracker.delta(first) is None
+    assert tracker.snapshot() == {"customers": [agents[0].to_json()]}
+
+
+def entities_of(tracker, agents):
+    def entities(since=None):
+        tracker.update({"customers": agents})
+        result = tracker.delta(since) if since is not None else None
+        full = result is None
+        result = tracker.snapshot() if full else result
+        result.update({"full": full, "version": tracker.version, "stats": {}})
+        return result
+
+    return entities
+
+
+def test_stream_shares_frames_and_resyncs_slow_subscribers():
+    agents = [Entity("c1@localhost", [39.47, -0.37])]
+    stream = EntityStream(entities_of(EntityTracker(), agents), max_pending=2)
+    stream._task = asyncio.Future()  # frames are published by hand
+    fast, slow = stream.subscribe(), stream.subscribe()
+
+    stream.publish()
+    assert fast.get_nowait() is slow.get_nowait()
+    stream.publish()
+    assert fast.empty()
+
+    for step in range(3):
+        agents[0].properties["current_pos"] = [39.47 + (step + 1) / 1000, -0.37]
+        stream.publish()
+        frame = fast.get_nowait()
+        assert json.loads(frame[len(b"data: "):])["full"] is False
+    assert slow.empty()
+
+    stream.publish()
+    agents[0].status = 21
+    stream.publish()
+    assert json.loads(slow.get_nowait()[len(b"data: "):])["full"] is True
+    assert json.loads(fast.get_nowait()[len(b"data: "):])["customers"][0]["status"] == 21
+    stream.stop()
+    assert slow.get_nowait() is None and len(stream) == 0
+
+
+@pytest.mark.asyncio
+async def test_stream_pushes_server_sent_events(unused_tcp_port):
+    agents = [Entity("c1@localhost", [39.47, -0.37])]
+    stream = EntityStream(entities_of(EntityTracker(), agents), frame_rate=50)
+    app = web.Application()
+    app.router.add_get("/entities/stream", stream.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", unused_tcp_port).start()
+
+    url = "http://127.0.0.1:{}/entities/stream".format(unused_tcp_port)
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url) as response:
+            assert response.headers["Content-Type"] == "text/event-stream"
+            first = json.loads((await response.content.readline())[len(b"data: "):])
+            await response.content.readline()
+            agents[0].properties["current_pos"] = [39.48, -0.37]
+            second = json.loads((await response.content.readline())[len(b"data: "):])
+            assert len(stream) == 1
+            stream.stop()
+    await runner.cleanup()
+
+    assert first["full"] and first["customers"][0]["position"] == [39.47, -0.37]
+    assert not second["full"] and second["customers"][0]["position"] == [39.48, -0.37]
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the offline geocoding of `simfleet` scenarios."""
+
+import json
+
+import pytest
+
+from simfleet.config.settings import SimfleetConfig
+from simfleet.utils import geocoding
+from simfleet.utils.geocoding import GeocodeCache, geocode, resolve_location
+
+
+class FakeNominatim:
+    calls = []
+
+    def __init__(self, user_agent=None):
+        pass
+
+    def geocode(self, location, **kwargs):
+        self.calls.append(location)
+
+        class Location:
+            latitude, longitude = 40.0, -1.0
+
+        return Location()
+
+
+@pytest.fixture
+def nominatim(monkeypatch):
+    FakeNominatim.calls = []
+    monkeypatch.setattr(geocoding, "Nominatim", FakeNominatim)
+    return FakeNominatim.calls
+
+
+def test_gazetteer_answers_common_locations_offline(nominatim):
+    assert geocode("Valencia, ES") == [39.4697, -0.3763]
+    assert geocode("  valència ,  spain") == [39.4697, -0.3763]
+    assert geocode("Munich") == geocode("München, DE")
+    assert nominatim == []
+
+
+def test_geocode_cache_keeps_nominatim_answers(nominatim, tmp_path):
+    filename = str(tmp_path / "cache" / "geocode.json")
+    assert geocode("Teruel", GeocodeCache(filename)) == [40.0, -1.0]
+    assert geocode("teruel", GeocodeCache(filename)) == [40.0, -1.0]
+    assert nominatim == ["Teruel"]
+    with open(filename) as f:
+        assert json.load(f) == {"teruel": [40.0, -1.0]}
+
+
+def test_explicit_points_and_bbox_need_no_geocoding(nominatim):
+    center, bbox = resolve_location([39.47, -0.37], 12)
+    assert center == [39.47, -0.37]
+    assert bbox[0] < 39.47 < bbox[2] and bbox[1] < -0.37 < bbox[3]
+
+    center, bbox = resolve_location("Teruel", 12, bbox=[39.0, -1.0, 40.0, 0.0])
+    assert center == [39.5, -0.5]
+    assert bbox == (39.0, -1.0, 40.0, 0.0)
+    assert nominatim == []
+
+
+def test_config_resolves_the_location_lazily(nominatim, tmp_path):
+    scenario = tmp_path / "scenario.json"
+    cache = str(tmp_path / "geocode.json")
+    scenario.write_text(json.dumps({"coords": "Teruel", "zoom": 13, "geocode_cache": cache}))
+    config = SimfleetConfig(str(scenario))
+    assert nominatim == []
+
+    center, bbox = config.coords
+    assert center == [40.0, -1.0]
+    assert config["coords"] is config.coords
+    assert nominatim == ["Teruel"]
+
+    assert SimfleetConfig().coords[0] == [39.4697, -0.3763]
+    assert nominatim == ["Teruel"]
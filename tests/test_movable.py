@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the central movement scheduler of `simfleet`."""
+
+import asyncio
+import time
+
+import pytest
+from spade.agent import Agent
+from spade.container import Container
+
+from simfleet.common.mixins.movable import (
+    MovableMixin,
+    MovementScheduler,
+    get_movement_scheduler,
+    set_movement_scheduler,
+)
+from simfleet.utils.clock import SimulationClock, get_clock, set_clock
+from simfleet.utils.des import DiscreteEventLoop, in_process_agents, setup_event_loop
+from simfleet.utils.routing import chunk_path
+
+
+class Properties:
+    def __init__(self):
+        self.properties = {}
+
+    def get(self, key):
+        return self.properties.get(key)
+
+    def set(self, key, value):
+        self.properties[key] = value
+
+
+class Walker(MovableMixin, Properties):
+    def __init__(self, position, watched=False):
+        Properties.__init__(self)
+        MovableMixin.__init__(self)
+        self.set("current_pos", position)
+        self.set("speed_in_kmh", 36)
+        self.watched = watched
+        self.calls = []
+
+    def watches_movement(self):
+        return self.watched
+
+    def get_position(self):
+        return self.get("current_pos")
+
+    async def set_position(self, coords=None):
+        self.calls.append(coords)
+        self.set("current_pos", coords)
+
+    def add_behaviour(self, behaviour):
+        raise AssertionError("The scheduler must move the agent")
+
+
+@pytest.fixture
+def scheduler():
+    previous_clock, previous_scheduler = get_clock(), get_movement_scheduler()
+    loop = DiscreteEventLoop()
+    set_clock(SimulationClock(timer=loop.time))
+    scheduler = MovementScheduler()
+    set_movement_scheduler(scheduler)
+    yield loop, scheduler
+    scheduler.stop()
+    tasks = asyncio.all_tasks(loop)
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+    loop.close()
+    set_clock(previous_clock)
+    set_movement_scheduler(previous_scheduler)
+
+
+def test_scheduler_moves_agents_and_calls_back_on_arrival(scheduler):
+    loop, scheduler = scheduler
+    # 10 m/s along ~111 m and ~222 m of a meridian: one chunk per second of travel
+    near, far = [39.47, -0.37], [39.471, -0.37]
+    walker = Walker([39.469, -0.37])
+    rider = Walker([39.469, -0.37], watched=True)
+
+    async def main():
+        for agent, dest in ((walker, near), (rider, far)):
+            agent.set("path", [agent.get_position(), dest])
+            agent.chunked_path = chunk_path([agent.get_position(), dest], 10 * 3.6)
+            agent.dest = dest
+            agent.distances.append(0)
+            scheduler.add(agent, agent.chunked_path)
+        start = get_clock().time()
+        await get_clock().sleep(5.5)
+        middle = walker.get("current_pos"), list(walker.calls)
+        while len(scheduler):
+            await get_clock().sleep(1)
+        return middle, get_clock().time() - start
+
+    (middle, walker_calls), elapsed = loop.run_until_complete(main())
+    assert 39.469 < middle[0] < 39.47 and walker_calls == []
+    assert walker.calls == [near] and walker.is_in_destination()
+    assert walker.get("path") is None and walker.chunked_path is None
+    assert rider.calls[-1] == far and len(rider.calls) > 20
+    assert rider.get("current_pos") == far
+    assert 20 <= elapsed <= 25
+
+
+def test_move_to_uses_the_scheduler(scheduler):
+    loop, scheduler = scheduler
+    walker = Walker([39.469, -0.37])
+    dest = [39.47, -0.37]
+
+    async def request_path(origin, destination):
+        return [origin, destination], 111, 11
+
+    walker.request_path = request_path
+
+    async def main():
+        await walker.move_to(dest)
+        assert len(scheduler) == 1
+        while len(scheduler):
+            await get_clock().sleep(1)
+
+    loop.run_until_complete(main())
+    assert walker.calls == [dest]
+    assert walker.get("current_pos") == dest
+
+
+def test_route_retries_back_off_in_real_time(scheduler):
+    loop, scheduler = scheduler
+    walker = Walker([39.469, -0.37])
+    dest = [39.47, -0.37]
+    attempts = []
+
+    async def request_path(origin, destination):
+        attempts.append(time.monotonic())
+        if len(attempts) < 3:
+            return None, None, None
+        return [origin, destination], 111, 11
+
+    walker.request_path = request_path
+    walker.retry_delay = lambda attempt: 0.05
+    loop.run_until_complete(walker.move_to(dest))
+    assert len(attempts) == 3
+    assert attempts[2] - attempts[0] >= 0.1
+
+
+class Rover(MovableMixin, Agent):
+    def __init__(self, jid, position):
+        Agent.__init__(self, jid, "secret")
+        MovableMixin.__init__(self)
+        self.set("current_pos", position)
+        self.set("speed_in_kmh", 36)
+        self.watched = False
+        self.calls = []
+
+    def watches_movement(self):
+        return self.watched
+
+    def get_position(self):
+        return self.get("current_pos")
+
+    async def set_position(self, coords=None):
+        self.calls.append((get_clock().time(), coords))
+        self.set("current_pos", coords)
+
+    async def request_path(self, origin, destination):
+        return [origin, [39.4695, -0.3705], destination], 160, 16
+
+
+def travel(scheduler):
+    container = Container()
+    previous_loop, previous_clock, previous_scheduler = container.loop, get_clock(), get_movement_scheduler()
+    loop = setup_event_loop()
+    set_clock(SimulationClock(timer=loop.time))
+    set_movement_scheduler(scheduler)
+    rover = Rover("rover@localhost", [39.469, -0.37])
+
+    async def main():
+        await rover.start()
+        start = get_clock().time()
+        await rover.move_to([39.47, -0.37])
+        await get_clock().sleep(4.5)
+        rover.watched = True
+        rover.set_speed(18)
+        while rover.get("path") is not None:
+            await get_clock().sleep(1)
+        await rover.stop()
+        return start
+
+    try:
+        with in_process_agents():
+            start = loop.run_until_complete(main())
+    finally:
+        if scheduler is not None:
+            scheduler.stop()
+        tasks = asyncio.all_tasks(loop)
+        for task in tasks:
+            task.cancel()
+        loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        loop.close()
+        container.loop = previous_loop
+        asyncio.set_event_loop(previous_loop)
+        set_clock(previous_clock)
+        set_movement_scheduler(previous_scheduler)
+    rover.calls = [(round(when - start, 3), coords) for when, coords in rover.calls]
+    return rover
+
+
+def test_scheduler_moves_like_the_moving_behaviour():
+    behaviour, scheduled = travel(None), travel(MovementScheduler())
+
+    for rover in (behaviour, scheduled):
+        assert rover.get("current_pos") == [39.47, -0.37] and rover.is_in_destination()
+        assert rover.chunked_path is None
+    assert scheduled.distances == behaviour.distances == [160]
+    assert scheduled.durations == behaviour.durations == [16]
+    assert scheduled.animation_speed == pytest.approx(behaviour.animation_speed)
+    # the speed halved after 4.5 s and then every step was called back
+    steps = [when for when, _ in behaviour.calls]
+    assert steps[1] - steps[0] == pytest.approx(1, abs=0.01)
+    assert steps[-1] - steps[-2] == pytest.approx(2, abs=0.01)
+    assert len(scheduled.calls) > 5
+    positions = [coords for _, coords in behaviour.calls]
+    assert [coords for _, coords in scheduled.calls] == positions[-len(scheduled.calls):]
+    # the scheduler steps at the next tick of its shared clock
+    for (when, _), (expected, _) in zip(scheduled.calls, behaviour.calls[-len(scheduled.calls):]):
+        assert abs(when - expected) <= 1.01
+
+
+def test_scheduler_wakes_up_once_per_tick_for_any_number_of_agents(scheduler):
+    loop, scheduler = scheduler
+    steps = []
+    step = scheduler.step
+
+    async def counted_step():
+        steps.append(get_clock().time())
+        await step()
+
+    scheduler.step = counted_step
+
+    async def main(count):
+        walkers = []
+        for i in range(count):
+            walker = Walker([39.469, -0.37 + i / 10000], watched=i % 10 == 0)
+            walker.set("speed_in_kmh", 20 + i % 30)
+            dest = [39.472, -0.37 + i / 10000]
+            walker.chunked_path = chunk_path([walker.get_position(), [39.4705, -0.3705], dest], 36)
+            walker.dest = dest
+            scheduler.add(walker, walker.chunked_path)
+            walkers.append(walker)
+            # the agents start moving at staggered times
+            await get_clock().sleep(0.37)
+        before = len(steps)
+        await get_clock().sleep(60)
+        return walkers, len(steps) - before
+
+    for count in (10, 200):
+        walkers, wakeups = loop.run_until_complete(main(count))
+        assert wakeups <= 61
+        while len(scheduler):
+            loop.run_until_complete(get_clock().sleep(10))
+        assert all(walker.is_in_destination() for walker in walkers)
+        assert all(len(walker.calls) > 20 for walker in walkers if walker.watched)
+        assert all(len(walker.calls) == 1 for walker in walkers if not walker.watched)
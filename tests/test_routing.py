@@ -0,0 +1,560 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the routing layer of `simfleet`."""
+
+import asyncio
+import functools
+import json
+import math
+import time
+
+import numpy as np
+import pytest
+import pytest_asyncio
+from aiohttp import web
+
+from simfleet.utils.compactpath import CompactPath
+from simfleet.utils.distance import GEODESIC, distance
+from simfleet.utils import helpers
+from simfleet.utils.helpers import distance_in_meters, kmh_to_ms
+from simfleet.utils.roadnetwork import RoadNetwork
+from simfleet.utils.routemetrics import LatencyHistogram
+from simfleet.utils.routing import (
+    BalancedBackend,
+    LocalRouteBackend,
+    OSRMBackend,
+    PositionPool,
+    RecordingBackend,
+    ReplayBackend,
+    RouteBackend,
+    RouteCache,
+    RouteClient,
+    RouteLimiter,
+    backoff_delay,
+    chunk_path,
+    create_route_backend,
+    prewarm_routes,
+    request_path,
+    request_matrix,
+)
+
+
+@pytest_asyncio.fixture
+async def osrm_server(unused_tcp_port):
+    """A fake OSRM server that answers every route with a straight line."""
+    calls = []
+
+    async def route(request):
+        calls.append(request.match_info["coords"])
+        await asyncio.sleep(0.05)
+        src, dst = request.match_info["coords"].split(";")
+        src = [float(c) for c in src.split(",")]
+        dst = [float(c) for c in dst.split(",")]
+        return web.json_response(
+            {
+                "routes": [
+                    {
+                        "geometry": {"coordinates": [src, dst]},
+                        "distance": 100.0,
+                        "duration": 10.0,
+                    }
+                ]
+            }
+        )
+
+    async def table(request):
+        calls.append(request.match_info["coords"])
+        sources = request.query["sources"].split(";")
+        destinations = request.query["destinations"].split(";")
+        distances = [[1000.0 * int(s) + int(d) for d in destinations] for s in sources]
+        if len(sources) == 1 and len(destinations) == 1 and sources[0] == "0":
+            coords = request.match_info["coords"].split(";")
+            if coords[1] == "0.0,0.0":
+                distances = [[None]]
+        return web.json_response({"distances": distances, "durations": distances})
+
+    async def nearest(request):
+        calls.append(request.match_info["coords"])
+        lon, lat = [round(float(c), 2) for c in request.match_info["coords"].split(",")]
+        return web.json_response({"waypoints": [{"location": [lon, lat]}]})
+
+    app = web.Application()
+    app.router.add_get("/route/v1/car/{coords}", route)
+    app.router.add_get("/nearest/v1/car/{coords}", nearest)
+    app.router.add_get("/table/v1/car/{coords}", table)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", unused_tcp_port)
+    await site.start()
+    yield "http://127.0.0.1:{}/".format(unused_tcp_port), calls
+    await runner.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_route_client_reuses_session(osrm_server):
+    route_host, calls = osrm_server
+    client = RouteClient(route_host, max_connections_per_host=2)
+
+    path, distance, duration = await client.request_route([39.47, -0.37], [39.48, -0.38])
+    session = client.backend.session
+    await client.request_route([39.46, -0.36], [39.48, -0.38])
+
+    assert path == [[39.47, -0.37], [39.48, -0.38]]
+    assert distance == 100.0
+    assert duration == 10.0
+    assert client.backend.session is session
+    assert len(calls) == 2
+
+    await client.close()
+    assert client.backend._session is None
+
+
+def test_route_cache_lru_eviction():
+    cache = RouteCache(max_size=2)
+    cache.put([0, 0], [1, 1], ([[0, 0], [1, 1]], 1.0, 1.0))
+    cache.put([0, 0], [2, 2], ([[0, 0], [2, 2]], 2.0, 2.0))
+    assert cache.get([0, 0], [1, 1]) is not None
+    cache.put([0, 0], [3, 3], ([[0, 0], [3, 3]], 3.0, 3.0))
+
+    assert cache.get([0, 0], [2, 2]) is None
+    assert cache.stats() == {
+        "size": 2,
+        "hits": 1,
+        "disk_hits": 0,
+        "misses": 1,
+        "evictions": 1,
+    }
+
+
+def test_route_cache_snaps_coordinates():
+    cache = RouteCache(precision=4)
+    cache.put([39.47001, -0.37001], [39.48, -0.38], ([[39.47, -0.37]], 1.0, 1.0))
+    assert cache.get([39.47004, -0.36998], [39.48, -0.38]) is not None
+
+
+def test_route_cache_persistent_store(tmp_path):
+    filename = str(tmp_path / "routes.sqlite")
+    cache = RouteCache(filename=filename)
+    cache.put([0, 0], [1, 1], ([[0, 0], [1, 1]], 1.0, 2.0))
+    cache.close()
+
+    cache = RouteCache(filename=filename)
+    assert cache.get([0, 0], [1, 1]) == ([[0, 0], [1, 1]], 1.0, 2.0)
+    assert cache.disk_hits == 1
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_route_client_flushes_the_cache_when_the_backend_fails_to_close(tmp_path):
+    filename = str(tmp_path / "routes.sqlite")
+
+    class BrokenBackend(RouteBackend):
+        async def close(self):
+            raise RuntimeError("connection lost")
+
+    client = RouteClient(backend=BrokenBackend(), cache=RouteCache(filename=filename))
+    client.cache.put([0, 0], [1, 1], ([[0, 0], [1, 1]], 1.0, 2.0))
+    with pytest.raises(RuntimeError):
+        await client.close()
+
+    cache = RouteCache(filename=filename)
+    assert cache.get([0, 0], [1, 1]) == ([[0, 0], [1, 1]], 1.0, 2.0)
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_route_client_uses_cache(osrm_server):
+    route_host, calls = osrm_server
+    client = RouteClient(route_host, cache=RouteCache())
+
+    first = await client.request_route([39.47, -0.37], [39.48, -0.38])
+    first[0].append([0, 0])
+    second = await client.request_route([39.47, -0.37], [39.48, -0.38])
+
+    assert len(calls) == 1
+    assert second[0] == [[39.47, -0.37], [39.48, -0.38]]
+    assert client.cache.hits == 1
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_request_path_awaits_route_client(osrm_server):
+    route_host, calls = osrm_server
+
+    class Agent:
+        route_client = RouteClient(route_host)
+
+    path, distance, duration = await request_path(
+        Agent(), [39.47, -0.37], [39.48, -0.38], route_host
+    )
+    assert path == [[39.47, -0.37], [39.48, -0.38]]
+    assert (distance, duration) == (100.0, 10.0)
+
+    Agent.route_client.backend.route_host = "http://127.0.0.1:1/"
+    assert await request_path(Agent(), [39.47, -0.37], [39.49, -0.38], route_host) == (
+        None,
+        None,
+        None,
+    )
+    await Agent.route_client.close()
+
+
+@pytest.mark.asyncio
+async def test_route_client_coalesces_identical_requests(osrm_server):
+    route_host, calls = osrm_server
+    client = RouteClient(route_host)
+
+    routes = await asyncio.gather(
+        *[client.request_route([39.47, -0.37], [39.48, -0.38]) for _ in range(5)]
+    )
+
+    assert len(calls) == 1
+    assert client.coalesced == 4
+    assert all(route == routes[0] for route in routes)
+    assert routes[0][0] is not routes[1][0]
+    assert client.stats()["in_flight"] == 0
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_request_matrix_in_chunks_with_cache_and_fallback(osrm_server):
+    route_host, calls = osrm_server
+    client = RouteClient(route_host, matrix_cache=RouteCache(table="matrix"))
+    origins = [[39.47, -0.37], [39.46, -0.36]]
+    destinations = [[39.48, -0.38], [0.0, 0.0]]
+
+    distances, durations = await client.request_matrix(origins, destinations, chunk_size=2)
+
+    assert len(calls) == 4
+    assert distances.shape == (2, 2)
+    assert distances[:, 0].tolist() == [1.0, 1.0]
+    assert (distances[:, 1] > 4000000).all()
+    assert (durations[:, 1] > 0).all()
+
+    await client.request_matrix(origins, destinations[:1], chunk_size=2)
+    assert len(calls) == 4
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_request_matrix_without_client(osrm_server):
+    route_host, calls = osrm_server
+    distances, durations = await request_matrix(
+        [[39.47, -0.37]], [[39.48, -0.38], [39.46, -0.36]], route_host
+    )
+    assert distances.tolist() == [[1.0, 2.0]]
+    assert len(calls) == 1
+
+
+@pytest.fixture
+def road_geojson(tmp_path):
+    """A square block of four streets where the street from A to D is one-way."""
+    a, b, c, d = [-0.37, 39.47], [-0.36, 39.47], [-0.36, 39.48], [-0.37, 39.48]
+    features = [
+        {"type": "Feature", "properties": {}, "geometry": {"type": "LineString", "coordinates": [a, b, c]}},
+        {"type": "Feature", "properties": {"maxspeed": "50"}, "geometry": {"type": "LineString", "coordinates": [c, d]}},
+        {"type": "Feature", "properties": {"oneway": "yes"}, "geometry": {"type": "LineString", "coordinates": [a, d]}},
+    ]
+    filename = tmp_path / "roads.geojson"
+    filename.write_text(json.dumps({"type": "FeatureCollection", "features": features}))
+    return str(filename)
+
+
+def test_road_network_routes_and_memory_maps(road_geojson, tmp_path):
+    network = RoadNetwork.from_geojson(road_geojson)
+    assert (network.num_nodes, network.num_edges) == (4, 7)
+
+    network.save(str(tmp_path / "graph"))
+    network = RoadNetwork.load(str(tmp_path / "graph"))
+    assert isinstance(network.indices, np.memmap)
+
+    path, distance, duration = network.route([39.47, -0.37], [39.48, -0.37])
+    assert path == [[39.47, -0.37], [39.48, -0.37]]
+    assert distance == pytest.approx(1112, rel=0.01)
+
+    path, distance, duration = network.route([39.48, -0.37], [39.47, -0.37])
+    assert path == [[39.48, -0.37], [39.48, -0.36], [39.47, -0.36], [39.47, -0.37]]
+    assert network.nearest([39.4801, -0.3601]) == [39.48, -0.36]
+
+
+def test_road_network_grid_finds_the_nearest_node():
+    rng = np.random.default_rng(7)
+    coords = np.column_stack((39.4 + rng.random(2000) * 0.2, -0.5 + rng.random(2000) * 0.3))
+    coords[:500, 0] = 39.45  # many nodes along a single street
+    network = RoadNetwork.from_edges(coords, [0], [1], [30])
+    for point in np.column_stack((39.3 + rng.random(300) * 0.4, -0.6 + rng.random(300) * 0.5)):
+        lat, lon = point
+        dlat = coords[:, 0] - lat
+        dlon = (coords[:, 1] - lon) * math.cos(math.radians(lat))
+        expected = dlat * dlat + dlon * dlon
+        found = network.nearest_node(point.tolist())
+        assert expected[found] == expected.min()
+
+
+def test_road_network_grid_snaps_points_far_outside_the_graph():
+    rng = np.random.default_rng(11)
+    coords = np.column_stack((39.4 + rng.random(40000) * 0.2, -0.5 + rng.random(40000) * 0.3))
+    network = RoadNetwork.from_edges(coords, [0], [1], [30])
+    for lat, lon in ([40.4168, -3.7038], [10.0, -0.37], [-60.0, 120.0], [80.0, -0.4]):
+        start = time.monotonic()
+        found = network.nearest_node([lat, lon])
+        assert time.monotonic() - start < 1
+        dlat = coords[:, 0] - lat
+        dlon = (coords[:, 1] - lon) * math.cos(math.radians(lat))
+        expected = dlat * dlat + dlon * dlon
+        assert expected[found] == expected.min()
+
+
+@pytest.mark.asyncio
+async def test_route_client_with_local_backend(road_geojson):
+    client = RouteClient(
+        backend=LocalRouteBackend.from_file(road_geojson),
+        cache=RouteCache(),
+        matrix_cache=RouteCache(table="matrix"),
+    )
+
+    path, distance, duration = await client.request_route([39.4701, -0.3699], [39.48, -0.37])
+    assert path == [[39.4701, -0.3699], [39.47, -0.37], [39.48, -0.37]]
+    assert distance == pytest.approx(1112 + distance_in_meters([39.4701, -0.3699], [39.47, -0.37]), rel=0.01)
+
+    distances, durations = await client.request_matrix(
+        [[39.4701, -0.3699], [39.48, -0.37]], [[39.48, -0.37]]
+    )
+    assert distances[1, 0] == 0
+    assert distances[0, 0] == pytest.approx(distance)
+    assert durations[0, 0] == pytest.approx(duration)
+    assert await client.request_nearest([39.4701, -0.3599]) == [39.47, -0.36]
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_route_limiter_caps_concurrent_requests(osrm_server):
+    route_host, calls = osrm_server
+    limiter = RouteLimiter(max_inflight=2)
+    client = RouteClient(route_host, limiter=limiter)
+
+    await asyncio.gather(
+        *[client.request_route([39.47, -0.37], [39.48, -0.38 - i / 100]) for i in range(6)]
+    )
+
+    assert len(calls) == 6
+    assert limiter.max_waiting >= 4
+    assert limiter.throttled >= 4
+    assert limiter.stats()["in_flight"] == 0
+    assert client.stats()["limiter"]["waiting"] == 0
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_route_limiter_rate_limit():
+    limiter = RouteLimiter(max_inflight=0, rate_limit=20)
+    start = asyncio.get_running_loop().time()
+    for _ in range(25):
+        async with limiter:
+            pass
+    assert asyncio.get_running_loop().time() - start >= 0.2
+
+
+def test_backoff_delay_is_jittered_and_capped():
+    delays = [backoff_delay(attempt, base=0.5, maximum=4) for attempt in range(10)]
+    assert all(0 <= delay <= 4 for delay in delays)
+    assert all(backoff_delay(0, base=0.5) <= 0.5 for _ in range(20))
+
+
+def test_chunk_path_matches_geodesic_steps():
+    origin, destination = [39.47, -0.37], [39.48, -0.36]
+    meters_per_second = kmh_to_ms(50)
+    geodesic = functools.partial(distance, method=GEODESIC)
+    chunks = chunk_path([origin, origin, destination], 50).tolist()
+
+    steps = math.ceil(geodesic(origin, destination) / meters_per_second) - 1
+    assert len(chunks) == steps + 1
+    assert chunks[-1] == destination
+    assert geodesic(origin, chunks[0]) == pytest.approx(meters_per_second, abs=1e-3)
+    assert geodesic(chunks[-2], destination) <= meters_per_second
+
+    short = [39.47, -0.37], [39.47001, -0.37]
+    assert chunk_path(list(short), 50) == [list(short[0]), list(short[1])]
+
+
+@pytest.mark.parametrize("dtype", ["float64", "float32"])
+def test_compact_path_is_consumed_in_order(dtype):
+    points = [[39.47, -0.37], [39.4712345, -0.3698765], [39.48, -0.36]]
+    path = CompactPath(points, dtype=dtype)
+
+    assert len(path) == 3 and path
+    assert path[-1] == [39.48, -0.36]
+    assert path.pop(0) == [39.47, -0.37]
+    assert len(path) == 2
+    assert distance_in_meters(path.peek(), points[1]) < 0.001
+    path.pop(0)
+    assert path.pop(0) == [39.48, -0.36]
+    assert not path
+    assert path.tolist() == []
+    with pytest.raises(IndexError):
+        path.pop(0)
+
+
+@pytest.mark.asyncio
+async def test_prewarm_routes_fills_cache(osrm_server):
+    route_host, calls = osrm_server
+    client = RouteClient(route_host, cache=RouteCache())
+    origin, destination = [39.47, -0.37], [39.48, -0.38]
+    pairs = [
+        (origin, destination),
+        (origin, destination),
+        (origin, origin),
+        ([39.46, -0.36], destination),
+        (None, destination),
+    ]
+
+    stats = await prewarm_routes(client, pairs, concurrency=1)
+
+    assert stats["routes"] == 2 and stats["found"] == 2 and stats["failed"] == 0
+    assert len(client.cache) == 2
+    await client.request_route(origin, destination)
+    assert len(calls) == 2
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_random_positions_are_snapped_in_batch_and_pooled(osrm_server, tmp_path):
+    route_host, calls = osrm_server
+    bbox = [39.45, -0.40, 39.50, -0.35]
+    filename = str(tmp_path / "routes.sqlite")
+    client = RouteClient(route_host, position_pool=PositionPool(filename=filename))
+
+    positions = await client.random_positions(bbox, 20)
+
+    assert len(positions) == 20 and len(calls) == 20
+    assert all(position == [round(c, 2) for c in position] for position in positions)
+    await client.close()
+
+    client = RouteClient(route_host, position_pool=PositionPool(filename=filename))
+    again = await client.random_positions(bbox, 25)
+    assert len(again) == 25 and len(calls) == 25
+    assert client.position_pool.stats() == {"hits": 20, "snapped": 5}
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_record_and_replay_route_backend(osrm_server, tmp_path):
+    route_host, calls = osrm_server
+    filename = str(tmp_path / "recording.sqlite")
+    origin, destination = [39.47, -0.37], [39.48, -0.38]
+
+    client = RouteClient(backend=RecordingBackend(OSRMBackend(route_host), filename))
+    recorded = await client.request_route(origin, destination)
+    recorded_matrix = await client.request_matrix([origin], [destination])
+    recorded_nearest = await client.request_nearest([39.4712, -0.3712])
+    await client.close()
+
+    backend = ReplayBackend(filename, latency=0.01)
+    client = RouteClient(backend=backend)
+    assert await client.request_route(origin, destination) == recorded
+    distances, _ = await client.request_matrix([origin], [destination])
+    assert distances.tolist() == recorded_matrix[0].tolist()
+    assert await client.request_nearest([39.4712, -0.3712]) == recorded_nearest
+    assert await client.request_route(destination, origin) == (None, None, None)
+    assert (backend.hits, backend.misses) == (3, 1)
+    assert len(calls) == 3
+    await client.close()
+
+
+def test_latency_histogram_percentiles():
+    histogram = LatencyHistogram()
+    for latency in [0.01] * 90 + [0.1] * 9 + [1.0]:
+        histogram.observe(latency)
+
+    summary = histogram.summary()
+    assert summary["count"] == 100
+    assert 0.01 <= summary["p50"] < 0.0125
+    assert 0.1 <= summary["p95"] < 0.125
+    assert 0.1 <= summary["p99"] < 0.125
+    assert summary["max"] == 1.0
+
+
+@pytest.mark.asyncio
+async def test_route_client_metrics(osrm_server):
+    route_host, calls = osrm_server
+    client = RouteClient(route_host, cache=RouteCache())
+
+    await client.request_route([39.47, -0.37], [39.48, -0.38])
+    await client.request_route([39.47, -0.37], [39.48, -0.38])
+    client.backend.route_host = "http://127.0.0.1:1/"
+    await client.request_route([39.47, -0.37], [39.49, -0.38])
+    client.retry_delay(0)
+
+    stats = client.stats()["backend"]
+    assert stats["name"] == "osrm"
+    assert stats["requests"] == {"route": 2}
+    assert stats["failures"] == {"ClientConnectorError": 1}
+    assert stats["retries"] == 1
+    assert stats["latency"]["count"] == 2
+    assert stats["latency"]["p99"] >= 0.05
+    assert stats["bytes_received"] > 0
+    assert client.stats()["cache"]["hits"] == 1
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_balanced_backend_fails_over_to_healthy_server(osrm_server):
+    route_host, calls = osrm_server
+    dead_host = "http://127.0.0.1:1/"
+    backend = create_route_backend(route_host=[dead_host, route_host], retry_interval=60)
+    assert isinstance(backend, BalancedBackend)
+    client = RouteClient(backend=backend)
+
+    assert await client.check_health()
+    for i in range(4):
+        path, _, _ = await client.request_route([39.47, -0.37], [39.48 + i / 100, -0.38])
+        assert path is not None
+
+    stats = client.stats()["backend"]["pool"]
+    assert stats["backends"][dead_host]["healthy"] is False
+    assert stats["backends"][dead_host]["requests"] == 0
+    assert stats["backends"][dead_host]["failures"] == 1
+    assert stats["backends"][route_host]["requests"] == 4
+    assert stats["backends"][route_host]["latency"]["count"] == 4
+    assert stats["failovers"] == 0
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_balanced_backend_strategies(osrm_server):
+    route_host, calls = osrm_server
+    round_robin = BalancedBackend([OSRMBackend(route_host), OSRMBackend(route_host)])
+    await asyncio.gather(*[round_robin.nearest([39.47, -0.37]) for _ in range(4)])
+    assert [m.requests for m in round_robin.members] == [2, 2]
+
+    least_outstanding = BalancedBackend(
+        [OSRMBackend(route_host), OSRMBackend(route_host)], strategy="least_outstanding"
+    )
+    least_outstanding.members[0].outstanding = 10
+    await least_outstanding.nearest([39.47, -0.37])
+    assert [m.requests for m in least_outstanding.members] == [0, 1]
+
+    dead = BalancedBackend([OSRMBackend("http://127.0.0.1:1/"), OSRMBackend(route_host)])
+    dead.members[1].backend = OSRMBackend("http://127.0.0.1:1/")
+    with pytest.raises(Exception):
+        await dead.nearest([39.47, -0.37])
+    assert dead.failovers == 1
+
+    for backend in (round_robin, least_outstanding, dead):
+        await backend.close()
+
+
+def test_random_positions_sample_the_cached_stations():
+    stations = helpers.load_station_positions()
+    assert helpers.load_station_positions() is stations
+    assert stations.shape[1] == 2
+
+    position = helpers.random_position()
+    assert isinstance(position[0], float)
+    assert position in stations.tolist()
+
+    positions = helpers.random_positions(1000, seed=7)
+    assert positions.shape == (1000, 2)
+    assert np.array_equal(positions, helpers.random_positions(1000, seed=7))
+    assert np.isin(positions[:, 0], stations[:, 0]).all()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the spatial index of `simfleet` and the queries answered by the directory."""
+
+import asyncio
+import json
+import random
+import time
+
+import pytest
+from spade.message import Message
+
+from simfleet.common.agents.directory import (
+    DirectoryAgent,
+    DirectoryStrategyBehaviour,
+    RegistrationBehaviour,
+)
+from simfleet.common.spatialindex import SpatialIndex
+from simfleet.communications.protocol import (
+    CANCEL_PERFORMATIVE,
+    INFORM_PERFORMATIVE,
+    NOT_MODIFIED_PERFORMATIVE,
+    REQUEST_PERFORMATIVE,
+)
+from simfleet.utils.distance import distance
+
+
+@pytest.fixture
+def agents():
+    rng = random.Random(1)
+    return {
+        "stop{}@localhost".format(i): {
+            "jid": "stop{}@localhost".format(i),
+            "position": [39.42 + rng.random() * 0.1, -0.42 + rng.random() * 0.1],
+        }
+        for i in range(500)
+    }
+
+
+def brute_force(agents, position):
+    return sorted(
+        ((key, distance(agent["position"], position)) for key, agent in agents.items()),
+        key=lambda item: item[1],
+    )
+
+
+def test_nearest_and_within_match_brute_force(agents):
+    index = SpatialIndex(cell_size=300)
+    index.sync(agents)
+    rng = random.Random(2)
+    for _ in range(50):
+        position = [39.40 + rng.random() * 0.14, -0.44 + rng.random() * 0.14]
+        expected = brute_force(agents, position)
+        assert [key for key, _ in index.nearest(position, k=5)] == [k for k, _ in expected[:5]]
+        assert [key for key, _ in index.within(position, 800)] == [
+            key for key, d in expected if d <= 800
+        ]
+
+
+def test_queries_far_from_the_agents_skip_the_empty_rings(agents):
+    index = SpatialIndex(cell_size=300)
+    index.sync(agents)
+    for position in ([40.4168, -3.7038], [42.0, 2.0], [10.0, -0.37]):
+        start = time.monotonic()
+        expected = brute_force(agents, position)
+        assert [key for key, _ in index.nearest(position, k=3)] == [k for k, _ in expected[:3]]
+        assert index.within(position, 1000) == []
+        assert time.monotonic() - start < 0.1
+
+
+def test_index_is_updated_incrementally(agents):
+    index = SpatialIndex()
+    index.sync(agents)
+    assert len(index) == 500
+
+    moved = dict(agents)
+    del moved["stop0@localhost"]
+    moved["stop1@localhost"] = {"jid": "stop1@localhost", "position": [40.0, 0.0]}
+    moved["new@localhost"] = {"jid": "new@localhost", "position": [39.5, -0.3]}
+    index.sync(moved)
+
+    assert len(index) == 500
+    assert "stop0@localhost" not in index
+    assert index.position("stop1@localhost") == [40.0, 0.0]
+    assert index.nearest([40.0, 0.001])[0][0] == "stop1@localhost"
+    assert len(index.nearest([39.5, -0.3], k=1000)) == 500
+    assert SpatialIndex().nearest([39.5, -0.3]) == []
+
+
+def test_directory_answers_spatial_queries(agents):
+    directory = DirectoryAgent("directory@localhost", "secret")
+    registration = RegistrationBehaviour()
+    registration.agent = directory
+    for agent in agents.values():
+        registration.add_service(dict(agent, type="stops"))
+    registration.add_service({"jid": "fleet@localhost", "type": "taxi"})
+    registration.remove_service("stops", "stop0@localhost")
+
+    position = agents["stop1@localhost"]["position"]
+    expected = [key for key, _ in brute_force(agents, position) if key != "stop0@localhost"]
+    assert list(directory.query_services("stops", position, k=3)) == expected[:3]
+    within = directory.query_services("stops", position, radius=1000)
+    assert list(within) == [
+        key for key in expected if distance(agents[key]["position"], position) <= 1000
+    ]
+    assert within["stop1@localhost"]["position"] == position
+    assert list(directory.query_services("taxi", position)) == ["fleet@localhost"]
+
+    query = '{"type": "stops", "near": [39.47, -0.37], "k": 2}'
+    assert DirectoryStrategyBehaviour.parse_request(query) == (
+        "stops",
+        {"near": [39.47, -0.37], "k": 2},
+    )
+    assert DirectoryStrategyBehaviour.parse_request("stops") == ("stops", None)
+
+
+@pytest.mark.asyncio
+async def test_directory_answers_not_modified_until_services_change(agents):
+    directory = DirectoryAgent("directory@localhost", "secret")
+    registration = RegistrationBehaviour()
+    registration.agent = directory
+    registration.add_service(dict(agents["stop1@localhost"], type="stops"))
+
+    strategy = DirectoryStrategyBehaviour()
+    strategy.agent = directory
+    strategy.queue = asyncio.Queue()
+    sent = []
+
+    async def send(msg):
+        sent.append(msg)
+
+    strategy.send = send
+
+    async def request(version=None):
+        msg = Message(sender="customer@localhost", body="stops")
+        msg.set_metadata("performative", REQUEST_PERFORMATIVE)
+        if version is not None:
+            msg.set_metadata("if_modified_since", version)
+
+        async def receive(timeout=None):
+            return msg
+
+        strategy.receive = receive
+        await strategy.run()
+        return sent[-1]
+
+    first = await request()
+    assert first.get_metadata("performative") == INFORM_PERFORMATIVE
+    assert list(json.loads(first.body)) == ["stop1@localhost"]
+    assert directory.service_payload("stops") is directory.service_payload("stops")
+
+    reply = await request(first.get_metadata("version"))
+    assert reply.get_metadata("performative") == NOT_MODIFIED_PERFORMATIVE
+
+    registration.add_service(dict(agents["stop2@localhost"], type="stops"))
+    reply = await request(first.get_metadata("version"))
+    assert reply.get_metadata("performative") == INFORM_PERFORMATIVE
+    assert reply.get_metadata("version") != first.get_metadata("version")
+    assert len(json.loads(reply.body)) == 2
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        '{"type": "stops", "near": [39.47, -0.37], "k": 2',
+        '{"near": [39.47, -0.37], "k": 2}',
+        '{"type": "stops", "k": 2}',
+        '{"type": "stops", "near": [39.47, -0.37], "k": 0}',
+        '{"type": "stops", "near": [39.47, -0.37], "k": "3"}',
+        '{"type": "stops", "near": [39.47, -0.37], "radius": -100}',
+        '{"type": "stops", "near": [39.47, -0.37], "radius": NaN}',
+    ],
+)
+@pytest.mark.asyncio
+async def test_directory_refuses_invalid_queries(agents, body):
+    directory = DirectoryAgent("directory@localhost", "secret")
+    registration = RegistrationBehaviour()
+    registration.agent = directory
+    registration.add_service(dict(agents["stop1@localhost"], type="stops"))
+
+    strategy = DirectoryStrategyBehaviour()
+    strategy.agent = directory
+    sent = []
+
+    async def send(msg):
+        sent.append(msg)
+
+    async def receive(timeout=None):
+        msg = Message(sender="customer@localhost", body=body)
+        msg.set_metadata("performative", REQUEST_PERFORMATIVE)
+        return msg
+
+    strategy.send, strategy.receive = send, receive
+    strategy.queue = asyncio.Queue()
+    with pytest.raises(ValueError):
+        DirectoryStrategyBehaviour.parse_request(body)
+    await strategy.run()
+    assert [msg.get_metadata("performative") for msg in sent] == [CANCEL_PERFORMATIVE]